@@ -0,0 +1,176 @@
+# Two-step floating catchment area (2SFCA) accessibility scores for the Access app
+#
+# The Access app only shows raw minutes and miles per tract/facility pair. This step
+# turns the drive times in facility_load_comprehensive.csv and tract populations into
+# spatial accessibility scores per tract and FacType, written as new tract measures:
+#
+#   step 1  each facility's supply over the population that can reach it,
+#             R_j = S_j / sum_i P_i W(d_ij)
+#   step 2  each tract's sum of the ratios of the facilities it can reach,
+#             A_i = sum_j R_j W(d_ij)
+#
+# W is the distance decay of a model in MODELS: a list of (up to minutes, weight) bands.
+# One band with weight 1 is the classic 2SFCA; several falling weights are the enhanced
+# 2SFCA (E2SFCA, Luo & Qi 2009). Pairs past the last band don't count. Facilities have
+# no capacity data, so each is one unit of supply (S_j = 1) and scores are facilities
+# per 100,000 residents.
+#
+# The tract/facility pairs of a FacType are a sparse matrix in coordinate form (tract
+# code, facility code, minutes), so both steps are sparse matrix-vector products, done
+# with np.bincount over the pairs: no per tract or per facility loops, and no scipy.
+# Every FacType x model is a couple of passes over its pairs.
+#
+# Populations are the Sociodemographics 'Total' measure, read from the all_tract.csv
+# the shapefile setup writes or from a CIFTools <ca>_sociodemographics_tract_long_*.csv.
+# Scores are upserted into all_tract.csv and the measure dictionary like any other table.
+#
+# Run it from the repo root with:
+#   python setup/SHAPE/accessibility.py [--drive-times CSV] [--population CSV] [--models JSON] [--dry-run]
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from specs import TARGETS, OUTPUT_COLUMNS
+from formats import format_values
+from drive_times import read_sources
+from facility_load import COMPREHENSIVE
+
+# Distance decay models: name -> (up to minutes, weight) bands, nearest band first
+MODELS = {
+    '2sfca30': [(30, 1.0)],
+    '2sfca60': [(60, 1.0)],
+    'e2sfca30': [(10, 1.0), (20, 0.68), (30, 0.22)],
+    'e2sfca60': [(20, 1.0), (40, 0.68), (60, 0.22)],
+}
+
+CAT = 'Accessibility'
+SOURCE = 'Drive times to facilities, ACS 5-Year total population'
+POPULATION_MEASURE = 'Total'
+
+# Scores are facilities per this many residents
+PER_RESIDENTS = 100000
+
+NAME_COLUMNS = ['Tract', 'County', 'State']
+
+
+def read_population(path=TARGETS['tract']):
+    # Total population per tract (GEOID as 11 digit text) with whatever name columns the file has
+    frame = pd.read_csv(path, dtype={'GEOID': str, 'FIPS': str}, keep_default_na=False, na_values=['', 'NA'])
+    frame = frame.rename(columns={'FIPS': 'GEOID'})
+    if 'cat' in frame.columns:
+        frame = frame[frame['cat'] == 'Sociodemographics']
+    # CIFTools files spell measures with underscores
+    frame = frame[frame['measure'].str.replace('_', ' ') == POPULATION_MEASURE]
+    if frame.empty:
+        raise Exception(f"No '{POPULATION_MEASURE}' population rows in {path}")
+    frame = frame.assign(GEOID=frame['GEOID'].str.zfill(11), value=pd.to_numeric(frame['value'], errors='coerce'))
+    return frame.drop_duplicates('GEOID', keep='last').set_index('GEOID')
+
+
+def weights(minutes, bands):
+    # Weight of each pair under a model's bands, 0 past the last band
+    limits = np.array([limit for limit, _ in bands], dtype='float64')
+    values = np.append([weight for _, weight in bands], 0.0)
+    return values[np.searchsorted(limits, minutes, side='left')]
+
+
+def two_step(tracts, facilities, minutes, population, bands, tract_count, facility_count):
+    # A_i for every tract code from the pairs (tract, facility, minutes) and the tract populations
+    weight = weights(minutes, bands)
+    # Step 1: population weighted demand on each facility, R_j = 1 / demand
+    demand = np.bincount(facilities, weights=population[tracts] * weight, minlength=facility_count)
+    ratio = np.divide(1.0, demand, out=np.zeros(facility_count), where=demand > 0)
+    # Step 2: each tract's weighted sum of the ratios it reaches
+    return np.bincount(tracts, weights=ratio[facilities] * weight, minlength=tract_count)
+
+
+def scores(pairs, population, models=MODELS):
+    # Wide frame of scores, one row per tract and one column per FacType x model
+    codes, uniques = pd.factorize(pairs['GEOID'])
+    geoids = pd.Index(uniques).union(population.index).sort_values()
+    tract_codes = geoids.get_indexer(uniques)[codes]
+    facility_codes, facility_ids = pd.factorize(pairs['FacID'])
+    people = population['value'].reindex(geoids).fillna(0).to_numpy(dtype='float64')
+
+    columns = {}
+    for fac_type, rows in pairs.groupby('FacType', sort=True).indices.items():
+        tracts, facilities = tract_codes[rows], facility_codes[rows]
+        minutes = pairs['minutes'].to_numpy()[rows]
+        for model, bands in models.items():
+            columns[(fac_type, model)] = two_step(tracts, facilities, minutes, people, bands, len(geoids),
+                                                  len(facility_ids)) * PER_RESIDENTS
+    return pd.DataFrame(columns, index=geoids)
+
+
+def measure_name(fac_type, model):
+    # lungCancerScreening2sfca30 style measure names
+    words = fac_type.split()
+    return words[0].lower() + ''.join(word.capitalize() for word in words[1:]) + model.capitalize()
+
+
+def definition(fac_type, model, bands):
+    method = 'E2SFCA, weighted by drive time' if len(bands) > 1 else '2SFCA'
+    return (f'{fac_type} facilities per {PER_RESIDENTS:,} residents within {bands[-1][0]:g} minutes '
+            f'drive ({method})')
+
+
+def long_rows(wide, population, models=MODELS):
+    # The scores as long all_tract.csv rows
+    long = pd.concat([pd.DataFrame({'GEOID': wide.index, 'measure': measure_name(fac_type, model),
+                                    'def': definition(fac_type, model, models[model]), 'value': values.to_numpy()})
+                      for (fac_type, model), values in wide.items()], ignore_index=True)
+    names = population.reindex(columns=NAME_COLUMNS).reindex(long['GEOID'])
+    for column in NAME_COLUMNS:
+        long[column] = names[column].to_numpy()
+    long['cat'] = CAT
+    long['RE'] = pd.NA
+    long['Sex'] = pd.NA
+    # fmt is one of the codes the apps scale their legends by; the label keeps a decimal, as FCC's do
+    long['fmt'] = 'int'
+    long['source'] = SOURCE
+    long['lbl'] = format_values(long['value'], 'dec')
+    return long[OUTPUT_COLUMNS['tract']]
+
+
+def run(drive_times=COMPREHENSIVE, population=TARGETS['tract'], models=MODELS, write=True):
+    # Scores for every FacType and model, upserted into all_tract.csv and the measure dictionary
+    from pipeline import write as write_long
+    from writers import finish
+
+    start = time.perf_counter()
+    pairs = read_sources([drive_times])
+    pairs['GEOID'] = pairs['GEOID'].map('{:011d}'.format)
+    people = read_population(population)
+    wide = scores(pairs, people, models)
+    long = long_rows(wide, people, models)
+    seconds = time.perf_counter() - start
+
+    missing = (~pd.Index(pairs['GEOID'].unique()).isin(people.index)).sum()
+    print(f"{len(pairs)} tract/facility pairs, {len(wide)} tracts, {wide.shape[1]} FacType x model scores "
+          f"in {seconds:.2f} s" + (f', {missing} tracts have no population' if missing else ''))
+    for (fac_type, model), values in wide.items():
+        print(f'  {measure_name(fac_type, model)}: median {values.median():.1f}, '
+              f'{(values == 0).sum()} tracts with no facility in reach')
+    if write:
+        write_long(long, {'name': 'accessibility', 'level': 'tract', 'dictionary': True})
+        finish()
+        print(f"wrote {len(long)} rows to {TARGETS['tract']}")
+    return long
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='2SFCA / E2SFCA accessibility scores per tract and FacType')
+    parser.add_argument('--drive-times', default=COMPREHENSIVE, help='merged drive-time CSV (see facility_load.py)')
+    parser.add_argument('--population', default=TARGETS['tract'],
+                        help="all_tract.csv or a CIFTools sociodemographics tract file with the 'Total' measure")
+    parser.add_argument('--models', help='JSON file of {name: [[up to minutes, weight], ...]} to use instead of MODELS')
+    parser.add_argument('--dry-run', action='store_true', help='compute and summarize the scores without writing them')
+    args = parser.parse_args()
+    models = MODELS
+    if args.models:
+        models = {name: [tuple(band) for band in bands] for name, bands in json.load(open(args.models)).items()}
+    run(args.drive_times, args.population, models, write=not args.dry_run)
@@ -0,0 +1,97 @@
+# Benchmark: 2SFCA / E2SFCA scores (accessibility.py) vectorized vs per facility and per tract loops
+#
+# Generates stand-in drive times (every tract paired with --per-tract random facilities
+# of each FacType, gamma distributed minutes) and tract populations, then
+#   - scores every FacType x model in MODELS with accessibility.scores, at each tract count
+#   - scores the smallest stand-in again with plain Python loops over facilities and
+#     tracts (how 2SFCA is usually written) and checks both agree
+# Exits non-zero if they don't.
+#
+#   python setup/SHAPE/benchmarks/bench_accessibility.py [--tracts 2000 20000 85000] [--facilities 3000]
+#       [--per-tract 40]
+
+import argparse
+import os
+import sys
+import time
+
+SHAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SHAPE_DIR)
+
+import numpy as np
+import pandas as pd
+
+from accessibility import MODELS, PER_RESIDENTS, scores
+
+FAC_TYPES = ['Gastroenterology', 'Lung Cancer Screening', 'Mammography']
+
+
+def standin(tracts, facilities, per_tract, seed=0):
+    # Drive-time pairs in the shape read_sources gives, and a population frame like read_population's
+    rng = np.random.default_rng(seed)
+    geoids = [f'{49000000000 + i * 100:011d}' for i in range(tracts)]
+    frames = []
+    for i, fac_type in enumerate(FAC_TYPES):
+        picks = rng.integers(0, facilities, size=(tracts, per_tract)) + i * facilities
+        frames.append(pd.DataFrame({'GEOID': np.repeat(geoids, per_tract), 'FacID': picks.ravel(), 'FacType': fac_type,
+                                    'minutes': rng.gamma(2.0, 20.0, size=picks.size)}))
+    pairs = pd.concat(frames, ignore_index=True).drop_duplicates(['GEOID', 'FacID', 'FacType'])
+    population = pd.DataFrame({'value': rng.integers(500, 8000, tracts).astype('float64')}, index=pd.Index(geoids, name='GEOID'))
+    return pairs, population
+
+
+def looped(pairs, population, models=MODELS):
+    # The same scores with a loop over facilities, then one over tracts, for each FacType x model
+    people = population['value'].to_dict()
+    columns = {}
+    for fac_type, group in pairs.groupby('FacType', sort=True):
+        rows = list(zip(group['GEOID'], group['FacID'], group['minutes']))
+        for model, bands in models.items():
+            def weight(minutes):
+                for limit, value in bands:
+                    if minutes <= limit:
+                        return value
+                return 0.0
+            demand = {}
+            for geoid, facility, minutes in rows:
+                demand[facility] = demand.get(facility, 0.0) + people.get(geoid, 0.0) * weight(minutes)
+            score = {}
+            for geoid, facility, minutes in rows:
+                ratio = 1 / demand[facility] if demand[facility] > 0 else 0.0
+                score[geoid] = score.get(geoid, 0.0) + ratio * weight(minutes)
+            columns[(fac_type, model)] = pd.Series(score) * PER_RESIDENTS
+    return pd.DataFrame(columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='2SFCA scores: vectorized vs looped')
+    parser.add_argument('--tracts', type=int, nargs='+', default=[2000, 20000, 85000])
+    parser.add_argument('--facilities', type=int, default=3000, help='facilities per FacType')
+    parser.add_argument('--per-tract', type=int, default=40, help='facilities of each FacType per tract')
+    args = parser.parse_args()
+
+    print(f"{len(FAC_TYPES)} FacTypes x {len(MODELS)} models, {args.facilities} facilities and "
+          f"{args.per_tract} pairs per tract for each FacType")
+    print(f"{'tracts':>8}{'pairs':>11}{'vectorized s':>14}{'looped s':>10}{'speedup':>9}  scores")
+    ok = True
+    for i, tracts in enumerate(args.tracts):
+        pairs, population = standin(tracts, args.facilities, args.per_tract)
+        start = time.perf_counter()
+        wide = scores(pairs, population)
+        seconds = time.perf_counter() - start
+        if i == 0:
+            start = time.perf_counter()
+            expected = looped(pairs, population).reindex(wide.index).fillna(0.0)
+            looped_seconds = time.perf_counter() - start
+            same = np.allclose(wide[expected.columns].to_numpy(), expected.to_numpy(), rtol=1e-9, atol=0)
+            ok = ok and same
+            print(f"{tracts:>8}{len(pairs):>11}{seconds:>14.2f}{looped_seconds:>10.2f}{looped_seconds / seconds:>8.0f}x  "
+                  f"{'same' if same else 'DIFFERENT'}")
+        else:
+            print(f"{tracts:>8}{len(pairs):>11}{seconds:>14.2f}")
+    if not ok:
+        sys.exit('vectorized scores differ from the looped ones')
+
+
+if __name__ == '__main__':
+    main()
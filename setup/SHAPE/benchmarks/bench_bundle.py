@@ -0,0 +1,155 @@
+# Benchmark: app cold start from shapefiles + CSVs vs the pre-joined bundles (bundle.py)
+#
+# Builds the bundles in a scratch copy of an app's www folder, then loads everything an
+# app loads at start up (the state, county and tract outlines joined to their all_* rows,
+# plus roads and fd) each way in a fresh process, recording wall time and resident
+# memory growth:
+#   shapefile + csv   pyogrio decodes each shapefile, pandas parses each CSV, rows are
+#                     merged onto the outlines and every row's geometry is decoded
+#   arrow mmap        bundle.load_bundle memory maps each .arrow file (no decoding)
+#   arrow + decode    the same, then shapely decodes each distinct outline once
+#   geoparquet        pyarrow reads each .parquet file (geometry back as a dictionary),
+#                     then the distinct outlines are decoded
+#
+# The repo's shapefiles come with an all_state.csv only, so by default the all_* files
+# are generated from the shapefile GEOIDs (--measures per GEOID). --www uses an app's
+# www folder (data/ and shapefiles/) as is.
+#
+#   python setup/SHAPE/benchmarks/bench_bundle.py [--www ShinyCIF/www] [--measures 40] [--repeat 3]
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SHAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(SHAPE_DIR))
+sys.path.insert(0, SHAPE_DIR)
+
+from bundle import BUNDLE_DIR, SHAPEFILE_DIR, LEVEL_SHAPES, LAYERS, GEOMETRY
+
+LOADERS = ['shapefile + csv', 'arrow mmap', 'arrow + decode', 'geoparquet']
+
+
+def synthesize(www, measures):
+    # all_* files with every shapefile GEOID and measures values each, in the pull's CSV format
+    import numpy as np
+    import pandas as pd
+    import pyogrio
+
+    rng = np.random.default_rng(0)
+    os.makedirs(os.path.join(www, 'data'), exist_ok=True)
+    for level, (name, key) in LEVEL_SHAPES.items():
+        _, table = pyogrio.read_arrow(os.path.join(www, SHAPEFILE_DIR, f'{name}.shp'), columns=[key])
+        geoids = table.column(key).to_pandas()
+        long = pd.DataFrame({'cat': 'Environment', 'GEOID': np.repeat(geoids.to_numpy(), measures),
+                             'Tract': 'Tract', 'County': 'County', 'State': 'State',
+                             'measure': np.tile([f'measure{i}' for i in range(measures)], len(geoids))})
+        long['value'] = rng.random(len(long)) * 100
+        long['RE'] = np.nan
+        long['Sex'] = np.nan
+        long['def'] = long['measure'] + ' definition'
+        long['fmt'] = 'dec'
+        long['source'] = 'stand-in'
+        long['lbl'] = long['value'].map(lambda value: f'{value:.1f}')
+        long.to_csv(os.path.join(www, 'data', f'all_{level}.csv'), index=False, quoting=csv.QUOTE_NONNUMERIC,
+                    na_rep='NA')
+
+
+def load(www, loader):
+    # Everything an app loads at start up, the given way; returns rows loaded
+    # Each loader imports what it uses, measure() has them all imported before the timing
+    import bundle
+
+    rows = 0
+    if loader == 'shapefile + csv':
+        import pandas as pd
+        import pyogrio
+        import shapely
+
+        for level, (name, key) in LEVEL_SHAPES.items():
+            _, table = pyogrio.read_arrow(os.path.join(www, SHAPEFILE_DIR, f'{name}.shp'))
+            shapes = pd.DataFrame({'GEOID': table.column(key).to_pandas(),
+                                   GEOMETRY: shapely.from_wkb(table.column('wkb_geometry').to_numpy(zero_copy_only=False))})
+            long = pd.read_csv(os.path.join(www, 'data', f'all_{level}.csv'), dtype={'GEOID': str})
+            rows += len(shapes.merge(long, on='GEOID', how='right'))
+        for name in LAYERS:
+            _, table = pyogrio.read_arrow(os.path.join(www, SHAPEFILE_DIR, f'{name}.shp'))
+            rows += len(shapely.from_wkb(table.column('wkb_geometry').to_numpy(zero_copy_only=False)))
+        return rows
+
+    for name in list(LEVEL_SHAPES) + LAYERS:
+        path = os.path.join(www, BUNDLE_DIR, name)
+        if loader == 'geoparquet':
+            import pyarrow.parquet as pq
+            table = pq.read_table(path + '.parquet', read_dictionary=[GEOMETRY])
+            bundle.outlines(table)
+        else:
+            table = bundle.load_bundle(path + '.arrow')
+            if loader == 'arrow + decode':
+                bundle.outlines(table)
+        rows += table.num_rows
+    return rows
+
+
+def measure(www, loader):
+    # Time and memory growth of one load (run in its own process)
+    from memory import current_rss_mb
+
+    # Imported here only so the one-off cost of importing the libraries, the same for every
+    # loader, isn't part of the timing
+    import bundle
+    import pandas, pyarrow.parquet, pyogrio, shapely
+    before = current_rss_mb()
+    start = time.perf_counter()
+    rows = load(www, loader)
+    return {'seconds': time.perf_counter() - start, 'rows': rows, 'rss_mb': current_rss_mb() - before}
+
+
+def run(www, loader):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', www, loader],
+                            capture_output=True, text=True)
+    if result.returncode:
+        sys.stderr.write(result.stderr)
+        raise Exception(f'{loader} load failed')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold start load time: shapefiles + CSVs vs pre-joined bundles')
+    parser.add_argument('--www', help='app www folder to use as is (default: the repo shapefiles with generated CSVs)')
+    parser.add_argument('--measures', type=int, default=40, help='measures per GEOID in the generated CSVs')
+    parser.add_argument('--repeat', type=int, default=3, help='loads per loader, the fastest one is reported')
+    args = parser.parse_args()
+
+    from bundle import write_bundles
+
+    scratch = tempfile.mkdtemp(prefix='shape_bundle_')
+    www = os.path.join(scratch, 'www')
+    if args.www:
+        shutil.copytree(args.www, www, ignore=shutil.ignore_patterns(BUNDLE_DIR))
+    else:
+        shutil.copytree(os.path.join(REPO_DIR, 'ShinyCIF/www', SHAPEFILE_DIR), os.path.join(www, SHAPEFILE_DIR))
+        synthesize(www, args.measures)
+    write_bundles(www)
+
+    print(f"{'loader':<18}{'seconds':>9}{'RSS MB':>9}{'rows':>10}{'speedup':>9}")
+    baseline = None
+    for loader in LOADERS:
+        stats = min((run(www, loader) for _ in range(args.repeat)), key=lambda stats: stats['seconds'])
+        baseline = baseline or stats['seconds']
+        print(f"{loader:<18}{stats['seconds']:>9.3f}{stats['rss_mb']:>9.1f}{stats['rows']:>10}"
+              f"{baseline / stats['seconds']:>8.1f}x")
+    shutil.rmtree(scratch)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        print(json.dumps(measure(sys.argv[2], sys.argv[3])))
+    else:
+        main()
@@ -0,0 +1,149 @@
+# Benchmark: fast_csv.render vs DataFrame.to_csv for the all_* files
+#
+# First diffs the fast writer against to_csv (QUOTE_NONNUMERIC, na_rep NA) on the frame of
+# edge cases in tests/test_fast_csv.py: -0.0, inf, tiny and huge floats, quotes and commas
+# in text, missing values in every kind of column, mixed number/text values, categoricals
+# and nullable ints. Then
+# times both on melted frames shaped like the pull's (rows x measures long rows), the
+# pandas side being what upsert() did before (to_csv plus parsing the key columns back), and
+# with --standin DIR runs the pull against a stand-in once per writer and compares every
+# output file byte for byte. Exits non-zero on any difference.
+#
+#   python setup/SHAPE/benchmarks/bench_csv_writer.py [--rows 100000 1000000] [--repeat 3] [--standin DIR]
+
+import argparse
+import filecmp
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+SHAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SHAPE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SHAPE_DIR, 'tests'))
+
+import numpy as np
+import pandas as pd
+
+import fast_csv
+from writers import LONG_KEYS
+# The edge case frame lives with the tests that check it
+from test_fast_csv import CSV_OPTIONS, edge_cases
+
+
+def long_frame(rows, seed=0):
+    # Melted rows like pipeline.melt_enrich gives, about rows of them
+    rng = np.random.default_rng(seed)
+    measures = 40
+    geoids = [f'{49000000000 + i:011d}' for i in range(max(1, rows // measures))]
+    long = pd.DataFrame({'cat': 'Environment', 'GEOID': np.repeat(geoids, measures),
+                         'Tract': 'Census Tract', 'County': 'Salt Lake County', 'State': 'Utah',
+                         'measure': pd.Categorical(np.tile([f'measure{i}' for i in range(measures)], len(geoids)))})
+    value = rng.random(len(long)) * 100
+    value[rng.random(len(long)) < 0.05] = np.nan
+    long['value'] = value
+    long['RE'] = np.nan
+    long['Sex'] = np.nan
+    long['def'] = long['measure'].astype(str) + ' definition, "quoted"'
+    long['fmt'] = 'dec'
+    long['source'] = 'stand-in'
+    long['lbl'] = [f'{v:.1f}' for v in value]
+    return long
+
+
+def diff(frame, keys):
+    # Lines where the fast writer differs from to_csv, and whether the key text matches
+    header, lines, literal = fast_csv.render(frame, keys, **CSV_OPTIONS)
+    expected = frame.to_csv(index=False, **CSV_OPTIONS)
+    text = header + ''.join(lines)
+    wrong = [(got, want) for got, want in zip(text.splitlines(), expected.splitlines()) if got != want]
+    if len(text.splitlines()) != len(expected.splitlines()):
+        wrong.append(('line count', f'{len(text.splitlines())} != {len(expected.splitlines())}'))
+    parsed = fast_csv.pandas_render(frame, keys, **CSV_OPTIONS)[2]
+    same_keys = literal.astype(str).equals(parsed.astype(str))
+    return wrong, same_keys
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best or np.inf, time.perf_counter() - start)
+    return best
+
+
+def standin_check(standin):
+    # The pull against the stand-in with each writer; True if every output file matches
+    from bench_pipeline import OUTPUTS, scratch_root
+
+    roots = {}
+    for writer in ('pandas', 'fast'):
+        roots[writer] = scratch_root(standin)
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', writer],
+                                cwd=roots[writer], capture_output=True, text=True)
+        if result.returncode:
+            sys.stderr.write(result.stderr)
+            raise Exception(f'pull failed with the {writer} writer')
+        print(f"  {writer:<7} pull {result.stdout.strip().splitlines()[-1]} s")
+    same = True
+    for output in OUTPUTS:
+        paths = [os.path.join(roots[writer], output) for writer in ('pandas', 'fast')]
+        if os.path.exists(paths[0]) or os.path.exists(paths[1]):
+            match = all(map(os.path.exists, paths)) and filecmp.cmp(*paths, shallow=False)
+            print(f"  {output}: {'identical' if match else 'DIFFERS'}")
+            same = same and match
+    for root in roots.values():
+        shutil.rmtree(root)
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fast CSV writer vs DataFrame.to_csv: output diff and timing')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3, help='renders per writer, the fastest one is reported')
+    parser.add_argument('--standin', help='stand-in database to run the pull against with each writer')
+    args = parser.parse_args()
+
+    # Each edge case column on its own (next to GEOID), so one the fast writer hands to
+    # to_csv doesn't send the rest of them there too
+    ok = True
+    frame = edge_cases()
+    print('edge cases')
+    for name in frame.columns[1:]:
+        columns = frame[['GEOID', name]]
+        wrong, same_keys = diff(columns, list(columns.columns))
+        path = 'to_csv' if fast_csv.column_cells(frame[name], 'NA') is None else 'fast'
+        print(f"  {name:<10}{str(frame[name].dtype):<10}{path:<8}"
+              f"{'identical' if not wrong and same_keys else 'DIFFERS'}")
+        for got, want in wrong[:3]:
+            print(f'    fast:   {got}\n    pandas: {want}')
+        ok = ok and not wrong and same_keys
+
+    print(f"{'rows':>9}{'pandas s':>10}{'fast s':>9}{'speedup':>9}  output")
+    for rows in args.rows:
+        frame = long_frame(rows)
+        wrong, same_keys = diff(frame, LONG_KEYS)
+        pandas_seconds = timed(lambda: fast_csv.pandas_render(frame, LONG_KEYS, **CSV_OPTIONS), args.repeat)
+        fast_seconds = timed(lambda: fast_csv.render(frame, LONG_KEYS, **CSV_OPTIONS), args.repeat)
+        print(f"{len(frame):>9}{pandas_seconds:>10.2f}{fast_seconds:>9.2f}{pandas_seconds / fast_seconds:>8.1f}x  "
+              f"{'identical' if not wrong and same_keys else 'DIFFERS'}")
+        ok = ok and not wrong and same_keys
+
+    if args.standin:
+        print('pull against the stand-in')
+        ok = standin_check(args.standin) and ok
+
+    if not ok:
+        sys.exit('fast writer output differs from to_csv')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        from pull_shape_db import OPTIONS, run
+        report = run(dict(OPTIONS, csv_writer=sys.argv[2]))
+        print(f"{report['seconds']:.1f}")
+    else:
+        main()
@@ -0,0 +1,123 @@
+# Benchmark: drive-time queries on the long CSVs vs the memory-mapped matrices (drive_times.py)
+#
+# Writes a stand-in drive-time CSV in the facility_load format with every tract paired
+# with its --per-tract closest facilities of each type, compiles it with drive_times.build
+# and answers the same random queries both ways:
+#   csv      pandas reads the CSV, then filters and sorts it for each query (what the
+#            app side does today)
+#   matrix   open_matrix maps the arrays, then nearest() / within() slice them
+# recording load time, time per query and whether both give the same answers. --sources
+# uses real facility_load CSVs instead of the stand-in.
+#
+#   python setup/SHAPE/benchmarks/bench_drive_times.py [--tracts 20000] [--facilities 500]
+#       [--per-tract 50] [--queries 200] [--sources CSV ...]
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+SHAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SHAPE_DIR)
+
+import numpy as np
+import pandas as pd
+
+from drive_times import build, open_matrix, nearest, within
+
+FAC_TYPES = ['Gastroenterology', 'Lung Cancer Screening', 'Mammography']
+
+
+def standin(path, tracts, facilities, per_tract, seed=0):
+    # Drive-time CSV with per_tract facilities of each type for every tract
+    rng = np.random.default_rng(seed)
+    geoids = 49000000000 + np.arange(tracts) * 100
+    frames = []
+    for i, fac_type in enumerate(FAC_TYPES):
+        ids = np.arange(facilities) + i * facilities
+        picks = np.argsort(rng.random((tracts, facilities)), axis=1)[:, :per_tract]
+        minutes = rng.gamma(2.0, 30.0, size=picks.shape)
+        frames.append(pd.DataFrame({'CountyTract': np.repeat([f'Z{geoid}' for geoid in geoids], per_tract),
+                                    'FacID': ids[picks].ravel(), 'FacType': fac_type,
+                                    'minutes': minutes.ravel(), 'miles': (minutes * 0.9).ravel()}))
+    pd.concat(frames).to_csv(path, index=False)
+
+
+def csv_nearest(rows, fac_type, geoid, k):
+    hits = rows[(rows['FacType'] == fac_type) & (rows['CountyTract'] == 'Z' + geoid)].nsmallest(k, 'minutes', keep='first')
+    return list(zip(hits['FacID'].tolist(), hits['minutes'].tolist(), hits['miles'].tolist()))
+
+
+def csv_within(rows, fac_type, fac_id, minutes):
+    hits = rows[(rows['FacType'] == fac_type) & (rows['FacID'] == fac_id) & (rows['minutes'] <= minutes)]
+    hits = hits.sort_values('minutes', kind='stable')
+    return list(zip(hits['CountyTract'].str[1:].tolist(), hits['minutes'].tolist(), hits['miles'].tolist()))
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def same(a, b):
+    # Answers match up to the order of equal drive times
+    return sorted(a) == sorted(b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive-time queries: long CSV vs memory-mapped matrices')
+    parser.add_argument('--tracts', type=int, default=20000)
+    parser.add_argument('--facilities', type=int, default=500, help='facilities per type')
+    parser.add_argument('--per-tract', type=int, default=50, help='facilities of each type per tract')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--minutes', type=float, default=30)
+    parser.add_argument('--sources', nargs='+', help='facility_load CSVs to use instead of the stand-in')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='shape_drive_times_')
+    sources = args.sources
+    if not sources:
+        sources = [os.path.join(scratch, 'standin_CT_toFacilities.csv')]
+        standin(sources[0], args.tracts, args.facilities, args.per_tract)
+    directory = os.path.join(scratch, 'drive_times')
+    _, build_seconds = timed(lambda: build(sources, directory))
+    csv_mb = sum(os.path.getsize(path) for path in sources) / 1e6
+    matrix_mb = sum(os.path.getsize(os.path.join(folder, name))
+                    for folder, _, names in os.walk(directory) for name in names) / 1e6
+    print(f'{csv_mb:.1f} MB csv -> {matrix_mb:.1f} MB matrices in {build_seconds:.2f} s')
+
+    rows, csv_load = timed(lambda: pd.concat([pd.read_csv(path, dtype={'CountyTract': str}) for path in sources]))
+    fac_type = rows['FacType'].iloc[0]
+    matrix, matrix_load = timed(lambda: open_matrix(fac_type, directory))
+
+    rng = np.random.default_rng(1)
+    typed = rows[rows['FacType'] == fac_type]
+    geoids = rng.choice(typed['CountyTract'].str[1:].unique(), args.queries)
+    fac_ids = rng.choice(typed['FacID'].unique(), args.queries)
+
+    print(f"{fac_type}: {args.queries} queries each")
+    print(f"{'':<22}{'csv':>12}{'matrix':>12}{'speedup':>10}  answers")
+    print(f"{'load s':<22}{csv_load:>12.3f}{matrix_load:>12.3f}{csv_load / matrix_load:>9.0f}x")
+    ok = True
+    for label, by_csv, by_matrix in [
+            (f'nearest {args.k} us/query', lambda q: csv_nearest(rows, fac_type, geoids[q], args.k),
+             lambda q: nearest(matrix, geoids[q], args.k)),
+            (f'within {args.minutes:g} min us/query', lambda q: csv_within(rows, fac_type, fac_ids[q], args.minutes),
+             lambda q: within(matrix, fac_ids[q], args.minutes))]:
+        expected, csv_seconds = timed(lambda: [by_csv(q) for q in range(args.queries)])
+        got, matrix_seconds = timed(lambda: [by_matrix(q) for q in range(args.queries)])
+        match = all(same(a, b) for a, b in zip(expected, got))
+        ok = ok and match
+        print(f"{label:<22}{csv_seconds / args.queries * 1e6:>12.0f}{matrix_seconds / args.queries * 1e6:>12.1f}"
+              f"{csv_seconds / matrix_seconds:>9.0f}x  {'same' if match else 'DIFFERENT'}")
+    shutil.rmtree(scratch)
+    if not ok:
+        sys.exit('matrix answers differ from the CSV')
+
+
+if __name__ == '__main__':
+    main()
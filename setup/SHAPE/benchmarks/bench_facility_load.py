@@ -0,0 +1,104 @@
+# Benchmark: the facility_load merge (facility_load.py) against the R version's output and at scale
+#
+# First merges the repo's simple_<ST>_CT_toFacilities files and compares the result
+# byte for byte with the facility_load_comprehensive.csv facility_load.R wrote. Then
+# for each state count writes stand-in state files (the repo's rows repeated --copies
+# times under made up state codes and tracts) and merges them in a fresh process, once
+# with one worker and once with --jobs, recording wall time and the peak memory of the
+# parent and of the busiest worker. Memory should stay flat as states are added.
+#
+#   python setup/SHAPE/benchmarks/bench_facility_load.py [--states 5 20 50] [--copies 20] [--jobs 4]
+
+import argparse
+import filecmp
+import glob
+import itertools
+import json
+import os
+import resource
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+SHAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(SHAPE_DIR))
+sys.path.insert(0, SHAPE_DIR)
+
+from facility_load import COMPREHENSIVE, build
+from drive_times import FACILITY_LOAD_DIR
+
+
+def standin(directory, states, copies):
+    # states files in the simple_<ST>_CT_toFacilities format, each copies times a repo file's rows
+    import pandas as pd
+
+    files = sorted(glob.glob(os.path.join(REPO_DIR, FACILITY_LOAD_DIR, 'simple_*_CT_toFacilities_v*.csv')))
+    codes = [''.join(pair) for pair in itertools.product(string.ascii_uppercase, repeat=2)]
+    for i in range(states):
+        rows = pd.read_csv(files[i % len(files)], dtype={'CountyTract': str})
+        # A copy per block of tract numbers so every row is its own tract/facility pair
+        frames = []
+        for copy in range(copies):
+            frame = rows.copy()
+            frame['CountyTract'] = 'Z' + frame['CountyTract'].str[1:3] + \
+                (frame['CountyTract'].str[3:].astype('int64') + copy * 10**7).astype(str).str.zfill(9).str[-9:]
+            frame['minutes'] = frame['minutes'] * (1 + copy / 1000)
+            frames.append(frame)
+        pd.concat(frames).to_csv(os.path.join(directory, f'simple_{codes[i]}_CT_toFacilities_v1.csv'), index=False)
+
+
+def merge(source, target, jobs):
+    # facility_load.build in this process, with time and peak memory of the process and its workers
+    start = time.perf_counter()
+    counters = build(target, source, jobs)
+    return {'seconds': time.perf_counter() - start, 'rows': sum(counter['rows'] for counter in counters.values()),
+            'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'worker_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024 if jobs > 1 else 0}
+
+
+def run(source, target, jobs):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', source, target, str(jobs)],
+                            capture_output=True, text=True)
+    if result.returncode:
+        sys.stderr.write(result.stderr)
+        raise Exception(f'merge of {source} failed')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='facility_load merge: R output check and scaling with states')
+    parser.add_argument('--states', type=int, nargs='+', default=[5, 20, 50])
+    parser.add_argument('--copies', type=int, default=20, help='copies of a repo state file per stand-in state')
+    parser.add_argument('--jobs', type=int, default=4)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='shape_facility_load_')
+    target = os.path.join(scratch, 'facility_load_comprehensive.csv')
+    stats = run(os.path.join(REPO_DIR, FACILITY_LOAD_DIR), target, 1)
+    same = filecmp.cmp(target, os.path.join(REPO_DIR, COMPREHENSIVE), shallow=False)
+    print(f"repo files: {stats['rows']} rows in {stats['seconds']:.2f} s, "
+          f"{'identical to' if same else 'DIFFERENT from'} the R output")
+
+    print(f"{'states':>6}{'rows':>10}{'jobs':>6}{'seconds':>9}{'rows/s':>10}{'parent MB':>11}{'worker MB':>11}")
+    for states in args.states:
+        source = os.path.join(scratch, f'states_{states}')
+        os.makedirs(source)
+        standin(source, states, args.copies)
+        for jobs in sorted({1, args.jobs}):
+            stats = run(source, os.path.join(source, 'merged.csv'), jobs)
+            print(f"{states:>6}{stats['rows']:>10}{jobs:>6}{stats['seconds']:>9.1f}{stats['rows'] / stats['seconds']:>10.0f}"
+                  f"{stats['peak_mb']:>11.0f}{stats['worker_mb']:>11.0f}")
+        shutil.rmtree(source)
+    shutil.rmtree(scratch)
+    if not same:
+        sys.exit('merged file differs from the R output')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        print(json.dumps(merge(sys.argv[2], sys.argv[3], int(sys.argv[4]))))
+    else:
+        main()
@@ -0,0 +1,71 @@
+# Benchmark: per-row lambdas vs the vectorized formatters in formats.py
+#
+# Builds a synthetic long table shaped like the melted SHAPE output (measures
+# repeated once per geography, some missing values) and times the def/fmt lookups
+# and each label style both ways, checking the results match.
+#
+#   python setup/SHAPE/benchmarks/bench_formats.py [rows]
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from formats import format_values, map_lookup
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# The per-row versions the pull used before formats.py
+ROW_LABELS = {
+    'pct': lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x,
+    'dec': lambda x: f'{x:.1f}' if not pd.isna(x) else x,
+    'str': lambda x: str(x) if not pd.isna(x) else x,
+}
+
+
+def synthetic_long(rows, defs, seed=0):
+    # Long table: every measure once per geography, ~10% missing values,
+    # values drawn from a few thousand distinct numbers like the real tables
+    rng = np.random.default_rng(seed)
+    measures = list(defs)
+    geographies = rows // len(measures) + 1
+    measure = pd.Series(np.repeat(measures, geographies)[:rows])
+    value = pd.Series(rng.integers(0, 5000, rows) / 5000)
+    value[rng.random(rows) < 0.1] = np.nan
+    return measure, value
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def same(a, b):
+    return a.fillna('NA').astype(str).equals(b.fillna('NA').astype(str))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    defs = json.load(open(os.path.join(DATA_DIR, 'definitions', 'hints.json')))
+    measure, value = synthetic_long(rows, defs)
+    print(f'{rows} rows, {measure.nunique()} measures, {value.nunique()} distinct values')
+
+    cases = [('def', lambda: measure.apply(lambda x: defs[x]), lambda: map_lookup(measure, defs, 'hints'))]
+    for code, func in ROW_LABELS.items():
+        cases.append((f'lbl {code}', lambda func=func: value.apply(func), lambda code=code: format_values(value, code)))
+
+    print(f"{'column':<10}{'per row':>10}{'vectorized':>12}{'speedup':>9}  match")
+    for name, row_func, vector_func in cases:
+        expected, row_secs = timed(row_func)
+        result, vector_secs = timed(vector_func)
+        print(f'{name:<10}{row_secs:>9.3f}s{vector_secs:>11.3f}s{row_secs / vector_secs:>8.1f}x  {same(expected, result)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Benchmark: national mode (national.py) at a growing number of states
+#
+# For each state count generates a stand-in with that many states (standin.py, area we
+# serve first), runs the national pull on it in a fresh process and a scratch copy of
+# the output layout, and records wall time, the peak memory of the parent and of the
+# busiest worker, and the rows and size of the partitions written. Sharding by state
+# should keep worker memory flat and time per state roughly constant as states grow.
+#
+#   python setup/SHAPE/benchmarks/bench_national.py [--states 5 20 50] [--jobs 4]
+#       [--datasets AQI FCC ...] [--counties 62] [--tracts 27]
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+SHAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(SHAPE_DIR))
+sys.path.insert(0, SHAPE_DIR)
+
+from bench_pipeline import DATASETS, scratch_root
+
+
+def pull(jobs, datasets):
+    # National pull_shape_db.run for the given datasets, run from a scratch root
+    from pull_shape_db import OPTIONS, run
+    report = run(dict(OPTIONS, datasets=datasets, jobs=jobs, national=True))
+    rows = sum(sum(shard['rows'].values()) for shard in report['shards'].values())
+    return {'seconds': report['seconds'], 'peak_mb': report['peak_rss_mb'],
+            'worker_mb': report['peak_worker_mb'], 'rows': rows}
+
+
+def run(states, args):
+    # Stand-in with this many states, then the national pull against it in its own process
+    from standin import generate, write_standin
+    from national import NATIONAL_DIR
+
+    standin = tempfile.mkdtemp(prefix='shape_standin_')
+    cwd = os.getcwd()
+    os.chdir(REPO_DIR)
+    write_standin(standin, generate(states, args.counties, args.tracts))
+    os.chdir(cwd)
+
+    root = scratch_root(standin)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', str(args.jobs)] + args.datasets,
+                            cwd=root, capture_output=True, text=True)
+    if result.returncode:
+        sys.stderr.write(result.stderr)
+        raise Exception(f'national pull failed for {states} states')
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    stats['bytes'] = sum(os.path.getsize(os.path.join(folder, name))
+                         for folder, _, names in os.walk(os.path.join(root, NATIONAL_DIR))
+                         for name in names if name.startswith('all_'))
+    shutil.rmtree(root)
+    shutil.rmtree(standin)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scaling benchmark of the national SHAPE pull against local stand-ins')
+    parser.add_argument('--states', type=int, nargs='+', default=[5, 20, 50])
+    parser.add_argument('--jobs', type=int, default=4, help='worker processes for the shards')
+    parser.add_argument('--datasets', nargs='+', default=DATASETS)
+    parser.add_argument('--counties', type=int, default=62)
+    parser.add_argument('--tracts', type=int, default=27)
+    args = parser.parse_args()
+
+    print(f'{args.counties} counties/state, {args.tracts} tracts/county, {args.jobs} workers')
+    print(f"{'states':>6}{'rows':>11}{'seconds':>9}{'s/state':>9}{'parent MB':>11}{'worker MB':>11}{'output MB':>11}")
+    for states in args.states:
+        stats = run(states, args)
+        print(f"{states:>6}{stats['rows']:>11}{stats['seconds']:>9.1f}{stats['seconds'] / states:>9.2f}"
+              f"{stats['peak_mb']:>11.0f}{stats['worker_mb']:>11.0f}{stats['bytes'] / 1e6:>11.1f}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        print(json.dumps(pull(int(sys.argv[2]), sys.argv[3:])))
+    else:
+        main()
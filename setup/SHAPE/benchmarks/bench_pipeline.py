@@ -0,0 +1,137 @@
+# Benchmark: the whole SHAPE pull end to end against a local stand-in
+#
+# Generates a stand-in database with standin.py (national scale by default), then runs
+# the pull for each dataset on its own and for all of them together, each in a fresh
+# process and a scratch copy of the output layout, and records wall time, peak memory
+# (RSS) and the size of the all_* files it wrote.
+#
+# The all-datasets run doubles as a golden-output check: save its output once with
+# --save-golden DIR, then later runs with --golden DIR fail if any all_*.csv or the
+# measure dictionary differs byte for byte.
+#
+#   python setup/SHAPE/benchmarks/bench_pipeline.py [--datasets AQI FCC ...] [--jobs 1] [--states 51]
+#       [--counties 62] [--tracts 27] [--standin DIR] [--save-golden DIR | --golden DIR]
+
+import argparse
+import filecmp
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+SHAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(SHAPE_DIR))
+sys.path.insert(0, SHAPE_DIR)
+
+from specs import TARGETS, MEASURE_DICTIONARY
+
+DATASETS = ['AQI', 'Radon', 'BRFSS', 'FCC', 'HINTS']
+OUTPUTS = list(TARGETS.values()) + [MEASURE_DICTIONARY]
+
+
+def pull(jobs, datasets):
+    # pull_shape_db.run for the given datasets, run from a scratch root
+    from pull_shape_db import OPTIONS, run
+    report = run(dict(OPTIONS, datasets=datasets, jobs=jobs))
+    return {'seconds': report['seconds'], 'peak_mb': report['peak_rss_mb']}
+
+
+def scratch_root(standin):
+    # Copy of the pieces of the repo the pull reads and writes, with the login pointing at the stand-in
+    root = tempfile.mkdtemp(prefix='shape_bench_')
+    shutil.copytree(os.path.join(SHAPE_DIR, 'data'), os.path.join(root, 'setup/SHAPE/data'),
+                    ignore=shutil.ignore_patterns('geography', 'checkpoints', 'fingerprints.json', 'sql_login.json'))
+    with open(os.path.join(root, 'setup/SHAPE/data/sql_login.json'), 'w') as f:
+        json.dump({'standin': os.path.abspath(standin)}, f)
+    os.makedirs(os.path.join(root, os.path.dirname(TARGETS['state'])))
+    shutil.copy(os.path.join(REPO_DIR, MEASURE_DICTIONARY), os.path.join(root, MEASURE_DICTIONARY))
+    return root
+
+
+def run(datasets, standin, jobs=1):
+    # Run the pull in a fresh process so peak memory is just this run's
+    root = scratch_root(standin)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', str(jobs)] + datasets,
+                            cwd=root, capture_output=True, text=True)
+    if result.returncode:
+        sys.stderr.write(result.stderr)
+        raise Exception(f'pull failed for {datasets}')
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    stats['bytes'] = sum(os.path.getsize(os.path.join(root, path))
+                         for path in TARGETS.values() if os.path.exists(os.path.join(root, path)))
+    return root, stats
+
+
+def check_golden(root, golden):
+    # Byte for byte comparison of every output against the golden copy
+    same = True
+    for path in OUTPUTS:
+        expected = os.path.join(golden, path)
+        actual = os.path.join(root, path)
+        if not os.path.exists(expected) and not os.path.exists(actual):
+            continue
+        match = os.path.exists(expected) and os.path.exists(actual) and filecmp.cmp(expected, actual, shallow=False)
+        print(f"  {'same' if match else 'DIFFERENT'}  {path}")
+        same = same and match
+    return same
+
+
+def save_golden(root, golden):
+    for path in OUTPUTS:
+        if os.path.exists(os.path.join(root, path)):
+            os.makedirs(os.path.dirname(os.path.join(golden, path)), exist_ok=True)
+            shutil.copy(os.path.join(root, path), os.path.join(golden, path))
+    print(f'  saved golden output to {golden}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End to end benchmark of the SHAPE pull against a local stand-in')
+    parser.add_argument('--datasets', nargs='+', default=DATASETS)
+    parser.add_argument('--jobs', type=int, default=1, help='worker processes for the pull')
+    parser.add_argument('--standin', help='existing stand-in directory to use instead of generating one')
+    parser.add_argument('--states', type=int, default=51)
+    parser.add_argument('--counties', type=int, default=62)
+    parser.add_argument('--tracts', type=int, default=27)
+    golden = parser.add_mutually_exclusive_group()
+    golden.add_argument('--golden', help='directory with golden output to compare against')
+    golden.add_argument('--save-golden', help='directory to save this run\'s output to as the golden output')
+    args = parser.parse_args()
+
+    standin = args.standin
+    if standin is None:
+        from standin import generate, write_standin
+        standin = tempfile.mkdtemp(prefix='shape_standin_')
+        # standin.py reads the definitions relative to the repo root
+        cwd = os.getcwd()
+        os.chdir(REPO_DIR)
+        write_standin(standin, generate(args.states, args.counties, args.tracts))
+        os.chdir(cwd)
+        print(f'stand-in: {args.states} states, {args.counties} counties/state, {args.tracts} tracts/county')
+
+    print(f"{'dataset':<28}{'seconds':>9}{'peak MB':>9}{'output MB':>11}")
+    runs = [(dataset, [dataset]) for dataset in args.datasets] + [('all', args.datasets)]
+    for name, datasets in runs:
+        root, stats = run(datasets, standin, args.jobs)
+        print(f"{name:<28}{stats['seconds']:>9.2f}{stats['peak_mb']:>9.0f}{stats['bytes'] / 1e6:>11.1f}")
+        if name != 'all':
+            shutil.rmtree(root)
+
+    same = True
+    if args.golden:
+        print('golden output check')
+        same = check_golden(root, args.golden)
+    elif args.save_golden:
+        save_golden(root, args.save_golden)
+    shutil.rmtree(root)
+    if args.standin is None:
+        shutil.rmtree(standin)
+    sys.exit(0 if same else 1)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        print(json.dumps(pull(int(sys.argv[2]), sys.argv[3:])))
+    else:
+        main()
@@ -0,0 +1,61 @@
+# Benchmark: rows and bytes read per SHAPE table with and without SQL pushdown
+#
+# Run from the repo root against the database in setup/SHAPE/data/sql_login.json
+# (point "standin" at a local stand-in to run it offline):
+#
+#   python setup/SHAPE/benchmarks/bench_pushdown.py [dataset ...]
+#
+# Bytes are the in-memory size of the pulled frame (deep), which tracks what the
+# driver had to decode and what pandas had to materialize for each read.
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from specs import FIPS_SPECS, specs_for
+from extract import create_engine, build_query
+
+AWS = ['Utah', 'Idaho', 'Wyoming', 'Montana', 'Nevada']
+AWS_FIPS = ['16', '30', '32', '49', '56', 16, 30, 32, 49, 56]
+DATASETS = ['AQI', 'Radon', 'BRFSS', 'FCC', 'HINTS']
+
+
+def measure(engine, spec, pushdown):
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        df = pd.read_sql(build_query(spec, AWS, AWS_FIPS, conn, pushdown), conn)
+    seconds = time.perf_counter() - start
+    return len(df), len(df.columns), int(df.memory_usage(deep=True).sum()), seconds
+
+
+def main():
+    datasets = sys.argv[1:] or DATASETS
+    login = json.load(open('setup/SHAPE/data/sql_login.json'))
+    engine = create_engine(login, 1)
+
+    totals = {False: [0, 0, 0.0], True: [0, 0, 0.0]}
+    print(f"{'table':<28}{'rows':>10}{'cols':>6}{'bytes':>14}   {'rows':>8}{'cols':>6}{'bytes':>12}{'saved':>8}")
+    for spec in FIPS_SPECS + specs_for(datasets):
+        before = measure(engine, spec, pushdown=False)
+        after = measure(engine, spec, pushdown=True)
+        for pushdown, (rows, cols, size, seconds) in ((False, before), (True, after)):
+            totals[pushdown][0] += rows
+            totals[pushdown][1] += size
+            totals[pushdown][2] += seconds
+        saved = 1 - after[2] / before[2] if before[2] else 0
+        print(f"{spec['name']:<28}{before[0]:>10}{before[1]:>6}{before[2]:>14}   {after[0]:>8}{after[1]:>6}{after[2]:>12}{saved:>8.1%}")
+
+    engine.dispose()
+    (rows_before, bytes_before, secs_before), (rows_after, bytes_after, secs_after) = totals[False], totals[True]
+    print()
+    print(f'select *  : {rows_before} rows, {bytes_before / 1e6:.1f} MB, {secs_before:.2f}s')
+    print(f'pushdown  : {rows_after} rows, {bytes_after / 1e6:.1f} MB, {secs_after:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
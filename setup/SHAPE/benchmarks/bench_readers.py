@@ -0,0 +1,117 @@
+# Benchmark: pandas vs Arrow reader backends for SHAPE reads
+#
+# Reads each table with both backends in readers.py, each read in a fresh process so
+# peak memory is just that read's, and checks the two frames are identical. Runs
+# against a generated national stand-in (or --standin DIR, or the real database with
+# --login) and reads whole tables by default, since the point is how fast each
+# backend turns rows into columns. --pushdown reads just the catchment instead.
+#
+#   python setup/SHAPE/benchmarks/bench_readers.py [--datasets FCC ...] [--pushdown]
+#       [--standin DIR | --login setup/SHAPE/data/sql_login.json]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import shutil
+import tempfile
+
+SHAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(SHAPE_DIR))
+sys.path.insert(0, SHAPE_DIR)
+
+from specs import specs_for
+
+AWS = ['Utah', 'Idaho', 'Wyoming', 'Montana', 'Nevada']
+AWS_FIPS = ['16', '30', '32', '49', '56']
+READERS = ['pandas', 'arrow']
+
+
+def read(login, name, reader, pushdown, out):
+    # One read in this process: time, peak RSS growth and the frame (pickled to out for the match check)
+    import time
+    import memory
+    from extract import create_engine, build_query
+    from readers import READERS as BACKENDS
+
+    spec = next(spec for spec in specs_for(['AQI', 'Radon', 'BRFSS', 'FCC', 'HINTS']) if spec['name'] == name)
+    engine = create_engine(login, 1)
+    with engine.connect() as conn:
+        query = build_query(spec, AWS, AWS_FIPS, conn, pushdown)
+    if reader == 'arrow':
+        # Imported here only so the one-off cost of importing pyarrow isn't part of the timing
+        import pyarrow
+    before = memory.peak_rss_mb()
+    start = time.perf_counter()
+    df = BACKENDS[reader](engine, query)
+    seconds = time.perf_counter() - start
+    df.to_pickle(out)
+    return {'rows': len(df), 'seconds': seconds, 'peak_mb': memory.peak_rss_mb() - before,
+            'frame_mb': df.memory_usage(deep=True).sum() / 2**20}
+
+
+def run(login_path, name, reader, pushdown, out):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--read', login_path, name, reader,
+                             str(pushdown), out], capture_output=True, text=True, cwd=REPO_DIR)
+    if result.returncode:
+        sys.stderr.write(result.stderr)
+        raise Exception(f'{reader} read of {name} failed')
+    lines = result.stdout.strip().splitlines()
+    for line in lines[:-1]:
+        print(line)
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the pandas and Arrow reader backends')
+    parser.add_argument('--datasets', nargs='+', default=['FCC'])
+    parser.add_argument('--pushdown', action='store_true', help='read just the catchment rows and needed columns')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--standin', help='existing stand-in directory to use instead of generating one')
+    source.add_argument('--login', help='sql_login.json for the database to read from')
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    scratch = tempfile.mkdtemp(prefix='shape_readers_')
+    login_path = args.login
+    if login_path is None:
+        standin = args.standin
+        if standin is None:
+            from standin import generate, write_standin
+            standin = os.path.join(scratch, 'standin')
+            cwd = os.getcwd()
+            os.chdir(REPO_DIR)
+            write_standin(standin, generate())
+            os.chdir(cwd)
+        login_path = os.path.join(scratch, 'login.json')
+        with open(login_path, 'w') as f:
+            json.dump({'standin': os.path.abspath(standin)}, f)
+    login_path = os.path.abspath(login_path)
+
+    print(f"{'table':<24}{'rows':>8}   {'pandas s':>9}{'MB':>7}   {'arrow s':>9}{'MB':>7}{'speedup':>9}  match")
+    totals = {reader: [0, 0.0] for reader in READERS}
+    for spec in specs_for(args.datasets):
+        stats = {}
+        for reader in READERS:
+            stats[reader] = run(login_path, spec['name'], reader, args.pushdown, os.path.join(scratch, f'{reader}.pkl'))
+            totals[reader][0] += stats[reader]['rows']
+            totals[reader][1] += stats[reader]['seconds']
+        same = pd.read_pickle(os.path.join(scratch, 'pandas.pkl')).equals(pd.read_pickle(os.path.join(scratch, 'arrow.pkl')))
+        pandas, arrow = stats['pandas'], stats['arrow']
+        print(f"{spec['name']:<24}{pandas['rows']:>8}   {pandas['seconds']:>9.3f}{pandas['peak_mb']:>7.0f}"
+              f"   {arrow['seconds']:>9.3f}{arrow['peak_mb']:>7.0f}{pandas['seconds'] / arrow['seconds']:>8.1f}x  {same}")
+
+    print()
+    for reader, (rows, seconds) in totals.items():
+        print(f'{reader:<7}: {rows / seconds:,.0f} rows/s')
+    shutil.rmtree(scratch)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--read']:
+        login_path, name, reader, pushdown, out = sys.argv[2:]
+        print(json.dumps(read(json.load(open(login_path)), name, reader, pushdown == 'True', out)))
+    else:
+        main()
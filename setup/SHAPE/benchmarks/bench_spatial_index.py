@@ -0,0 +1,137 @@
+# Benchmark: the grid spatial index (spatial_index.py) against brute force haversine
+#
+# Points are the newest huntsman_locations file's locations, plus stand-in point sets of
+# each --points size spread over the catchment's bounding box. Queries are the tract
+# centroids of tract_sf plus --queries random points over the same box. For each point
+# set it times
+#   - build_index
+#   - within(..., --radius) for every query
+#   - nearest(..., k=--k) for every query
+# and the same answers from a full query x point haversine matrix (in blocks), and
+# checks they agree. Then it checks catchment_distance against the distance to every
+# boundary edge. Exits non-zero if anything differs.
+#
+#   python setup/SHAPE/benchmarks/bench_spatial_index.py [--points 3000 30000 300000] [--queries 5000]
+#       [--radius 25] [--k 5]
+
+import argparse
+import os
+import sys
+import time
+
+SHAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(SHAPE_DIR))
+sys.path.insert(0, SHAPE_DIR)
+
+import numpy as np
+
+from spatial_index import (CATCHMENT, build_index, catchment_distance, edge_distance, haversine, latest_locations,
+                           nearest, read_catchment, read_locations, unit_vectors, within)
+
+# Query x point distances computed at a time by brute force
+BLOCK = 2**22
+
+
+def centroids():
+    # (lat, lon) of tract_sf's centroids
+    import pyogrio
+    import shapely
+
+    meta, table = pyogrio.read_arrow(os.path.join(REPO_DIR, 'ShinyCIF/www/shapefiles/tract_sf.shp'))
+    shapes = shapely.from_wkb(table.column(meta['geometry_name'] or 'wkb_geometry').to_numpy(zero_copy_only=False))
+    xy = shapely.get_coordinates(shapely.centroid(shapes))
+    return xy[:, 1], xy[:, 0]
+
+
+def spread(count, bounds, rng):
+    # count random (lat, lon) over bounds (min lon, min lat, max lon, max lat)
+    return rng.uniform(bounds[1], bounds[3], count), rng.uniform(bounds[0], bounds[2], count)
+
+
+def brute_force(lat, lon, point_lat, point_lon, radius, k):
+    # within and nearest answers from every query x point distance
+    pairs, rows, miles = [], [], []
+    step = max(1, BLOCK // max(len(point_lat), 1))
+    for start in range(0, len(lat), step):
+        distance = haversine(lat[start:start + step, None], lon[start:start + step, None], point_lat[None], point_lon[None])
+        query, point = np.nonzero(distance <= radius)
+        pairs.append(np.stack([query + start, point], axis=1))
+        closest = np.argpartition(distance, min(k, distance.shape[1] - 1), axis=1)[:, :k]
+        order = np.take_along_axis(closest, np.argsort(np.take_along_axis(distance, closest, axis=1), axis=1), axis=1)
+        rows.append(order)
+        miles.append(np.take_along_axis(distance, order, axis=1))
+    return np.concatenate(pairs), np.concatenate(rows), np.concatenate(miles)
+
+
+def same_pairs(query, row, expected):
+    found = np.stack([query, row], axis=1)
+    return len(found) == len(expected) and \
+        (found[np.lexsort(found.T[::-1])] == expected[np.lexsort(expected.T[::-1])]).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grid spatial index vs brute force haversine')
+    parser.add_argument('--points', type=int, nargs='+', default=[3000, 30000, 300000])
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--radius', type=float, default=25)
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args()
+
+    os.chdir(REPO_DIR)
+    rng = np.random.default_rng(0)
+    catchment = read_catchment(CATCHMENT)
+    bounds = catchment['area'].bounds
+    tract_lat, tract_lon = centroids()
+    extra_lat, extra_lon = spread(args.queries, bounds, rng)
+    lat, lon = np.concatenate([tract_lat, extra_lat]), np.concatenate([tract_lon, extra_lon])
+
+    locations = read_locations(latest_locations())
+    point_sets = [('locations', locations['latitude'].to_numpy(), locations['longitude'].to_numpy())]
+    point_sets += [('stand-in', *spread(count, bounds, rng)) for count in args.points]
+
+    print(f"{len(lat)} queries ({len(tract_lat)} tract centroids), radius {args.radius:g} miles, k {args.k}")
+    print(f"{'points':>16}{'build ms':>10}{'within s':>10}{'pairs':>10}{'nearest s':>11}{'brute s':>9}"
+          f"{'speedup':>9}  answers")
+    ok = True
+    for name, point_lat, point_lon in point_sets:
+        start = time.perf_counter()
+        index = build_index(point_lat, point_lon)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        query, row, _ = within(index, lat, lon, args.radius)
+        radius_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        rows, miles = nearest(index, lat, lon, args.k)
+        nearest_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        expected_pairs, _, expected_miles = brute_force(lat, lon, point_lat, point_lon, args.radius, args.k)
+        brute = time.perf_counter() - start
+
+        # Rows can tie on distance (several providers at one address), so nearest is checked by its distances
+        agree = same_pairs(query, row, expected_pairs) and np.array_equal(miles, expected_miles) and \
+            np.array_equal(haversine(lat[:, None], lon[:, None], point_lat[rows], point_lon[rows]), miles)
+        ok = ok and agree
+        print(f"{name + ' ' + str(len(point_lat)):>16}{built * 1000:>10.1f}{radius_seconds:>10.3f}{len(query):>10}"
+              f"{nearest_seconds:>11.3f}{brute:>9.2f}{brute / (radius_seconds + nearest_seconds):>8.0f}x  "
+              f"{'same' if agree else 'DIFFERENT'}")
+
+    # Catchment distances for points around the catchment, against every boundary edge
+    near_lat, near_lon = spread(args.queries, (bounds[0] - 2, bounds[1] - 2, bounds[2] + 2, bounds[3] + 2), rng)
+    start = time.perf_counter()
+    miles = catchment_distance(catchment, near_lat, near_lon)
+    seconds = time.perf_counter() - start
+    outside = miles > 0
+    vectors, starts = catchment['vectors'], np.flatnonzero(catchment['starts'])
+    points = unit_vectors(near_lat[outside], near_lon[outside])
+    expected = np.array([edge_distance(np.repeat(point[None], len(starts), axis=0), vectors[starts],
+                                       vectors[starts + 1]).min() for point in points])
+    agree = np.allclose(miles[outside], expected, rtol=1e-12, atol=1e-9)
+    ok = ok and agree
+    print(f"catchment distance: {len(near_lat)} points ({outside.sum()} outside), {len(starts)} boundary edges, "
+          f"{seconds:.3f} s, {'same as' if agree else 'DIFFERENT from'} every edge")
+    if not ok:
+        sys.exit('index answers differ from brute force')
+
+
+if __name__ == '__main__':
+    main()
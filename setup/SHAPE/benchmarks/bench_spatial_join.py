@@ -0,0 +1,99 @@
+# Benchmark: STRtree point in polygon assignment (spatial_join.py) against testing outlines one at a time
+#
+# Points are the facilities_and_providers rows with coordinates plus --points random
+# points over the catchment's bounding box (about half of them fall outside it). For
+# county_sf and tract_sf it times
+#   - read_layer (shapefile, prepare, STRtree)
+#   - assign for all the points
+#   - a loop over the outlines testing every point against each (unprepared, vectorized
+#     over the points), which is the check the answers are compared with
+#   - a loop over --sample points testing each against the outlines in turn until one
+#     holds it, the way it's done one object at a time, scaled up to all the points
+# and exits non-zero if assign's GEOIDs differ from the per outline loop's.
+#
+#   python setup/SHAPE/benchmarks/bench_spatial_join.py [--points 10000 50000 200000] [--sample 200]
+
+import argparse
+import os
+import sys
+import time
+
+SHAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(SHAPE_DIR))
+sys.path.insert(0, SHAPE_DIR)
+
+import numpy as np
+import pandas as pd
+
+from spatial_index import latest_locations, read_locations
+from spatial_join import FACILITIES, assign, read_layer
+
+
+def per_outline(layer, lat, lon):
+    # GEOID of each point from testing every point against one outline at a time, lowest GEOID first
+    import shapely
+
+    geoids = np.full(len(lat), np.nan, dtype=object)
+    for shape in np.argsort(layer['rank'], kind='stable'):
+        inside = pd.isna(geoids) & shapely.intersects_xy(shapely.from_wkb(shapely.to_wkb(layer['shapes'][shape])), lon, lat)
+        geoids[inside] = layer['geoids'][shape]
+    return geoids
+
+
+def per_point(layer, lat, lon):
+    # GEOID of each point from testing it against the outlines in turn
+    import shapely
+
+    order = np.argsort(layer['rank'], kind='stable')
+    shapes = shapely.from_wkb(shapely.to_wkb(layer['shapes'][order]))
+    geoids = []
+    for y, x in zip(lat, lon):
+        point = shapely.Point(x, y)
+        geoids.append(next((layer['geoids'][order[i]] for i, shape in enumerate(shapes) if shape.intersects(point)), np.nan))
+    return np.array(geoids, dtype=object)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='STRtree point in polygon vs outline at a time loops')
+    parser.add_argument('--points', type=int, nargs='+', default=[10000, 50000, 200000])
+    parser.add_argument('--sample', type=int, default=200, help='points for the one point at a time loop')
+    args = parser.parse_args()
+
+    os.chdir(REPO_DIR)
+    rng = np.random.default_rng(0)
+    facilities = read_locations(latest_locations(FACILITIES))
+    facilities = facilities[facilities['latitude'].notna()]
+
+    ok = True
+    print(f"{'level':>7}{'outlines':>10}{'points':>9}{'read s':>8}{'assign s':>10}{'per outline s':>15}"
+          f"{'per point s':>13}{'assigned':>10}  answers")
+    for level in ('county', 'tract'):
+        start = time.perf_counter()
+        layer = read_layer(level)
+        read = time.perf_counter() - start
+        low_lon, low_lat, high_lon, high_lat = np.array([shape.bounds for shape in layer['shapes']]).T
+        for count in args.points:
+            lat = np.concatenate([facilities['latitude'].to_numpy(), rng.uniform(low_lat.min(), high_lat.max(), count)])
+            lon = np.concatenate([facilities['longitude'].to_numpy(), rng.uniform(low_lon.min(), high_lon.max(), count)])
+            start = time.perf_counter()
+            geoids = assign(layer, lat, lon)
+            seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            expected = per_outline(layer, lat, lon)
+            outline_seconds = time.perf_counter() - start
+            sample = rng.choice(len(lat), min(args.sample, len(lat)), replace=False)
+            start = time.perf_counter()
+            sampled = per_point(layer, lat[sample], lon[sample])
+            point_seconds = (time.perf_counter() - start) * len(lat) / len(sample)
+
+            agree = pd.Series(geoids).equals(pd.Series(expected)) and pd.Series(geoids[sample]).equals(pd.Series(sampled))
+            ok = ok and agree
+            print(f"{level:>7}{len(layer['shapes']):>10}{len(lat):>9}{read:>8.2f}{seconds:>10.3f}{outline_seconds:>15.2f}"
+                  f"{point_seconds:>12.0f}*{pd.notna(geoids).sum():>10}  {'same' if agree else 'DIFFERENT'}")
+    print('* scaled up from --sample points')
+    if not ok:
+        sys.exit('STRtree assignment differs from testing outlines one at a time')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# Pre-joined geometry bundles for the Shiny apps
+#
+# Every app container starts by decoding tract_sf.shp, county_sf.shp, roads_sf.shp and
+# fd.shp with st_read and joining the all_* CSVs onto them. This build step does that
+# work once and writes the result per geography level to ShinyCIF/www/bundle:
+#
+#   <level>.arrow    Arrow IPC file, uncompressed so it can be memory mapped as is
+#   <level>.parquet  the same table as GeoParquet (zstd, plain WKB) for tools that want Parquet
+#
+# A level's bundle is its all_* rows (the Parquet dataset's columns, see
+# parquet_dataset.py) with the geography's outline in a WKB geometry column, i.e. the
+# right join the apps do at start up. The geometry column is dictionary encoded: each
+# outline is stored once and the rows only hold its index, so the join costs 4 bytes a
+# row. roads_sf, fd and county_border_sf are drawn as they are, so they get geometry
+# only bundles (their shapefile fields plus geometry) under their own names.
+#
+# Both files carry GeoParquet 'geo' metadata (WKB encoding, geometry types, bbox and the
+# shapefile's CRS), which is also what geopandas writes for Feather. Reading a bundle is
+# a memory map plus WKB decoding of the distinct outlines, with no shapefile parsing.
+#
+# Needs pyogrio (shapefiles to Arrow), shapely and pyarrow.
+#
+# Run it after the pull and the shapefile setup, from the repo root:
+#   python setup/SHAPE/bundle.py [--www ShinyCIF/www]
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from specs import TARGETS
+from normalize import read_long
+from parquet_dataset import dataset_frame, schema
+
+BUNDLE_DIR = 'bundle'
+SHAPEFILE_DIR = 'shapefiles'
+
+# Shapefile and the field holding its GEOID for each level
+LEVEL_SHAPES = {
+    'state': ('state_border_sf', 'STATEFP'),
+    'county': ('county_sf', 'GEOID'),
+    'tract': ('tract_sf', 'GEOID'),
+}
+
+# Layers the apps draw without joining anything onto them
+LAYERS = ['roads_sf', 'fd', 'county_border_sf']
+
+GEOMETRY = 'geometry'
+
+# Room for every distinct outline in the Parquet dictionary page, so repeats stay indices
+DICTIONARY_PAGE_BYTES = 256 * 2**20
+
+
+def read_shapes(path):
+    # Shapefile as an Arrow table with its geometry as WKB in a column named geometry,
+    # plus the CRS (PROJJSON) pyogrio found for it
+    import pyogrio
+
+    meta, table = pyogrio.read_arrow(path)
+    name = meta['geometry_name'] or 'wkb_geometry'
+    extension = json.loads((table.schema.field(name).metadata or {}).get(b'ARROW:extension:metadata', b'{}'))
+    geometry = table.column(name)
+    table = table.drop_columns([column for column in (name, meta['fid_column']) if column in table.column_names])
+    # A plain binary column (no geoarrow field metadata) so every Arrow reader takes it
+    return table.append_column(GEOMETRY, geometry), extension.get('crs')
+
+
+def geo_metadata(wkb, crs):
+    # GeoParquet 1.0 column metadata for a WKB column, from its distinct geometries
+    import shapely
+
+    geometries = shapely.from_wkb(wkb)
+    types = sorted({shapely.get_type_id(geometry) for geometry in geometries if geometry is not None})
+    names = ['Point', 'LineString', 'LinearRing', 'Polygon', 'MultiPoint', 'MultiLineString', 'MultiPolygon',
+             'GeometryCollection']
+    bounds = shapely.total_bounds(geometries)
+    column = {'encoding': 'WKB', 'geometry_types': [names[kind] for kind in types],
+              'bbox': [float(value) for value in bounds]}
+    if crs is not None:
+        column['crs'] = crs
+    return {'version': '1.0.0', 'primary_column': GEOMETRY, 'columns': {GEOMETRY: column}}
+
+
+def join_geometry(frame, shapes, key):
+    # Arrow table of the long rows with each row's outline as a dictionary index into the shapes
+    import pyarrow as pa
+
+    geoids = shapes.column(key).to_pandas()
+    positions = pd.Index(geoids).get_indexer(frame['GEOID'])
+    indices = pa.array(positions, type=pa.int32(), mask=positions < 0)
+    geometry = pa.DictionaryArray.from_arrays(indices, shapes.column(GEOMETRY).combine_chunks())
+    table = pa.Table.from_pandas(frame, schema=schema(), preserve_index=False)
+    return table.append_column(GEOMETRY, geometry)
+
+
+def plain_geometry(table):
+    # The table with a dictionary encoded geometry column turned back into plain binary
+    import pyarrow as pa
+
+    geometry = table.column(GEOMETRY)
+    if not pa.types.is_dictionary(geometry.type):
+        return table
+    decoded = pa.chunked_array([chunk.dictionary_decode() for chunk in geometry.chunks], type=pa.binary())
+    return table.set_column(table.schema.get_field_index(GEOMETRY), GEOMETRY, decoded)
+
+
+def write_bundle(table, crs, wkb, path):
+    # The table as an uncompressed Arrow IPC file and as GeoParquet, with the geo metadata on both
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'geo'] = json.dumps(geo_metadata(wkb, crs)).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for extension in ('arrow', 'parquet'):
+        final = f'{path}.{extension}'
+        if extension == 'arrow':
+            with pa.OSFile(final + '.partial', 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            # GeoParquet wants the geometry as plain WKB, Parquet dictionary encodes it on disk anyway
+            pq.write_table(plain_geometry(table), final + '.partial', compression='zstd',
+                           dictionary_pagesize_limit=DICTIONARY_PAGE_BYTES)
+        os.replace(final + '.partial', final)
+    return [f'{path}.{extension}' for extension in ('arrow', 'parquet')]
+
+
+def level_bundle(level, www):
+    # Bundle for one level: its all_* rows joined to the level's outlines
+    name, key = LEVEL_SHAPES[level]
+    shapes, crs = read_shapes(os.path.join(www, SHAPEFILE_DIR, f'{name}.shp'))
+    csv = os.path.join(www, 'data', os.path.basename(TARGETS[level]))
+    frame = dataset_frame(read_long(csv), level)
+    table = join_geometry(frame, shapes, key)
+    missing = table.column(GEOMETRY).null_count
+    if missing:
+        print(f'  {level}: {missing} rows have no outline in {name}.shp')
+    paths = write_bundle(table, crs, shapes.column(GEOMETRY).to_numpy(zero_copy_only=False),
+                         os.path.join(www, BUNDLE_DIR, level))
+    print(f'  {level}: {table.num_rows} rows, {shapes.num_rows} outlines, '
+          f'{os.path.getsize(paths[0]) / 1e6:.1f} MB arrow, {os.path.getsize(paths[1]) / 1e6:.1f} MB parquet')
+    return paths
+
+
+def layer_bundle(name, www):
+    # Geometry only bundle for a layer the apps draw as is
+    shapes, crs = read_shapes(os.path.join(www, SHAPEFILE_DIR, f'{name}.shp'))
+    paths = write_bundle(shapes, crs, shapes.column(GEOMETRY).to_numpy(zero_copy_only=False),
+                         os.path.join(www, BUNDLE_DIR, name))
+    print(f'  {name}: {shapes.num_rows} features, {os.path.getsize(paths[0]) / 1e6:.1f} MB arrow')
+    return paths
+
+
+def write_bundles(www='ShinyCIF/www'):
+    # Every level and layer whose inputs are there
+    paths = []
+    for level, (name, _) in LEVEL_SHAPES.items():
+        if os.path.exists(os.path.join(www, SHAPEFILE_DIR, f'{name}.shp')) and \
+                os.path.exists(os.path.join(www, 'data', os.path.basename(TARGETS[level]))):
+            paths += level_bundle(level, www)
+    for name in LAYERS:
+        if os.path.exists(os.path.join(www, SHAPEFILE_DIR, f'{name}.shp')):
+            paths += layer_bundle(name, www)
+    return paths
+
+
+def load_bundle(path):
+    # A bundle's table memory mapped (zero copy), with the geometry column still WKB
+    import pyarrow as pa
+
+    # The table's buffers point into the map, which stays open as long as they do
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def outlines(table):
+    # shapely geometries for every row of a bundle, decoding each distinct outline once
+    import pyarrow as pa
+    import shapely
+
+    geometry = table.column(GEOMETRY).combine_chunks()
+    if not pa.types.is_dictionary(geometry.type):
+        # Layer bundles hold one geometry per row
+        return shapely.from_wkb(geometry.to_numpy(zero_copy_only=False))
+    decoded = np.append(shapely.from_wkb(geometry.dictionary.to_numpy(zero_copy_only=False)), None)
+    indices = geometry.indices.fill_null(-1).to_numpy()
+    return decoded[indices]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the pre-joined geometry bundles for the Shiny apps')
+    parser.add_argument('--www', default='ShinyCIF/www', help='app www folder with data/ and shapefiles/')
+    args = parser.parse_args()
+    print(f'writing bundles to {os.path.join(args.www, BUNDLE_DIR)}')
+    write_bundles(args.www)
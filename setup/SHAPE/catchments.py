@@ -0,0 +1,153 @@
+# Multi-catchment pulls for the SHAPE pull
+#
+# The regular pull builds one catchment (AWS in pull_shape_db.py) into the repo's
+# ShinyCIF tree. With OPTIONS['catchments'] pointing at a JSON file of catchment
+# definitions, every SHAPE table is read once for all of them (filtered in SQL to the
+# union of their states), each table's rows are split between the catchments in one
+# pass over its state column, and each catchment's all_* files, Parquet dataset, measure
+# dictionary and run report are written to its own output tree, side by side on --jobs
+# worker processes.
+#
+# The definitions file maps catchment names to their states and output tree:
+#
+#   {"huntsman": {"states": ["Utah", "Idaho", "Wyoming", "Montana", "Nevada"], "root": "."},
+#    "example": {"states": ["Colorado", "New Mexico"]}}
+#
+# A tree mirrors the repo layout (<root>/ShinyCIF/www/data/all_state.csv, ...) and
+# defaults to setup/SHAPE/data/catchments/<name>. Its measure dictionary starts out as a
+# copy of the repo's, the same file a regular pull adds its measures to.
+#
+# A catchment pull always reads and writes every selected table, so checkpoints,
+# incremental skips, streaming and normalized output are regular pull features only.
+
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from specs import TARGETS, MEASURE_DICTIONARY
+from pull_shape_db import load_login, select_specs
+
+CATCHMENTS_DIR = 'setup/SHAPE/data/catchments'
+
+
+def load(path):
+    # Catchment definitions by name, each with its states and output root
+    catchments = json.load(open(path))
+    if not catchments:
+        raise Exception(f'No catchments defined in {path}')
+    for name, catchment in catchments.items():
+        if not catchment.get('states'):
+            raise Exception(f'Catchment {name} in {path} has no states')
+        catchment.setdefault('root', os.path.join(CATCHMENTS_DIR, name))
+    return catchments
+
+
+def partition(df, spec, areas):
+    # One table's rows for each catchment, from a single factorize of its state column
+    # areas gives each catchment's filter values, keyed by filter_on ('name' or 'fips')
+    from geography import geoid
+
+    states = df[spec['filter_col']]
+    if spec['filter_on'] == 'fips':
+        states = geoid(states, 'state')
+    codes, uniques = pd.factorize(states)
+    parts = {}
+    for name, area in areas.items():
+        # The extra False is for missing states (code -1)
+        member = np.append(pd.Index(uniques).isin(area[spec['filter_on']]), False)
+        parts[name] = df[member[codes]]
+    return parts
+
+
+def seed_tree(root):
+    # Output folders for a catchment tree, with the repo's measure dictionary to add to
+    for target in TARGETS.values():
+        os.makedirs(os.path.dirname(os.path.join(root, target)), exist_ok=True)
+    dictionary = os.path.join(root, MEASURE_DICTIONARY)
+    if not os.path.exists(dictionary):
+        os.makedirs(os.path.dirname(dictionary), exist_ok=True)
+        shutil.copyfile(MEASURE_DICTIONARY, dictionary)
+
+
+def write_catchment(name, root, specs, frames, geo, area, timings, options, quiet=False):
+    # Transform and write one catchment's tables into its tree, in spec order
+    import report
+    from pipeline import transform, write
+    from writers import finish
+    from parquet_dataset import write_parquet
+
+    if not quiet:
+        print(f'{name}: writing {len(specs)} tables to {root}')
+    seed_tree(root)
+    run = report.start_run(dict(options, catchment=name, profile=None))
+    report.record_queries(run, specs, timings)
+    for spec in specs:
+        long = transform(frames.pop(spec['name']), spec, geo, area['name'], area['fips'], run)
+        write(long, spec, run, root, options['csv_writer'])
+    finish()
+    if options['parquet']:
+        for level in TARGETS:
+            if os.path.exists(os.path.join(root, TARGETS[level])):
+                write_parquet(level, root)
+    return report.finish_run(run, os.path.join(root, report.REPORT_PATH), quiet)
+
+
+def run(options):
+    # One national read fanned out to every catchment in options['catchments']
+    from extract import create_engine, extract, report_timings
+    from geography import load_registry, catchment_index, catchment, catchment_fips
+    from schema import compact_geography
+
+    catchments = load(options['catchments'])
+    print(f"pull shape for {len(catchments)} catchments: {', '.join(catchments)}")
+    login = load_login()
+    engine = create_engine(login, options['max_concurrency'])
+
+    # Geography and filter values for each catchment, and their union for the reads
+    registry = load_registry(engine, options['refresh_geography'])
+    geos = {}
+    areas = {}
+    for name, definition in catchments.items():
+        index = catchment_index(registry, definition['states'])
+        geos[name] = catchment(registry, index)
+        if options['compact_dtypes']:
+            geos[name] = compact_geography(geos[name])
+        areas[name] = {'name': list(definition['states']), 'fips': catchment_fips(registry, index)}
+    states = list(dict.fromkeys(state for area in areas.values() for state in area['name']))
+    fips = list(dict.fromkeys(code for area in areas.values() for code in area['fips']))
+
+    # Every table is read once for all the catchments
+    specs, _ = select_specs(dict(options, streaming=False))
+    try:
+        frames, timings = extract(engine, specs, states, fips, options['max_concurrency'], options['pushdown'],
+                                  reader=options['reader'], compact=options['compact_dtypes'])
+    finally:
+        engine.dispose()
+    report_timings(timings)
+
+    # Split each table between the catchments
+    parts = {name: {} for name in catchments}
+    for spec in specs:
+        for name, part in partition(frames.pop(spec['name']), spec, areas).items():
+            parts[name][spec['name']] = part
+    print('pulled data from database')
+
+    # Catchments are written side by side on --jobs worker processes, same as datasets in the pull
+    jobs = min(options['jobs'], len(catchments))
+    reports = {}
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {name: pool.submit(write_catchment, name, catchments[name]['root'], specs, parts.pop(name),
+                                         geos[name], areas[name], timings, options)
+                       for name in catchments}
+            for name, future in futures.items():
+                reports[name] = future.result()
+    else:
+        for name in catchments:
+            reports[name] = write_catchment(name, catchments[name]['root'], specs, parts.pop(name), geos[name],
+                                            areas[name], timings, options)
+    return reports
@@ -0,0 +1,121 @@
+# Resumable runs for the SHAPE pull
+#
+# Each table's work is a chain of three nodes, extract -> transform -> write, and the
+# writes into one output file are chained in spec order (a table's write depends on
+# the write before it into the same file). Every node gets a fingerprint of what it
+# depends on:
+#   extract    the table spec, the area we serve, pushdown, the ingest schema and the
+#              extract code
+#   transform  the extract fingerprint, the table's definitions/formats, the geography
+#              and the transform code
+#   write      the transform fingerprint and the previous write into the same file
+# so changing a spec, a lookup file or the code invalidates that node and everything
+# downstream of it, and nothing else.
+#
+# Extract and transform outputs are checkpointed as Parquet files (pickle if pyarrow
+# isn't installed or can't hold a column) named by node and fingerprint, and finished
+# writes leave a marker file. A rerun after a failure (say a dropped ODBC connection in
+# the middle of HINTS) picks every table up from its last finished node. The
+# checkpoints are removed once a run finishes.
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from specs import TARGETS
+
+CHECKPOINT_DIR = 'setup/SHAPE/data/checkpoints'
+SHAPE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Code each node's output depends on
+EXTRACT_CODE = ['extract.py', 'schema.py']
+TRANSFORM_CODE = ['pipeline.py', 'formats.py', 'geography.py']
+
+
+def fingerprint(*parts):
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def file_hash(paths):
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def frame_hash(frame):
+    return int(pd.util.hash_pandas_object(frame, index=False).sum())
+
+
+def plan(specs, geo, aws, aws_fips, options, data_dir='setup/SHAPE/data'):
+    # Fingerprints of every node, keyed by table name then stage
+    extract_code = file_hash([os.path.join(SHAPE_DIR, name) for name in EXTRACT_CODE])
+    transform_code = file_hash([os.path.join(SHAPE_DIR, name) for name in TRANSFORM_CODE])
+    geography = fingerprint({level: frame_hash(frame) for level, frame in geo.items()})
+
+    nodes = {}
+    last_write = {}
+    for spec in specs:
+        target = TARGETS[spec['level']]
+        lookups = file_hash([f"{data_dir}/definitions/{spec['lookup']}.json", f"{data_dir}/formats/{spec['lookup']}.json"])
+        extract = fingerprint('extract', spec, aws, aws_fips, options['pushdown'], options['compact_dtypes'], extract_code)
+        transform = fingerprint('transform', extract, lookups, geography, transform_code)
+        write = fingerprint('write', transform, target, last_write.get(target))
+        last_write[target] = write
+        nodes[spec['name']] = {'extract': extract, 'transform': transform, 'write': write}
+    return nodes
+
+
+def path(name, stage, key, extension, directory=CHECKPOINT_DIR):
+    return os.path.join(directory, f'{name}.{stage}.{key}.{extension}')
+
+
+def load(name, stage, key, directory=CHECKPOINT_DIR):
+    # A node's checkpointed frame, or None if it hasn't finished with this fingerprint
+    parquet = path(name, stage, key, 'parquet', directory)
+    if os.path.exists(parquet):
+        return pd.read_parquet(parquet)
+    pickle = path(name, stage, key, 'pkl', directory)
+    if os.path.exists(pickle):
+        return pd.read_pickle(pickle)
+    return None
+
+
+def save(name, stage, key, frame, directory=CHECKPOINT_DIR):
+    # Checkpoint a node's frame, replacing older checkpoints of the same node
+    os.makedirs(directory, exist_ok=True)
+    for old in glob.glob(os.path.join(directory, f'{name}.{stage}.*')):
+        os.remove(old)
+    # Write next to the final name and swap in, so a crash never leaves a half written checkpoint
+    try:
+        final = path(name, stage, key, 'parquet', directory)
+        frame.to_parquet(final + '.partial', index=False)
+    except (ImportError, ValueError, TypeError, NotImplementedError) as error:
+        # No pyarrow, or a column Arrow can't hold (mixed types in an object column)
+        print(f'  {name}: {stage} checkpoint saved as pickle ({type(error).__name__})')
+        final = path(name, stage, key, 'pkl', directory)
+        frame.to_pickle(final + '.partial')
+    os.replace(final + '.partial', final)
+
+
+def finished(name, key, directory=CHECKPOINT_DIR):
+    # Whether a table's write already finished with this fingerprint
+    return os.path.exists(path(name, 'write', key, 'done', directory))
+
+
+def mark_finished(name, key, directory=CHECKPOINT_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for old in glob.glob(os.path.join(directory, f'{name}.write.*')):
+        os.remove(old)
+    open(path(name, 'write', key, 'done', directory), 'w').close()
+
+
+def clear(directory=CHECKPOINT_DIR):
+    # Drop the checkpoints once a run finished, so the next run reads SHAPE again
+    shutil.rmtree(directory, ignore_errors=True)
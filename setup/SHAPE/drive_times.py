@@ -0,0 +1,191 @@
+# Memory-mapped tract x facility drive-time matrices for the Access app
+#
+# The facility_load CSVs (simple_<ST>_CT_toFacilities_v*.csv and the merged
+# facility_load_comprehensive.csv) hold drive times as long text rows:
+#   CountyTract,FacID,FacType,minutes,miles
+#   Z49001100100,538,Gastroenterology,101.699589215,107.560727106
+# and everything that uses them parses and groups all of them again. This build step
+# compiles them once into one sparse matrix per FacType, as .npy files numpy memory maps:
+#
+#   ShinyCIFAccess/www/data/drive_times/
+#     tracts.npy                  tract GEOIDs as int64, sorted; a tract's code is its position
+#     facilities.npy              FacIDs as int64, sorted; a facility's code is its position
+#     manifest.json               FacTypes, their folders, sizes and the source files
+#     <fac_type>/by_tract_*.npy   rows by tract, nearest facility first (CSR)
+#     <fac_type>/by_facility_*.npy  rows by facility, nearest tract first (CSC)
+#
+# Each matrix is stored twice, once sorted each way. A tract's entries are
+# offsets[code]:offsets[code + 1] of the by_tract arrays (facility codes, minutes and
+# miles), already in drive-time order, so its k nearest facilities are the first k
+# entries, O(k). A facility's tracts within N minutes are a binary search into its
+# slice of the by_facility arrays. Opening a matrix maps the files without reading them
+# and builds the GEOID/FacID -> code lookups.
+#
+# Build from the repo root with:  python setup/SHAPE/drive_times.py [CSV ...]
+# then query with:
+#   matrix = open_matrix('Mammography')
+#   nearest(matrix, '49001100100', k=3)    [(FacID, minutes, miles), ...]
+#   within(matrix, 538, 30)                [(GEOID, minutes, miles), ...]
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+
+FACILITY_LOAD_DIR = 'ShinyCIFAccess/www/data/facility_load'
+DRIVE_TIME_DIR = 'ShinyCIFAccess/www/data/drive_times'
+
+# Per state source files (the comprehensive file is these merged)
+SOURCES = os.path.join(FACILITY_LOAD_DIR, 'simple_*_CT_toFacilities_v*.csv')
+
+COLUMNS = {'CountyTract': str, 'FacID': 'int64', 'FacType': str, 'minutes': 'float64', 'miles': 'float64'}
+
+# Arrays stored for each direction, and their dtypes
+ARRAYS = {'offsets': 'int64', 'codes': 'int32', 'minutes': 'float64', 'miles': 'float64'}
+
+
+def slug(fac_type):
+    # Folder name for a FacType ('Lung Cancer Screening' -> lung_cancer_screening)
+    return re.sub(r'[^a-z0-9]+', '_', fac_type.lower()).strip('_')
+
+
+def tract_geoid(values):
+    # CountyTract text ('Z49001100100') or GEOIDs to int64 GEOIDs
+    return pd.to_numeric(pd.Series(values, dtype=str).str.lstrip('Z'), errors='raise').astype('int64').to_numpy()
+
+
+def tract_key(geoid):
+    # One tract's int64 GEOID, from CountyTract text, GEOID text or a number
+    return int(str(geoid).lstrip('Z'))
+
+
+def mapped(path):
+    # A .npy file memory mapped, as a plain ndarray view (memmap slicing has Python overhead)
+    return np.asarray(np.load(path, mmap_mode='r'))
+
+
+def read_sources(paths):
+    # The drive-time rows of every source file, one row per tract/facility pair
+    frames = [pd.read_csv(path, usecols=list(COLUMNS), dtype=COLUMNS) for path in paths]
+    rows = pd.concat(frames, ignore_index=True)
+    rows['GEOID'] = tract_geoid(rows['CountyTract'])
+    # A pair listed in more than one file keeps its shortest drive
+    rows = rows.sort_values('minutes', kind='stable').drop_duplicates(['GEOID', 'FacID', 'FacType'])
+    return rows.drop(columns='CountyTract')
+
+
+def compressed(rows, major, minor, size):
+    # CSR arrays of rows grouped by the major codes, each group sorted by minutes
+    order = np.lexsort((rows['minutes'].to_numpy(), rows[major].to_numpy()))
+    counts = np.bincount(rows[major].to_numpy(), minlength=size)
+    return {
+        'offsets': np.concatenate([[0], np.cumsum(counts)]),
+        'codes': rows[minor].to_numpy()[order],
+        'minutes': rows['minutes'].to_numpy()[order],
+        'miles': rows['miles'].to_numpy()[order],
+    }
+
+
+def build(paths=None, directory=DRIVE_TIME_DIR):
+    # Compile the source CSVs into the matrices, replacing what's in directory
+    paths = sorted(glob.glob(SOURCES)) if paths is None else paths
+    if not paths:
+        raise Exception(f'No drive-time files match {SOURCES}')
+    rows = read_sources(paths)
+
+    tracts = np.unique(rows['GEOID'].to_numpy())
+    facilities = np.unique(rows['FacID'].to_numpy())
+    rows['tract'] = np.searchsorted(tracts, rows['GEOID'].to_numpy()).astype('int32')
+    rows['facility'] = np.searchsorted(facilities, rows['FacID'].to_numpy()).astype('int32')
+
+    # Write next to the old matrices and swap them in, so readers never see half of them
+    staging = directory + '.staging'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    np.save(os.path.join(staging, 'tracts.npy'), tracts)
+    np.save(os.path.join(staging, 'facilities.npy'), facilities)
+
+    manifest = {'tracts': len(tracts), 'facilities': len(facilities), 'sources': [os.path.basename(path) for path in paths],
+                'types': {}}
+    for fac_type, group in rows.groupby('FacType', sort=True):
+        folder = os.path.join(staging, slug(fac_type))
+        os.makedirs(folder)
+        for name, major, minor, size in [('by_tract', 'tract', 'facility', len(tracts)),
+                                         ('by_facility', 'facility', 'tract', len(facilities))]:
+            for array, values in compressed(group, major, minor, size).items():
+                np.save(os.path.join(folder, f'{name}_{array}.npy'), values.astype(ARRAYS[array]))
+        manifest['types'][fac_type] = {'folder': slug(fac_type), 'pairs': len(group),
+                                       'tracts': int(group['tract'].nunique()),
+                                       'facilities': int(group['facility'].nunique())}
+        print(f"  {fac_type}: {len(group)} pairs, {manifest['types'][fac_type]['tracts']} tracts, "
+              f"{manifest['types'][fac_type]['facilities']} facilities")
+    with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(staging, directory)
+    return manifest
+
+
+def open_matrix(fac_type, directory=DRIVE_TIME_DIR):
+    # One FacType's matrix with its arrays memory mapped, plus the GEOID and FacID lookups
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if fac_type not in manifest['types']:
+        raise Exception(f"No drive times for {fac_type} in {directory}, expected one of {list(manifest['types'])}")
+    folder = os.path.join(directory, manifest['types'][fac_type]['folder'])
+    matrix = {'fac_type': fac_type,
+              'tracts': mapped(os.path.join(directory, 'tracts.npy')),
+              'facilities': mapped(os.path.join(directory, 'facilities.npy'))}
+    for name in ('by_tract', 'by_facility'):
+        matrix[name] = {array: mapped(os.path.join(folder, f'{name}_{array}.npy')) for array in ARRAYS}
+    matrix['tract_code'] = dict(zip(matrix['tracts'].tolist(), range(len(matrix['tracts']))))
+    matrix['facility_code'] = dict(zip(matrix['facilities'].tolist(), range(len(matrix['facilities']))))
+    return matrix
+
+
+def entries(arrays, code, stop=None):
+    # Slice of one row of a compressed matrix, optionally only its first stop entries
+    start, end = int(arrays['offsets'][code]), int(arrays['offsets'][code + 1])
+    if stop is not None:
+        end = min(end, start + stop)
+    return slice(start, end)
+
+
+def nearest(matrix, geoid, k=1):
+    # The k facilities of the matrix's type with the shortest drive from a tract, nearest first
+    code = matrix['tract_code'].get(tract_key(geoid))
+    if code is None:
+        return []
+    arrays = matrix['by_tract']
+    rows = entries(arrays, code, k)
+    facilities = matrix['facilities'][arrays['codes'][rows]]
+    return list(zip(facilities.tolist(), arrays['minutes'][rows].tolist(), arrays['miles'][rows].tolist()))
+
+
+def within(matrix, fac_id, minutes):
+    # Every tract within minutes of drive from a facility, nearest first, GEOIDs as 11 digit text
+    code = matrix['facility_code'].get(int(fac_id))
+    if code is None:
+        return []
+    arrays = matrix['by_facility']
+    rows = entries(arrays, code)
+    stop = rows.start + int(np.searchsorted(arrays['minutes'][rows], minutes, side='right'))
+    rows = slice(rows.start, stop)
+    tracts = matrix['tracts'][arrays['codes'][rows]]
+    return list(zip([f'{geoid:011d}' for geoid in tracts.tolist()], arrays['minutes'][rows].tolist(),
+                    arrays['miles'][rows].tolist()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile the facility_load drive times into memory-mapped matrices')
+    parser.add_argument('sources', nargs='*', help=f'drive-time CSVs (default {SOURCES})')
+    parser.add_argument('--out', default=DRIVE_TIME_DIR)
+    args = parser.parse_args()
+    print(f'writing drive-time matrices to {args.out}')
+    build(args.sources or None, args.out)
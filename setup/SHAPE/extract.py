@@ -0,0 +1,186 @@
+# Extraction stage for the SHAPE pull
+#
+# Table reads are independent of each other, so they run concurrently on a bounded
+# thread pool. Each worker checks a connection out of the engine's pool, which is
+# sized to the same limit so we never hold more than max_concurrency connections
+# against the SHAPE SQL Server.
+#
+# With pushdown on, each read only asks for catchment rows and the columns the
+# transform actually uses, instead of pulling the national table with select *.
+
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import sqlalchemy as sa
+
+from readers import READERS
+from schema import compact as compact_frame, frame_mb
+
+# Rough in-memory cost of one long row while it is melted and enriched
+LONG_ROW_BYTES = 1024
+
+
+def create_engine(login, max_concurrency):
+    # Engine for SHAPE, or for a local stand-in when the login points at one
+    if login.get('standin'):
+        return standin_engine(login['standin'], max_concurrency)
+
+    connection_url = sa.engine.URL.create(
+        "mssql+pyodbc",
+        username=login['username'],
+        password=login['password'],
+        host=login['host'],
+        database="SHAPE",
+        query={'driver': 'ODBC Driver 18 for SQL Server', 'TrustServerCertificate': 'yes'}
+    )
+    return sa.create_engine(connection_url, pool_size=max_concurrency, max_overflow=0)
+
+
+def standin_engine(directory, max_concurrency):
+    # SQLite stand-in for SHAPE: one <schema>.db file per SHAPE schema (census.db, epa.db, ...)
+    # attached under the schema name so 'select * from census.StateFips' works unchanged
+    schemas = {os.path.splitext(os.path.basename(path))[0]: os.path.abspath(path)
+               for path in glob.glob(os.path.join(directory, '*.db'))}
+    if not schemas:
+        raise Exception(f'No stand-in schema files (*.db) found in {directory}')
+
+    engine = sa.create_engine('sqlite://', poolclass=sa.pool.QueuePool, pool_size=max_concurrency,
+                              max_overflow=0, connect_args={'check_same_thread': False})
+
+    @sa.event.listens_for(engine, 'connect')
+    def attach_schemas(dbapi_conn, record):
+        for schema, path in schemas.items():
+            dbapi_conn.execute(f"attach database '{path}' as {schema}")
+
+    # The Arrow reader opens its own connections and attaches the same files
+    engine.standin_schemas = schemas
+    return engine
+
+
+def build_query(spec, aws, aws_fips, conn=None, pushdown=True):
+    # Read query for one table spec
+    # Without pushdown this is the plain select * the pull has always used
+    if not pushdown:
+        query = f"select * from {spec['table']}"
+        if 'where' in spec:
+            query += f" where {spec['where']}"
+        return sa.text(query)
+
+    table = reflect(spec, conn)
+    columns = [column.name for column in table.columns]
+    query = sa.select(*[table.c[column] for column in project(spec, columns)])
+    return filter_query(query, table, spec, aws, aws_fips)
+
+
+def reflect(spec, conn):
+    schema, name = spec['table'].split('.')
+    return sa.Table(name, sa.MetaData(), schema=schema, autoload_with=conn)
+
+
+def filter_query(query, table, spec, aws, aws_fips):
+    # Filter to area we serve, binding the values with the column's own type
+    # (STATEID is an int on some tables and a string on others)
+    filter_col = table.c[spec['filter_col']]
+    if spec['filter_on'] == 'name':
+        values = list(aws)
+    elif isinstance(filter_col.type, sa.Integer):
+        values = sorted({int(x) for x in aws_fips})
+    else:
+        values = sorted({str(x) for x in aws_fips})
+    query = query.where(filter_col.in_(values))
+
+    if 'where' in spec:
+        query = query.where(sa.text(spec['where']))
+    return query
+
+
+def project(spec, columns):
+    # Columns of a table the transform needs, in table order
+    if 'columns' in spec:
+        return spec['columns']
+    needed = {spec['key'], spec['filter_col']}
+    if 'measures' in spec:
+        needed.update(spec['measures'])
+        return [column for column in columns if column in needed]
+    if '{' in spec['source']:
+        # Vintage for the source string
+        needed.update(['MONTH', 'YEAR'])
+    dropped = set(spec['drop']) - needed
+    return [column for column in columns if column not in dropped]
+
+
+def read_table(engine, spec, aws, aws_fips, pushdown=True, reader='pandas', compact=False):
+    # Read one table, timing the round trip
+    # The query is built on a pooled connection that goes back before the read, since
+    # the reader checks out its own (or opens the Arrow driver's)
+    # With compact the frame gets the ingest schema from schema.py, and the sizes before
+    # and after are returned with the timing
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        query = build_query(spec, aws, aws_fips, conn, pushdown)
+    df = READERS[reader](engine, query)
+    seconds = time.perf_counter() - start
+    sizes = {'read_mb': frame_mb(df)} if compact else {}
+    if compact:
+        df = compact_frame(df, spec)
+        sizes['mb'] = frame_mb(df)
+    return spec['name'], df, seconds, sizes
+
+
+def extract(engine, specs, aws, aws_fips, max_concurrency=4, pushdown=True, on_read=None, reader='pandas',
+            compact=False):
+    # Read every spec's table concurrently, at most max_concurrency at a time
+    # Returns the frames and the per-table timings, both keyed by spec name in spec order
+    # on_read(spec, df) is called as each table arrives, and a failed read only raises
+    # once every other read has finished, so the tables that did arrive aren't lost
+    results = {}
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        futures = {pool.submit(read_table, engine, spec, aws, aws_fips, pushdown, reader, compact): spec for spec in specs}
+        for future in as_completed(futures):
+            try:
+                name, df, seconds, sizes = future.result()
+            except Exception as error:
+                errors.append(error)
+                continue
+            if on_read is not None:
+                on_read(futures[future], df)
+            results[name] = (df, seconds, sizes)
+    if errors:
+        raise errors[0]
+
+    frames = {}
+    timings = {}
+    for spec in specs:
+        df, seconds, sizes = results[spec['name']]
+        frames[spec['name']] = df
+        timings[spec['name']] = dict({'rows': len(df), 'seconds': seconds}, **sizes)
+    return frames, timings
+
+
+def chunk_rows(engine, spec, memory_budget_mb):
+    # Rows per chunk so a melted chunk stays inside the memory budget
+    # Each input row becomes one long row per measure column, and a long row with its
+    # def/fmt/source/lbl strings costs roughly LONG_ROW_BYTES while it is being built
+    schema, name = spec['table'].split('.')
+    columns = sa.inspect(engine).get_columns(name, schema=schema)
+    return max(1000, int(memory_budget_mb * 2**20 // (len(columns) * LONG_ROW_BYTES)))
+
+
+def read_chunks(engine, spec, aws, aws_fips, rows, pushdown=True, compact=False):
+    # Stream one table in chunks of rows, holding a single connection for the whole read
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True)
+        query = build_query(spec, aws, aws_fips, conn, pushdown)
+        for chunk in pd.read_sql(query, conn, chunksize=rows):
+            yield compact_frame(chunk, spec) if compact else chunk
+
+
+def report_timings(timings):
+    # Print per-table timings, slowest first
+    for name, timing in sorted(timings.items(), key=lambda item: -item[1]['seconds']):
+        sizes = f" ({timing['read_mb']:.1f} MB read, {timing['mb']:.1f} MB compacted)" if 'mb' in timing else ''
+        print(f"  {name}: {timing['rows']} rows in {timing['seconds']:.2f}s{sizes}")
@@ -0,0 +1,409 @@
+# Merged facility drive-time file for the Access app (replaces facility_load/facility_load.R)
+#
+# facility_load.R reads every simple_<ST>_CT_toFacilities_v*.csv with readr, binds them
+# with a State column and writes facility_load_comprehensive.csv in one go, so the whole
+# merge sits in memory. This does the same merge a chunk at a time:
+#   - one worker process per state file parses it in CHUNK_ROWS chunks and writes its
+#     part of the merged CSV, plus a Parquet part with the CountyTract keys normalized to
+#     11 digit GEOIDs (no Z prefix)
+#   - the parts are then streamed into facility_load_comprehensive.csv (states in
+#     alphabetical order, like the R list) and facility_load_comprehensive.parquet
+# and reports rows, bytes and seconds per state.
+#
+# The CSV is byte for byte what write_csv gives. readr reads FacID, minutes and miles as
+# doubles and writes them with grisu3, falling back to %.17g for the ~0.4% of values
+# grisu3 gives up on, so format_doubles() runs the same grisu3 (over a whole column at
+# once, in numpy) to find those values. Values grisu3 handles come out as their shortest
+# repr, laid out the way grisu3 lays out its digits: integers with more than two
+# trailing zeros as digits and an exponent (100000 is 1e5), exponents without a + or
+# leading zeros (1e-5) and -0 as -0.
+#
+# Run it from the repo root with:  python setup/SHAPE/facility_load.py [--jobs 4]
+
+import argparse
+import glob
+import math
+import os
+import re
+import shutil
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from drive_times import FACILITY_LOAD_DIR
+
+COMPREHENSIVE = 'ShinyCIFAccess/www/data/facility_load_comprehensive.csv'
+
+# Source files are simple_<state>_CT_toFacilities_v<version>.csv, the latest version of each state is used
+SOURCE = re.compile(r'simple_([A-Z]{2})_CT_toFacilities_v(\d+)\.csv$')
+
+COLUMNS = ['CountyTract', 'FacID', 'FacType', 'minutes', 'miles']
+DOUBLES = ['FacID', 'minutes', 'miles']
+
+# Rows parsed and written at a time per state
+CHUNK_ROWS = 100000
+
+
+# ----- readr's double formatting -----
+# grisu3 as in the double-to-string code readr writes with (Loitsch 2010), only to tell
+# whether it finds the shortest digits for a value; its digits are always repr's
+
+MASK64 = (1 << 64) - 1
+POW10 = [0] + [10 ** i for i in range(10)]
+
+
+def cached_powers():
+    # 64 bit significand and binary exponent of 10^k for k = -348, -340, ..., 340 (rounded)
+    powers = []
+    for k in range(-348, 341, 8):
+        if k >= 0:
+            n = 10 ** k
+            e = n.bit_length() - 64
+            f = (n + (1 << (e - 1))) >> e if e > 0 else n << -e
+        else:
+            d = 10 ** -k
+            s = 63 + d.bit_length()
+            while ((1 << s) + d // 2) // d >= 1 << 64:
+                s -= 1
+            while ((1 << s) + d // 2) // d < 1 << 63:
+                s += 1
+            f, e = ((1 << s) + d // 2) // d, -s
+        powers.append((f, e))
+    return powers
+
+
+CACHED_POWERS = cached_powers()
+
+
+def multiply(x, y):
+    # Product of two 64 bit floating point numbers (significand, exponent), rounded to 64 bits
+    return (x[0] * y[0] + (1 << 63)) >> 64, x[1] + y[1] + 64
+
+
+def normalize(f, e):
+    shift = 64 - f.bit_length()
+    return f << shift, e - shift
+
+
+def round_weed(digits, distance, delta, rest, ten_kappa, unit):
+    # Round the last digit towards the value, False if the result may not be the closest
+    low = (distance - unit) & MASK64
+    high = (distance + unit) & MASK64
+    while rest < low and delta - rest >= ten_kappa and \
+            (rest + ten_kappa < low or low - rest >= rest + ten_kappa - low):
+        digits[-1] -= 1
+        rest += ten_kappa
+    if rest < high and delta - rest >= ten_kappa and \
+            (rest + ten_kappa < high or high - rest > rest + ten_kappa - high):
+        return False
+    return 2 * unit <= rest <= (delta - 4 * unit) & MASK64
+
+
+def grisu3(value):
+    # True if grisu3 finds the shortest digits of a positive finite double
+    bits = struct.unpack('<Q', struct.pack('<d', value))[0]
+    fraction, biased = bits & ((1 << 52) - 1), bits >> 52 & 0x7ff
+    f, e = (fraction + (1 << 52), biased - 1075) if biased else (fraction, -1074)
+    w = normalize(f, e)
+    plus = normalize((f << 1) + 1, e - 1)
+    # The lower boundary is closer when the significand is a power of two
+    minus = ((f << 2) - 1, e - 2) if not fraction and biased else ((f << 1) - 1, e - 1)
+    minus = (minus[0] << (minus[1] - plus[1]), plus[1])
+
+    # Scale by the cached power of ten that puts the exponent in [-60, -32]
+    k = math.ceil((-61 - w[1]) * 0.30102999566398114)
+    power = CACHED_POWERS[int((k + 347) / 8) + 1]
+    w, minus, plus = multiply(w, power), multiply(minus, power), multiply(plus, power)
+
+    # Generate digits until the rest is inside the unsafe interval
+    unit = 1
+    too_high = plus[0] + unit
+    unsafe = too_high - (minus[0] - unit)
+    shift = -w[1]
+    one = 1 << shift
+    integrals, fractionals = too_high >> shift, too_high & (one - 1)
+    kappa = ((64 - shift + 1) * 1233 >> 12) + 1
+    if integrals < POW10[kappa]:
+        kappa -= 1
+    divisor = POW10[kappa]
+    digits = []
+    while kappa > 0:
+        digits.append(integrals // divisor)
+        integrals %= divisor
+        kappa -= 1
+        rest = (integrals << shift) + fractionals
+        if rest < unsafe:
+            return round_weed(digits, too_high - w[0], unsafe, rest, divisor << shift, unit)
+        divisor //= 10
+    while True:
+        fractionals *= 10
+        unit *= 10
+        unsafe *= 10
+        digits.append(fractionals >> shift)
+        fractionals &= one - 1
+        if fractionals < unsafe:
+            return round_weed(digits, ((too_high - w[0]) * unit) & MASK64, unsafe, fractionals, one, unit)
+
+
+def multiply_array(x, y):
+    # multiply() of two uint64 arrays of significands, in 32 bit halves
+    a, b = x >> 32, x & 0xffffffff
+    c, d = y >> 32, y & 0xffffffff
+    ac, bc, ad, bd = a * c, b * c, a * d, b * d
+    middle = (bd >> 32) + (ad & 0xffffffff) + (bc & 0xffffffff) + (1 << 31)
+    return ac + (ad >> 32) + (bc >> 32) + (middle >> 32)
+
+
+def round_weed_array(distance, delta, rest, ten_kappa, unit):
+    # round_weed() over uint64 arrays, wrapping like the C code where it does
+    low, high = distance - unit, distance + unit
+    while True:
+        down = (rest < low) & (delta - rest >= ten_kappa) & \
+            ((rest + ten_kappa < low) | (low - rest >= rest + ten_kappa - low))
+        if not down.any():
+            break
+        rest = np.where(down, rest + ten_kappa, rest)
+    ambiguous = (rest < high) & (delta - rest >= ten_kappa) & \
+        ((rest + ten_kappa < high) | (high - rest > rest + ten_kappa - high))
+    return ~ambiguous & (2 * unit <= rest) & (rest <= delta - 4 * unit)
+
+
+POWER_SIGNIFICANDS = np.array([f for f, _ in CACHED_POWERS], dtype='uint64')
+POWER_EXPONENTS = np.array([e for _, e in CACHED_POWERS], dtype='int64')
+POW10_ARRAY = np.array(POW10, dtype='uint64')
+
+
+def grisu3_array(values):
+    # grisu3() of every value in an array of positive finite doubles at once
+    bits = np.ascontiguousarray(values, dtype='float64').view('uint64')
+    fraction, biased = bits & ((1 << 52) - 1), bits >> 52 & 0x7ff
+    normal = biased > 0
+    f = np.where(normal, fraction + (1 << 52), fraction)
+    e = np.where(normal, biased.astype('int64') - 1075, -1074)
+    # w, plus and minus all normalize to w's exponent; f is under 2^53 so frexp gives its bit length exactly
+    shift = (64 - np.frexp(f.astype('float64'))[1]).astype('uint64')
+    w = f << shift
+    plus = ((f << 1) + 1) << (shift - 1)
+    minus = np.where(normal & (fraction == 0), ((f << 2) - 1) << (shift - 2), ((f << 1) - 1) << (shift - 1))
+    exponent = e - shift.astype('int64')
+
+    k = np.ceil((-61 - exponent) * 0.30102999566398114).astype('int64')
+    power = (k + 347) // 8 + 1
+    w, minus, plus = (multiply_array(x, POWER_SIGNIFICANDS[power]) for x in (w, minus, plus))
+    shift = (-(exponent + POWER_EXPONENTS[power] + 64)).astype('uint64')
+
+    too_high = plus + 1
+    unsafe = too_high - (minus - 1)
+    one = np.uint64(1) << shift
+    integrals, fractionals = too_high >> shift, too_high & (one - 1)
+    kappa = ((65 - shift.astype('int64')) * 1233 >> 12) + 1
+    kappa -= integrals < POW10_ARRAY[kappa]
+    divisor = POW10_ARRAY[kappa]
+
+    # Each value stops at its own digit, so done marks the ones round_weed has already decided
+    found = np.zeros(len(bits), dtype=bool)
+    done = np.zeros(len(bits), dtype=bool)
+    while True:
+        step = ~done & (kappa > 0)
+        if not step.any():
+            break
+        integrals = np.where(step, integrals % np.maximum(divisor, 1), integrals)
+        kappa -= step
+        rest = (integrals << shift) + fractionals
+        stop = step & (rest < unsafe)
+        found[stop] = round_weed_array(too_high[stop] - w[stop], unsafe[stop], rest[stop],
+                                       divisor[stop] << shift[stop], np.ones(stop.sum(), dtype='uint64'))
+        done |= stop
+        divisor = np.where(step, divisor // 10, divisor)
+    unit = np.ones(len(bits), dtype='uint64')
+    while not done.all():
+        fractionals = (fractionals * 10) & (one - 1)
+        unit *= 10
+        unsafe *= 10
+        stop = ~done & (fractionals < unsafe)
+        found[stop] = round_weed_array((too_high[stop] - w[stop]) * unit[stop], unsafe[stop], fractionals[stop],
+                                       one[stop], unit[stop])
+        done |= stop
+    return found
+
+
+def layout(text):
+    # A double's repr laid out like grisu3 lays out the same digits
+    sign, text = ('-', text[1:]) if text.startswith('-') else ('', text)
+    mantissa, _, exponent = text.partition('e')
+    if exponent.startswith('-'):
+        return f'{sign}{mantissa}e{int(exponent)}'
+    whole, _, decimals = mantissa.partition('.')
+    if exponent:
+        digits, zeros = whole + decimals, int(exponent) - len(decimals)
+    elif decimals == '0':
+        digits, zeros = whole, 0
+    else:
+        return sign + text
+    if not digits.strip('0'):
+        return sign + '0'
+    significant = digits.rstrip('0')
+    zeros += len(digits) - len(significant)
+    return sign + significant + ('0' * zeros if zeros <= 2 else f'e{zeros}')
+
+
+def format_double(value):
+    # A double the way readr's write_csv writes it
+    if value != value:
+        return 'NA'
+    if math.isinf(value):
+        return 'Inf' if value > 0 else '-Inf'
+    if value and not grisu3(abs(value)):
+        return '%.17g' % value
+    return layout(repr(value))
+
+
+def format_doubles(values):
+    # format_double() of every value in a Series, with grisu3 run on the whole column at once
+    numbers = values.to_numpy(dtype='float64', na_value=np.nan)
+    text = pd.Series([repr(number) for number in numbers.tolist()], index=values.index, dtype=object)
+    finite = np.isfinite(numbers) & (numbers != 0)
+    fallback = np.zeros(len(numbers), dtype=bool)
+    fallback[finite] = ~grisu3_array(np.abs(numbers[finite]))
+    text[fallback] = ['%.17g' % number for number in numbers[fallback].tolist()]
+
+    # Most values are laid out as they are or only lose a '.0'; layout() takes the rest one at a time
+    short = ~fallback & np.isfinite(numbers)
+    unusual = short & (text.str.contains('e', regex=False) | text.str.endswith('000.0')).to_numpy()
+    integral = short & ~unusual & text.str.endswith('.0').to_numpy()
+    text[unusual] = text[unusual].map(layout)
+    text[integral] = text[integral].str[:-2]
+    text[np.isnan(numbers)] = 'NA'
+    text[np.isposinf(numbers)] = 'Inf'
+    text[np.isneginf(numbers)] = '-Inf'
+    return text
+
+
+def format_text(value):
+    # A string the way write_csv writes it: quoted only if it has to be, NA when missing
+    if value != value:
+        return 'NA'
+    if any(character in value for character in ',"\n\r'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+# ----- Merge -----
+
+def sources(directory=FACILITY_LOAD_DIR):
+    # {state: path} of the latest simple_<state>_CT_toFacilities file of each state, by state
+    latest = {}
+    for path in glob.glob(os.path.join(directory, 'simple_*_CT_toFacilities_v*.csv')):
+        match = SOURCE.search(os.path.basename(path))
+        if match and int(match.group(2)) > latest.get(match.group(1), (-1, None))[0]:
+            latest[match.group(1)] = (int(match.group(2)), path)
+    return {state: latest[state][1] for state in sorted(latest)}
+
+
+def geoids(county_tract):
+    # Z-prefixed CountyTract keys ('Z49001100100') as 11 digit GEOIDs
+    geoid = county_tract.str.removeprefix('Z')
+    bad = ~geoid.str.fullmatch(r'\d{1,11}').fillna(False)
+    if bad.any():
+        raise Exception(f"CountyTract values that aren't tract GEOIDs: {county_tract[bad].unique()[:5].tolist()}")
+    return geoid.str.zfill(11)
+
+
+def load_state(state, path, parts):
+    # Parse one state's file a chunk at a time into its CSV part (and Parquet part), with counters
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        pa = None
+    start = time.perf_counter()
+    rows = 0
+    writer = None
+    with open(os.path.join(parts, f'{state}.csv'), 'w', newline='') as out:
+        for chunk in pd.read_csv(path, usecols=COLUMNS, dtype=str, keep_default_na=False, na_values=['', 'NA'],
+                                 chunksize=CHUNK_ROWS):
+            values = {column: pd.to_numeric(chunk[column]) for column in DOUBLES}
+            cells = [chunk['CountyTract'].map(format_text), format_doubles(values['FacID']),
+                     chunk['FacType'].map(format_text), format_doubles(values['minutes']),
+                     format_doubles(values['miles'])]
+            out.write(''.join(','.join(row) + f',{state}\n' for row in zip(*cells)))
+            rows += len(chunk)
+
+            if pa is not None:
+                frame = pd.DataFrame({'GEOID': geoids(chunk['CountyTract']), 'FacID': values['FacID'].astype('Int64'),
+                                      'FacType': chunk['FacType'], 'minutes': values['minutes'].astype('float64'),
+                                      'miles': values['miles'].astype('float64'), 'State': state})
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(os.path.join(parts, f'{state}.parquet'), table.schema)
+                writer.write_table(table)
+    if writer is not None:
+        writer.close()
+    return {'rows': rows, 'bytes': os.path.getsize(path), 'seconds': time.perf_counter() - start}
+
+
+def merge(parts, states, target):
+    # Stream the CSV parts (and Parquet parts) into the merged files, swapping each in when it's complete
+    with open(target + '.partial', 'w', newline='') as out:
+        out.write(','.join(COLUMNS + ['State']) + '\n')
+        for state in states:
+            with open(os.path.join(parts, f'{state}.csv'), newline='') as part:
+                shutil.copyfileobj(part, out)
+    os.replace(target + '.partial', target)
+
+    paths = [os.path.join(parts, f'{state}.parquet') for state in states]
+    if not all(os.path.exists(path) for path in paths):
+        return [target]
+    import pyarrow.parquet as pq
+    columnar = os.path.splitext(target)[0] + '.parquet'
+    writer = None
+    for path in paths:
+        part = pq.ParquetFile(path)
+        for group in range(part.num_row_groups):
+            table = part.read_row_group(group)
+            if writer is None:
+                writer = pq.ParquetWriter(columnar + '.partial', table.schema, compression='zstd')
+            writer.write_table(table)
+    writer.close()
+    os.replace(columnar + '.partial', columnar)
+    return [target, columnar]
+
+
+def build(target=COMPREHENSIVE, directory=FACILITY_LOAD_DIR, jobs=None):
+    # Merge every state's file into target (and its Parquet copy), one worker per state
+    files = sources(directory)
+    if not files:
+        raise Exception(f'No simple_<state>_CT_toFacilities files in {directory}')
+    jobs = min(jobs or os.cpu_count() or 1, len(files))
+    parts = target + '.parts'
+    shutil.rmtree(parts, ignore_errors=True)
+    os.makedirs(parts)
+
+    start = time.perf_counter()
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {state: pool.submit(load_state, state, path, parts) for state, path in files.items()}
+            counters = {state: future.result() for state, future in futures.items()}
+    else:
+        counters = {state: load_state(state, path, parts) for state, path in files.items()}
+    written = merge(parts, list(files), target)
+    shutil.rmtree(parts)
+
+    for state, counter in counters.items():
+        print(f"  {state}: {counter['rows']} rows, {counter['bytes'] / 1e6:.1f} MB in {counter['seconds']:.2f} s "
+              f"({os.path.basename(files[state])})")
+    print(f"{sum(counter['rows'] for counter in counters.values())} rows from {len(files)} states in "
+          f"{time.perf_counter() - start:.2f} s with {jobs} workers -> {', '.join(written)}")
+    return counters
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge the per-state facility drive-time files')
+    parser.add_argument('--jobs', type=int, help='worker processes (default one per CPU)')
+    parser.add_argument('--source', default=FACILITY_LOAD_DIR, help='folder of simple_<state>_CT_toFacilities files')
+    parser.add_argument('--out', default=COMPREHENSIVE)
+    args = parser.parse_args()
+    build(args.out, args.source, args.jobs)
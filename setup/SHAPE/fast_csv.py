@@ -0,0 +1,147 @@
+# Fast CSV rendering for the all_* files
+#
+# DataFrame.to_csv with QUOTE_NONNUMERIC hands every cell to the csv module one at a
+# time, which is a big share of the pull on the melted tract tables. render() gives
+# the same text column by column instead:
+#   - text columns (cat, def, source, State, ...) repeat a handful of values, so they
+#     are factorized and each distinct value is quoted once
+#   - floats are written with repr like the csv module does, ints and bools with str
+#   - missing values are the quoted na_rep, like to_csv's
+#   - mixed object columns (value with radon text) are formatted value by value
+# and the cells are joined into lines with pyarrow's element-wise string join when
+# pyarrow is installed (in Python otherwise). Anything it doesn't know how to write the
+# way to_csv does (other quoting, dates, nullable floats, ...) goes through to_csv.
+#
+# Besides the lines, render() returns the key columns as the literal text a CSV reader
+# gets back from them, which is what writers.py indexes rows by.
+
+import csv
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+# Each column comes out as (codes, cells, literal): one code per row into the column's
+# distinct cells, quoted as written and as the literal text a reader gets back
+
+
+def text_cells(values, na_rep):
+    # A column of strings (and missing values), each distinct string quoted once
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    literal = [str(value) for value in uniques] + [na_rep]
+    # Missing values (code -1) point at the trailing na_rep
+    codes[codes < 0] = len(uniques)
+    return codes, [quote(value) for value in literal], literal
+
+
+def float_cells(values, na_rep):
+    # A float64 column written with repr, factorized on the bits so -0.0 and 0.0 stay apart
+    codes, uniques = pd.factorize(values.to_numpy().view(np.int64))
+    uniques = uniques.view(np.float64)
+    literal = [na_rep if value != value else float.__repr__(value) for value in uniques.tolist()]
+    cells = [quote(na_rep) if value != value else text for value, text in zip(uniques.tolist(), literal)]
+    return codes, cells, literal
+
+
+def number_cells(values):
+    # An int or bool column written with str
+    codes, uniques = pd.factorize(values)
+    literal = [str(value) for value in uniques.tolist()]
+    return codes, literal, literal
+
+
+def object_cells(values, na_rep):
+    # A mixed object column, value by value; None if it holds something to_csv writes differently
+    cells = []
+    literal = []
+    for value in values.tolist():
+        if value is None or value is pd.NA or (isinstance(value, float) and value != value):
+            cells.append(quote(na_rep))
+            literal.append(na_rep)
+        elif isinstance(value, str):
+            cells.append(quote(value))
+            literal.append(value)
+        elif isinstance(value, float):
+            cells.append(float.__repr__(value))
+            literal.append(cells[-1])
+        elif isinstance(value, (bool, int)):
+            cells.append(str(value))
+            literal.append(cells[-1])
+        else:
+            return None
+    codes, uniques = pd.factorize(pd.Series(cells, dtype=object))
+    written = dict(zip(cells, literal))
+    return codes, list(uniques), [written[cell] for cell in uniques]
+
+
+def column_cells(values, na_rep):
+    # Codes, cells and literal text of one column, or None if only to_csv knows how to write it
+    dtype = values.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        if pd.api.types.infer_dtype(dtype.categories, skipna=True) == 'string':
+            return text_cells(values, na_rep)
+        return object_cells(values.astype(object), na_rep)
+    if pd.api.types.is_extension_array_dtype(dtype) and not pd.api.types.is_string_dtype(dtype):
+        return None
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return number_cells(values)
+    if dtype == np.float64:
+        return float_cells(values, na_rep)
+    if pd.api.types.is_string_dtype(dtype):
+        if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+            return text_cells(values, na_rep)
+        return object_cells(values, na_rep)
+    return None
+
+
+def join_lines(columns):
+    # Join the columns' cells into lines ending in os.linesep, as Python strings
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        cells = [np.array(cells, dtype=object)[codes] for codes, cells in columns]
+        return [','.join(row) + os.linesep for row in zip(*cells)]
+    # Each column is its distinct cells taken by code, so no per row Python strings until the end
+    text = pa.large_string()
+    cells = [pa.array(cells, type=text).take(pa.array(codes, type=pa.int32())) for codes, cells in columns]
+    lines = pc.binary_join_element_wise(*cells, pa.scalar(',', text))
+    return pc.binary_join_element_wise(lines, pa.scalar(os.linesep, text), pa.scalar('', text)).to_pylist()
+
+
+def pandas_render(frame, keys, **csv_options):
+    # The same as render() through to_csv, for frames or options render() doesn't handle
+    text = frame.to_csv(index=False, **csv_options)
+    header, *lines = text.splitlines(keepends=True)
+    literal = pd.read_csv(io.StringIO(text), usecols=keys, dtype=str, keep_default_na=False)[keys]
+    return header, lines, literal
+
+
+def render(frame, keys, **csv_options):
+    # Header line, data lines and the key columns' literal text of frame written as CSV
+    quoting = csv_options.get('quoting', csv.QUOTE_MINIMAL)
+    na_rep = csv_options.get('na_rep', '')
+    if quoting != csv.QUOTE_NONNUMERIC or set(csv_options) - {'quoting', 'na_rep'} or not len(frame.columns) \
+            or not frame.columns.is_unique:
+        return pandas_render(frame, keys, **csv_options)
+
+    columns = []
+    literal = {}
+    for name in frame.columns:
+        column = column_cells(frame[name], na_rep)
+        if column is None:
+            return pandas_render(frame, keys, **csv_options)
+        codes, cells, text = column
+        columns.append((codes, cells))
+        if name in keys:
+            literal[name] = np.array(text, dtype=object)[codes]
+
+    header = ','.join(quote(str(name)) for name in frame.columns) + os.linesep
+    lines = join_lines(columns) if len(frame) else []
+    return header, lines, pd.DataFrame(literal, columns=keys)
@@ -0,0 +1,61 @@
+# Vectorized label formatting and lookups for the SHAPE pull
+#
+# Long tables repeat the same few values and measures over and over (every measure
+# name once per geography, FCC speeds, AQI day counts, ...), so instead of formatting
+# row by row we factorize the column, format each distinct value once and broadcast
+# the results back with the codes. Missing values always come back as NA.
+
+import numpy as np
+import pandas as pd
+
+# Label formatters keyed by format code. Codes match setup/SHAPE/data/formats/*.json,
+# plus the 'dec' and 'str' label styles the pull has always used. 'int' values have
+# always been labelled with str, so they stay that way
+FORMATTERS = {
+    'pct': lambda x: f'{x * 100:.1f}%',
+    'int': str,
+    'dec': lambda x: f'{x:.1f}',
+    'str': str,
+    'string': str,
+}
+
+
+def broadcast(values, func):
+    # Apply func to each distinct non-missing value once and spread the results over the column
+    if values.dtype == object:
+        # Factorizing would merge equal values of different types (1, 1.0, True), so mixed
+        # columns are formatted value by value
+        return values.map(func, na_action='ignore').astype(object)
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    formatted = np.empty(len(uniques) + 1, dtype=object)
+    formatted[:-1] = [func(x) for x in uniques]
+    formatted[-1] = np.nan
+    # The NA sentinel code is -1, which picks the trailing NaN
+    return pd.Series(formatted[codes], index=values.index, dtype=object)
+
+
+def format_values(values, code):
+    # Labels for a whole column using one format code
+    if code not in FORMATTERS:
+        raise KeyError(f'Unknown format code {code!r}, expected one of {list(FORMATTERS)}')
+    return broadcast(values, FORMATTERS[code])
+
+
+def format_by_code(values, codes):
+    # Labels for a column where every row carries its own format code (the fmt column)
+    labels = pd.Series(np.nan, index=values.index, dtype=object)
+    for code, rows in codes.groupby(codes, sort=False).groups.items():
+        labels.loc[rows] = format_values(values.loc[rows], code)
+    return labels
+
+
+def map_lookup(keys, mapping, name):
+    # Map measure names to their definition/format, failing loudly on unknown measures
+    codes, uniques = pd.factorize(keys, use_na_sentinel=True)
+    missing = [key for key in uniques if key not in mapping]
+    if missing:
+        raise KeyError(f'{name}: no entry for measures {missing}')
+    mapped = np.empty(len(uniques) + 1, dtype=object)
+    mapped[:-1] = [mapping[key] for key in uniques]
+    mapped[-1] = np.nan
+    return pd.Series(mapped[codes], index=keys.index, dtype=object)
@@ -0,0 +1,157 @@
+# Geography registry for the SHAPE pull
+#
+# census.StateFips, CountyFips and TractFips barely ever change, so instead of reading
+# them on every run they are kept as a snapshot in setup/SHAPE/data/geography and only
+# re-read when the version check against SHAPE (row count and fips range per table)
+# says they changed. The snapshot holds every state, not just the area we serve.
+#
+# GEOIDs are normalized to zero-padded strings (2 digits for states, 5 for counties,
+# 11 for tracts), the way they are written to the all_* files, so tables that store
+# FIPS codes as ints join the same as the ones that store strings.
+#
+# The catchment (area we serve) is a set of row positions into each level's snapshot,
+# computed once per run. complete() uses those to attach the geography columns to a
+# table and fill in NA rows for the geographies it's missing with a reindex, giving
+# the same rows in the same order as the outer merge the pull used to do per table.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+from specs import FIPS_SPECS, GEO_COLUMNS
+
+GEOGRAPHY_DIR = 'setup/SHAPE/data/geography'
+
+# Bump when the snapshot layout changes so old snapshots are re-read
+SNAPSHOT_FORMAT = 1
+
+# Digits in a GEOID at each level
+GEOID_WIDTH = {'state': 2, 'county': 5, 'tract': 11}
+
+
+def geoid(values, level, as_int=False):
+    # Normalize FIPS codes (ints, floats from NULLs, or strings with or without leading zeros)
+    # to zero-padded strings, or to int64 with as_int. Missing codes stay missing
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        text = values.astype('Int64').astype('string')
+    else:
+        text = values.astype('string').str.strip().str.replace(r'\.0$', '', regex=True)
+    text = text.str.zfill(GEOID_WIDTH[level])
+    if as_int:
+        return text.astype('Int64')
+    return text.astype(object).where(text.notna(), np.nan)
+
+
+def join_column(level):
+    # State tables join on the state name, everything else on fips
+    return 'state' if level == 'state' else 'fips'
+
+
+def join_keys(values, level):
+    # Table keys in the form the level's join column holds
+    return geoid(values, level) if join_column(level) == 'fips' else pd.Series(values).astype(object)
+
+
+def source_version(engine):
+    # Row count and fips range of each FIPS table in SHAPE, cheap enough to check every run
+    version = {'format': SNAPSHOT_FORMAT}
+    with engine.connect() as conn:
+        for spec in FIPS_SPECS:
+            query = sa.text(f"select count(*), min(fips), max(fips) from {spec['table']}")
+            rows, low, high = conn.execute(query).one()
+            version[spec['table']] = [rows, str(low), str(high)]
+    return version
+
+
+def read_snapshot(directory=GEOGRAPHY_DIR):
+    # The snapshot tables and the version they were read at, or None if there's no snapshot
+    path = os.path.join(directory, 'version.json')
+    if not os.path.exists(path):
+        return None, None
+    version = json.load(open(path))
+    registry = {}
+    for spec in FIPS_SPECS:
+        registry[spec['level']] = pd.read_csv(os.path.join(directory, f"{spec['level']}.csv"),
+                                              dtype=str, keep_default_na=False, na_values=[''])
+    return registry, version
+
+
+def write_snapshot(registry, version, directory=GEOGRAPHY_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for level, table in registry.items():
+        table.to_csv(os.path.join(directory, f'{level}.csv'), index=False)
+    # Version goes last so a snapshot that failed halfway never looks current
+    with open(os.path.join(directory, 'version.json'), 'w') as f:
+        json.dump(version, f, indent=2)
+
+
+def fetch(engine):
+    # Read the FIPS tables for every state from SHAPE
+    registry = {}
+    with engine.connect() as conn:
+        for spec in FIPS_SPECS:
+            query = sa.text(f"select {', '.join(spec['columns'])} from {spec['table']}")
+            table = pd.read_sql(query, conn)
+            table['fips'] = geoid(table['fips'], spec['level'])
+            registry[spec['level']] = table.sort_values('fips', kind='stable').reset_index(drop=True)
+    return registry
+
+
+def load_registry(engine, refresh=False, directory=GEOGRAPHY_DIR):
+    # State, county and tract FIPS tables keyed by level, from the snapshot when it's current
+    version = source_version(engine)
+    registry, snapshot_version = read_snapshot(directory)
+    if refresh or registry is None or snapshot_version != version:
+        print('reading FIPS tables from SHAPE')
+        registry = fetch(engine)
+        write_snapshot(registry, version, directory)
+    else:
+        print('using FIPS snapshot')
+    return registry
+
+
+def catchment_index(registry, aws):
+    # Row positions of the area we serve in each level's table
+    return {level: np.flatnonzero(table['state'].isin(aws).to_numpy()) for level, table in registry.items()}
+
+
+def catchment(registry, index):
+    # FIPS tables for just the area we serve, indexed by their join column
+    geo = {}
+    for level, table in registry.items():
+        table = table[GEO_COLUMNS[level]].take(index[level])
+        geo[level] = table.set_index(join_column(level), drop=False)
+    return geo
+
+
+def catchment_fips(registry, index):
+    # State FIPS codes of the area we serve
+    return list(registry['state']['fips'].take(index['state']))
+
+
+def complete(df, keys, geo, level, fill=True):
+    # Attach the geography columns to df (one row per key) and, with fill, add NA rows
+    # for the geographies df doesn't have. Rows come out sorted by key like an outer
+    # merge would give; without fill they keep df's order like a left merge
+    df = df.reset_index(drop=True)
+    keys = join_keys(keys, level).to_numpy()
+    positions = np.arange(len(df))
+    if fill:
+        missing = geo.index[~geo.index.isin(keys)].to_numpy()
+        keys = np.concatenate([keys, missing])
+        positions = np.concatenate([positions, np.full(len(missing), -1)])
+        # Sort on the sorted factor codes so missing keys (code -1) go last instead of failing the compare
+        codes, uniques = pd.factorize(keys, sort=True)
+        codes[codes < 0] = len(uniques)
+        order = np.argsort(codes, kind='stable')
+        keys, positions = keys[order], positions[order]
+
+    # -1 isn't a row label, so those rows come back all NA
+    rows = df.reindex(positions).reset_index(drop=True)
+    places = geo.reindex(keys).reset_index(drop=True)
+    places[join_column(level)] = keys
+    return pd.concat([rows, places], axis='columns')
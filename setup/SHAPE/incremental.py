@@ -0,0 +1,105 @@
+# Incremental pulls for the SHAPE pull
+#
+# Most SHAPE tables change rarely (FCC carries its MONTH/YEAR vintage, BRFSS and HINTS
+# are annual), so before reading anything we ask SHAPE for a cheap fingerprint of
+# each table's catchment rows:
+#   - row count
+#   - max of the id column (idAqi, RecordID, ...) when the table has one
+#   - MONTH/YEAR range when the table has a vintage
+#   - CHECKSUM_AGG(BINARY_CHECKSUM(*)) on SQL Server, which catches edits in place
+#     (other databases, like the SQLite stand-in, get the sum of every numeric column)
+# A table is skipped (not read, not rewritten) when its fingerprint and its transform
+# inputs (spec, lookups, geography, code, see checkpoint.plan) match what the last
+# successful write recorded in setup/SHAPE/data/fingerprints.json.
+#
+# A table that starts its output file over (overwrite in specs.py) wipes whatever
+# else is in it, so when one of those has to run, so does everything written to the
+# same file, and the tables it wiped that weren't in the run lose their fingerprints.
+# Same goes for an output file that's gone missing, or whose size or modification
+# time isn't what the last pull left (the R build rewrites all_county.csv and
+# all_tract.csv, for one): nothing says the rows written to it are still there.
+
+import json
+import os
+
+import sqlalchemy as sa
+
+from specs import TARGETS
+from extract import reflect, filter_query
+
+FINGERPRINTS = 'setup/SHAPE/data/fingerprints.json'
+
+
+def fingerprint_query(table, spec, aws, aws_fips, dialect):
+    # Aggregates over the table's catchment rows that change whenever its data does
+    columns = {column.name: column for column in table.columns}
+    parts = [sa.func.count().label('rows')]
+    ids = [name for name in columns if name.startswith('id') or name == 'RecordID']
+    if ids:
+        parts.append(sa.func.max(columns[ids[0]]).label('max_id'))
+    for name in ('MONTH', 'YEAR'):
+        if name in columns:
+            parts += [sa.func.min(columns[name]).label(f'min_{name}'), sa.func.max(columns[name]).label(f'max_{name}')]
+    if dialect == 'mssql':
+        parts.append(sa.literal_column('CHECKSUM_AGG(BINARY_CHECKSUM(*))').label('checksum'))
+    else:
+        numeric = [column for column in table.columns if isinstance(column.type, (sa.Integer, sa.Float, sa.Numeric))]
+        parts += [sa.func.sum(column).label(f'sum_{column.name}') for column in numeric]
+    return filter_query(sa.select(*parts).select_from(table), table, spec, aws, aws_fips)
+
+
+def source_fingerprints(engine, specs, aws, aws_fips):
+    # Fingerprint of every spec's source table, keyed by spec name
+    fingerprints = {}
+    with engine.connect() as conn:
+        for spec in specs:
+            table = reflect(spec, conn)
+            row = conn.execute(fingerprint_query(table, spec, aws, aws_fips, engine.dialect.name)).one()
+            fingerprints[spec['name']] = {key: str(value) for key, value in row._mapping.items()}
+    return fingerprints
+
+
+def load(path=FINGERPRINTS):
+    # {'tables': spec name -> fingerprints, 'files': output file -> identity}, empty for older layouts
+    saved = json.load(open(path)) if os.path.exists(path) else {}
+    if 'tables' not in saved:
+        return {'tables': {}, 'files': {}}
+    return saved
+
+
+def identity(target):
+    # Size and modification time of an output file, which any rewrite changes
+    stat = os.stat(target)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def entry(spec, sources, nodes):
+    return {'source': sources[spec['name']], 'node': nodes[spec['name']]['transform'], 'target': TARGETS[spec['level']]}
+
+
+def unchanged(specs, sources, nodes, path=FINGERPRINTS):
+    # Specs that can be skipped because nothing they depend on changed since their last write
+    saved = load(path)
+    same = [spec for spec in specs if saved['tables'].get(spec['name']) == entry(spec, sources, nodes)]
+
+    # Files that are missing, were changed by something else or get started over have to be rebuilt
+    # from every table that writes to them
+    rebuilt = {TARGETS[spec['level']] for spec in specs if spec.get('overwrite') and spec not in same}
+    rebuilt.update(target for target in TARGETS.values()
+                   if not os.path.exists(target) or saved['files'].get(target) != identity(target))
+    return [spec for spec in same if TARGETS[spec['level']] not in rebuilt]
+
+
+def record(specs, sources, nodes, path=FINGERPRINTS):
+    # Remember the fingerprints the given tables were just written with, and what their files look like now
+    saved = load(path)
+    started_over = {TARGETS[spec['level']] for spec in specs if spec.get('overwrite')}
+    names = {spec['name'] for spec in specs}
+    saved['tables'] = {name: table for name, table in saved['tables'].items()
+                       if name in names or table['target'] not in started_over}
+    for spec in specs:
+        saved['tables'][spec['name']] = entry(spec, sources, nodes)
+    saved['files'] = {target: identity(target) for target in TARGETS.values() if os.path.exists(target)}
+    with open(path + '.partial', 'w') as f:
+        json.dump(saved, f, indent=2, sort_keys=True)
+    os.replace(path + '.partial', path)
@@ -0,0 +1,49 @@
+# Memory tracking for the SHAPE pull
+#
+# Peaks come from tracemalloc, which sees pandas/numpy buffers as well as Python
+# objects, so they reflect what each stage actually allocated. Tracing slows the
+# pull down, so it only runs when a memory report is asked for.
+
+import resource
+import tracemalloc
+from contextlib import contextmanager
+
+
+def start():
+    # Start tracing allocations if nothing else has
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+@contextmanager
+def track(peaks, stage):
+    # Record the peak traced memory (MB) while a stage runs, keeping the max over repeated runs
+    if not tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        peaks[stage] = max(peaks.get(stage, 0), peak)
+
+
+def current_rss_mb():
+    # Resident set size of the process right now, from /proc where there is one
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    # Peak resident set size of the process so far (ru_maxrss is KB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report_peaks(name, peaks):
+    # Print the per-stage peaks for one table
+    stages = ', '.join(f'{stage} {peak:.1f} MB' for stage, peak in peaks.items())
+    print(f'  {name}: peak {stages}')
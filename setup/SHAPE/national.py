@@ -0,0 +1,104 @@
+# National mode for the SHAPE pull
+#
+# Instead of the area we serve, pulls every state in the geography registry (the
+# whole country, ~85k tracts). The work is sharded by state FIPS: each shard reads
+# just its state's rows (the usual pushdown filter, with one state), transforms them
+# against that state's geography and writes its own partition, a tree laid out like
+# the repo's under setup/SHAPE/data/national/state=<fips>. Shards run on --jobs worker
+# processes (in this one with --jobs 1, like catchments.py) that split max_concurrency
+# connections between them, and a worker only ever holds one state's tables, so memory
+# stays flat and run time grows linearly with the number of states.
+#
+# manifest.json next to the partitions lists each one with its state, tree and rows.
+# Like a catchment pull (catchments.py), a national pull always reads and writes every
+# selected table.
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from specs import TARGETS
+from pull_shape_db import load_login, select_specs
+
+NATIONAL_DIR = 'setup/SHAPE/data/national'
+
+
+def partition_root(fips, directory=NATIONAL_DIR):
+    return os.path.join(directory, f'state={fips}')
+
+
+def shards(registry):
+    # (state name, state FIPS) for every state in the registry, in FIPS order
+    states = registry['state'].sort_values('fips')
+    return list(zip(states['state'], states['fips']))
+
+
+def pull_shard(login, specs, geo, area, root, options, max_concurrency):
+    # Read, transform and write one state on its own connection pool
+    from extract import create_engine, extract
+    from catchments import write_catchment
+
+    engine = create_engine(login, max_concurrency)
+    try:
+        frames, timings = extract(engine, specs, area['name'], area['fips'], max_concurrency, options['pushdown'],
+                                  reader=options['reader'], compact=options['compact_dtypes'])
+    finally:
+        engine.dispose()
+    report = write_catchment(area['name'][0], root, specs, frames, geo, area, timings, options, quiet=True)
+    rows = {level: 0 for level in TARGETS}
+    for spec in specs:
+        rows[spec['level']] += report['tables'][spec['name']]['stages']['write']['rows_out']
+    return {'rows': rows, 'seconds': report['seconds'], 'peak_rss_mb': report['peak_rss_mb']}
+
+
+def run(options):
+    # Every state in the registry, one shard per state
+    import report
+    from extract import create_engine
+    from geography import load_registry, catchment_index, catchment, catchment_fips
+    from schema import compact_geography
+
+    print('pull shape (national)')
+    pull = report.start_run(options)
+    login = load_login()
+    engine = create_engine(login, 1)
+    registry = load_registry(engine, options['refresh_geography'])
+    engine.dispose()
+
+    specs, _ = select_specs(dict(options, streaming=False))
+    jobs = max(1, options['jobs'])
+    per_job = max(1, options['max_concurrency'] // jobs)
+    states = shards(registry)
+    print(f'{len(states)} states, {len(specs)} tables each, on {jobs} workers')
+
+    work = {}
+    for state, fips in states:
+        index = catchment_index(registry, [state])
+        geo = catchment(registry, index)
+        if options['compact_dtypes']:
+            geo = compact_geography(geo)
+        area = {'name': [state], 'fips': catchment_fips(registry, index)}
+        work[fips] = (state, partition_root(fips), geo, area)
+
+    manifest = {}
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {fips: pool.submit(pull_shard, login, specs, geo, area, root, options, per_job)
+                       for fips, (state, root, geo, area) in work.items()}
+            for fips, future in futures.items():
+                state, root, _, _ = work[fips]
+                manifest[fips] = dict({'state': state, 'root': root}, **future.result())
+    else:
+        for fips, (state, root, geo, area) in work.items():
+            manifest[fips] = dict({'state': state, 'root': root},
+                                  **pull_shard(login, specs, geo, area, root, options, per_job))
+
+    os.makedirs(NATIONAL_DIR, exist_ok=True)
+    with open(os.path.join(NATIONAL_DIR, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    result = report.finish_run(pull, os.path.join(NATIONAL_DIR, 'shape_run_report.json'), quiet=True)
+    result['shards'] = manifest
+    result['peak_worker_mb'] = max((shard['peak_rss_mb'] for shard in manifest.values()), default=0)
+    print(f"{len(manifest)} partitions written to {NATIONAL_DIR}, peak worker memory {result['peak_worker_mb']:.0f} MB")
+    return result
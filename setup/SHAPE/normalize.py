@@ -0,0 +1,101 @@
+# Normalized output for the long all_* files
+#
+# all_state.csv, all_county.csv and all_tract.csv repeat the same cat/def/fmt/source
+# strings (and State/County/Tract names) on every row. The normalized mode splits
+# each file into:
+#   <level>_facts.csv        GEOID, measure_id, RE, Sex, value, lbl
+#   <level>_measures.csv     measure_id, cat, measure, def, fmt, source
+#   <level>_geographies.csv  GEOID and its State/County/Tract names
+# The dimensions are built from pandas categoricals, so the ids are just the category codes.
+#
+# Run it on its own with:  python setup/SHAPE/normalize.py [state county tract]
+
+import csv
+import os
+import sys
+
+import pandas as pd
+
+from specs import TARGETS
+from formats import broadcast
+
+NORMALIZED_DIR = 'ShinyCIF/www/data/normalized'
+
+MEASURE_COLUMNS = ['cat', 'measure', 'def', 'fmt', 'source']
+GEOGRAPHY_COLUMNS = {
+    'state': ['State'],
+    'county': ['County', 'State'],
+    'tract': ['Tract', 'County', 'State'],
+}
+FACT_COLUMNS = ['GEOID', 'measure_id', 'RE', 'Sex', 'value', 'lbl']
+
+
+def read_long(path):
+    # Read an all_* file keeping every column but value as text (GEOIDs keep their
+    # leading zeros, labels stay labels) and values as exact numbers
+    columns = pd.read_csv(path, nrows=0).columns
+    long = pd.read_csv(path, dtype={column: str for column in columns if column != 'value'},
+                       float_precision='round_trip')
+    if not pd.api.types.is_numeric_dtype(long['value']):
+        # Text values (e.g. radon potential) turn the whole column into strings,
+        # so turn the numeric ones back into exact floats
+        long['value'] = broadcast(long['value'].astype(str), as_number).where(long['value'].notna())
+    return long
+
+
+def as_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def normalize(long, level):
+    # Split a long frame into the fact table and its measure and geography dimensions
+    # Each distinct cat/measure/def/fmt/source combination gets an id in order of first appearance
+    keys = long[MEASURE_COLUMNS].astype('category')
+    measure_id = keys.groupby(MEASURE_COLUMNS, dropna=False, sort=False, observed=True).ngroup()
+    facts = pd.DataFrame({
+        'GEOID': long['GEOID'].astype('category'),
+        'measure_id': measure_id.astype('int32'),
+        'RE': long['RE'],
+        'Sex': long['Sex'],
+        'value': long['value'],
+        'lbl': long['lbl'],
+    })
+
+    dimension = long[MEASURE_COLUMNS].drop_duplicates().reset_index(drop=True)
+    dimension.insert(0, 'measure_id', range(len(dimension)))
+
+    geographies = long[['GEOID'] + GEOGRAPHY_COLUMNS[level]].drop_duplicates('GEOID').reset_index(drop=True)
+    return facts, dimension, geographies
+
+
+def denormalize(facts, dimension, geographies, level):
+    # Rebuild the long frame (in the all_* column order) from its normalized parts
+    long = facts.merge(dimension, on='measure_id', how='left').merge(geographies, on='GEOID', how='left')
+    columns = ['cat', 'GEOID'] + GEOGRAPHY_COLUMNS[level] + ['measure', 'value', 'RE', 'Sex', 'def', 'fmt', 'source', 'lbl']
+    return long[columns]
+
+
+def write_normalized(level, directory=NORMALIZED_DIR):
+    # Write the normalized files for one level and report the size change
+    source = TARGETS[level]
+    facts, dimension, geographies = normalize(read_long(source), level)
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, frame in (('facts', facts), ('measures', dimension), ('geographies', geographies)):
+        path = os.path.join(directory, f'{level}_{name}.csv')
+        frame.to_csv(path, index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA")
+        paths.append(path)
+
+    before = os.path.getsize(source)
+    after = sum(os.path.getsize(path) for path in paths)
+    print(f'  {level}: {len(facts)} rows, {len(dimension)} measures, {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB')
+    return paths
+
+
+if __name__ == '__main__':
+    for level in sys.argv[1:] or list(TARGETS):
+        write_normalized(level)
@@ -0,0 +1,102 @@
+# Parquet dataset output for the SHAPE pull
+#
+# The apps read all of all_county.csv/all_tract.csv at start up, only to filter them
+# down to one cat or measure right away. Next to the CSVs (which stay as they are)
+# the pull also writes one Parquet dataset partitioned by geography level and cat:
+#
+#   ShinyCIF/www/data/parquet/level=tract/cat=Environment/part-0.parquet
+#
+# Every level has the same columns (Tract/County are null where a level doesn't have
+# them). Rows are sorted by measure and GEOID inside each file and split into row
+# groups with min/max/null count statistics on every column, so a reader like
+#   arrow::open_dataset('www/data/parquet') |> filter(level == 'tract', cat == sel, measure == m) |> select(...)
+# only opens the cat's files, skips the row groups of other measures and reads just the
+# columns it selects.
+#
+# value holds the numbers; the few text values (radon potential) go to value_text.
+# Writing needs pyarrow; without it the dataset is skipped with a message.
+#
+# Run it on its own with:  python setup/SHAPE/parquet_dataset.py [state county tract]
+
+import os
+import shutil
+import sys
+
+import pandas as pd
+
+from specs import TARGETS
+from normalize import read_long
+
+PARQUET_DIR = 'ShinyCIF/www/data/parquet'
+
+# Rows per row group, small enough that a measure spans only a few of them
+ROW_GROUP_ROWS = 16384
+
+COLUMNS = ['cat', 'GEOID', 'Tract', 'County', 'State', 'measure', 'value', 'value_text', 'RE', 'Sex',
+           'def', 'fmt', 'source', 'lbl']
+
+
+def schema():
+    import pyarrow as pa
+    types = {'value': pa.float64()}
+    return pa.schema([(column, types.get(column, pa.string())) for column in COLUMNS] + [('level', pa.string())])
+
+
+def dataset_frame(long, level):
+    # The long frame in the dataset's columns, sorted for the row group statistics
+    text = long['value'].map(lambda value: isinstance(value, str))
+    frame = long.reindex(columns=COLUMNS)
+    frame['value'] = pd.to_numeric(long['value'].where(~text), errors='coerce')
+    frame['value_text'] = long['value'].where(text)
+    frame['level'] = level
+    return frame.sort_values(['cat', 'measure', 'GEOID'], kind='stable', ignore_index=True)
+
+
+def write_parquet(level, root='', directory=PARQUET_DIR):
+    # Write one level's partitions of the dataset from its all_* file, replacing the old ones
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError:
+        print(f'  {level}: pyarrow is not installed, skipping the Parquet dataset')
+        return None
+
+    source = os.path.join(root, TARGETS[level])
+    frame = dataset_frame(read_long(source), level)
+    table = pa.Table.from_pandas(frame, schema=schema(), preserve_index=False)
+
+    # Write next to the dataset and swap the level in, so readers never see half of it
+    directory = os.path.join(root, directory)
+    staging = directory + '.staging'
+    shutil.rmtree(staging, ignore_errors=True)
+    ds.write_dataset(table, staging, format='parquet',
+                     partitioning=ds.partitioning(pa.schema([('level', pa.string()), ('cat', pa.string())]),
+                                                  flavor='hive'),
+                     file_options=ds.ParquetFileFormat().make_write_options(compression='zstd',
+                                                                            write_statistics=True),
+                     min_rows_per_group=ROW_GROUP_ROWS, max_rows_per_group=ROW_GROUP_ROWS,
+                     basename_template='part-{i}.parquet')
+    # The old level is renamed aside before the new one goes in and only deleted after, so
+    # a crash part way never loses both; one that stopped between the renames is put back
+    # here (readers skip the dot folder)
+    target = os.path.join(directory, f'level={level}')
+    old = os.path.join(directory, f'.level={level}.old')
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(old) and not os.path.exists(target):
+        os.replace(old, target)
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(target):
+        os.replace(target, old)
+    os.replace(os.path.join(staging, f'level={level}'), target)
+    shutil.rmtree(old, ignore_errors=True)
+    shutil.rmtree(staging)
+
+    size = sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(target) for name in names)
+    print(f"  {level}: {len(frame)} rows in {frame['cat'].nunique()} cats, "
+          f"{os.path.getsize(source) / 1e6:.1f} MB csv -> {size / 1e6:.1f} MB parquet")
+    return target
+
+
+if __name__ == '__main__':
+    for level in sys.argv[1:] or list(TARGETS):
+        write_parquet(level)
@@ -0,0 +1,146 @@
+# Transform engine for the SHAPE pull
+#
+# One filter -> merge -> melt -> enrich -> write path shared by every table in specs.py
+# (the same stages the run report in report.py times)
+
+import csv
+import json
+import os
+from functools import lru_cache
+
+import pandas as pd
+
+from specs import GEO_COLUMNS, OUTPUT_COLUMNS, TARGETS, MEASURE_DICTIONARY
+from formats import format_values, format_by_code, map_lookup
+from geography import geoid, complete
+from schema import widen
+from writers import LONG_KEYS, STATE_KEYS, DICTIONARY_KEYS, upsert
+from report import stage
+
+DATA_DIR = 'setup/SHAPE/data'
+
+# Names the FIPS table columns get in the long output
+GEO_RENAME = {'state': 'State', 'county': 'County', 'tract': 'Tract', 'fips': 'GEOID'}
+
+
+@lru_cache(maxsize=None)
+def load_lookups(name):
+    # Measure definitions and formats for one lookup name (aqi, brfss, fcc, ...)
+    defs = json.load(open(f'{DATA_DIR}/definitions/{name}.json'))
+    fmts = json.load(open(f'{DATA_DIR}/formats/{name}.json'))
+    return defs, fmts
+
+
+def filter_area(df, spec, aws, aws_fips):
+    # Filter a table to the area we serve
+    # State FIPS columns are normalized first, since some tables store them as ints
+    if spec['filter_on'] == 'name':
+        return df[df[spec['filter_col']].isin(aws)]
+    return df[geoid(df[spec['filter_col']], 'state').isin(aws_fips).to_numpy()]
+
+
+def source_string(df, spec):
+    # Data source string, with the table's vintage filled in when the spec asks for it
+    source = spec['source']
+    if '{' in source:
+        # Currently the tables only contain data for one month and year, so we are making that assumption here
+        # If that ever changes, we would need to change this code
+        first = df.iloc[0] if len(df) else {'MONTH': pd.NA, 'YEAR': pd.NA}
+        source = source.format(month=first['MONTH'], year=first['YEAR'])
+    return source
+
+
+def drop_columns(df, spec):
+    # Only keep the columns we want
+    # stateAbbreviation lives on some tables and not others, so missing drop columns are fine
+    return df.drop([c for c in spec['drop'] if c != spec['key']], axis='columns', errors='ignore')
+
+
+def attach_geography(df, spec, geo, fill=True):
+    # Attach the area we serve's geography columns to the table
+    # With fill, geographies the table doesn't have are filled in with NAs
+    level = spec['level']
+    key = spec['key']
+    df = complete(df.drop(key, axis='columns'), df[key], geo[level], level, fill)
+    if 'measures' in spec:
+        df = df[GEO_COLUMNS[level] + spec['measures']]
+    return df
+
+
+def melt(df, spec):
+    # Create long data and rename columns
+    # Measure columns go back to 64 bit dtypes first (see schema.py), and the measure names,
+    # repeated once per geography, are kept as a categorical
+    id_vars = GEO_COLUMNS[spec['level']]
+    df = widen(df, [c for c in df.columns if c not in id_vars])
+    long = pd.melt(df, id_vars=id_vars, var_name='measure', value_name='value')
+    long['measure'] = long['measure'].astype('category')
+    return long.rename(columns=GEO_RENAME)
+
+
+def enrich(long, spec, source):
+    # Long rows with the category, definition, format, source and label columns filled in
+
+    # Create columns for category, race/ethnicity, and sex
+    long['cat'] = spec['cat']
+    long['RE'] = pd.NA
+    long['Sex'] = pd.NA
+
+    # Create measure definitions and format columns
+    defs, fmts = load_lookups(spec['lookup'])
+    long['def'] = map_lookup(long['measure'], defs, spec['name'])
+    long['fmt'] = map_lookup(long['measure'], fmts, spec['name'])
+
+    # Create data source and label columns
+    long['source'] = source
+    if spec['label'] == 'fmt':
+        long['lbl'] = format_by_code(long['value'], long['fmt'])
+    else:
+        long['lbl'] = format_values(long['value'], spec['label'])
+
+    # Reorder columns
+    return long[OUTPUT_COLUMNS[spec['level']]]
+
+
+def melt_enrich(df, spec, source, run=None):
+    # Melt and enrich, timing each into the run report when there is one
+    with stage(run, spec, 'melt', len(df)) as record:
+        long = melt(df, spec)
+        record['rows_out'] = len(long)
+    with stage(run, spec, 'enrich', len(long)) as record:
+        long = enrich(long, spec, source)
+        record['rows_out'] = len(long)
+    return long
+
+
+def transform(df, spec, geo, aws, aws_fips, run=None):
+    # Turn one pulled SHAPE table into rows for the long all_* files
+    # Each stage is timed into the run report when there is one
+    with stage(run, spec, 'filter', len(df)) as record:
+        df = filter_area(df, spec, aws, aws_fips)
+        source = source_string(df, spec)
+        df = drop_columns(df, spec)
+        record['rows_out'] = len(df)
+    with stage(run, spec, 'merge', len(df)) as record:
+        df = attach_geography(df, spec, geo)
+        record['rows_out'] = len(df)
+    return melt_enrich(df, spec, source, run)
+
+
+def write(long, spec, run=None, root='', writer='fast'):
+    # Upsert into the level's output file (or start it over), keyed on GEOID/measure/RE/Sex
+    # (and source at state level, where the surveys share measures)
+    # root puts the output tree somewhere other than the repo's ShinyCIF (see catchments.py)
+    # writer picks how the CSV text is rendered, 'fast' (fast_csv.py) or 'pandas'
+    # Replaced rows stay in the file until writers.finish() at the end of the run
+    with stage(run, spec, 'write', len(long)) as record:
+        keys = STATE_KEYS if spec['level'] == 'state' else LONG_KEYS
+        upsert(long, os.path.join(root, TARGETS[spec['level']]), keys, fresh=spec.get('overwrite', False),
+               writer=writer, owner=spec['name'], quoting=csv.QUOTE_NONNUMERIC, na_rep="NA")
+
+        # Add measures to measure dictionary
+        if spec.get('dictionary', False):
+            measures = long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
+            upsert(measures, os.path.join(root, MEASURE_DICTIONARY), DICTIONARY_KEYS, writer=writer, owner=spec['name'],
+                   na_rep="NA")
+        record['rows_out'] = len(long)
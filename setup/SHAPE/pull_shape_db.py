@@ -1,1244 +1,366 @@
-# %%
-
-# Import packages
-
-import sqlalchemy as sa
-import pandas as pd
-import csv
+# Pull SHAPE tables into ShinyCIF/www/data/all_state.csv, all_county.csv and all_tract.csv
+#
+# Run from the repo root:
+#
+#   python setup/SHAPE/pull_shape_db.py [--datasets AQI,FCC] [--level tract] [--jobs 4] [--dry-run]
+#
+# Without arguments it runs with OPTIONS below. python setup/SHAPE/pull_shape_db.py --help
+# lists the rest of the options. The module can also be imported and run with
+# run(options); pandas and the database drivers are only imported once a run starts.
+#
+# With --jobs above 1 each dataset is read and transformed in its own worker process.
+# The parent writes the results in spec order, so the output matches a serial run.
+# With --catchments FILE the tables are read once and written out for several
+# catchments at a time instead of AWS, see catchments.py. With --national every state
+# is pulled, one shard per state, see national.py.
+
+import argparse
 import json
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from specs import TABLE_SPECS, TARGETS, specs_for
 
-# Set Area we serve variables
+# Set Area we serve variables (the state FIPS codes come from the geography registry)
 AWS = ['Utah', 'Idaho', 'Wyoming', 'Montana', 'Nevada']
-AWS_FIPS = ['16', '30', '32', '49', '56', 16, 30, 32, 49, 56]
 
-# Set options
+LOGIN_PATH = 'setup/SHAPE/data/sql_login.json'
+
+# Set options (defaults for a plain run, the command line overrides them)
 OPTIONS = {}
 # OPTIONS['datasets'] = ['AQI', 'Radon', 'BRFSS', 'FCC', 'HINTS']
-# OPTIONS['datasets'] = ['Census']
 OPTIONS['datasets'] = ['AQI', 'FCC']
-print('pull shape')
-
-# %%
-
-# Make sure SQL login is configured
-try:
-    login = json.load(open('setup/SHAPE/data/sql_login.json'))
-except:
-    raise Exception('Use sql_login_template.json to fill in the login information for sql server then change the name to sql_login.json')
-    # If you don't know the SQL server login, ask the RISR contact. Right now, it's Douglas Canada
-
-# %%
-
-# Setup connection to SHAPE
-connection_url = sa.engine.URL.create(
-    "mssql+pyodbc",
-    username=login['username'],
-    password=login['password'],
-    host=login['host'],
-    database="SHAPE",
-    query={'driver': 'ODBC Driver 18 for SQL Server', 'TrustServerCertificate': 'yes'}
-)
-engine = sa.create_engine(connection_url)
-conn = engine.connect()
-
-
-# %%
-
-# Read State FIPS Table
-state_fips = pd.read_sql('select * from census.StateFips', conn)
-
-# Read County FIPS Table
-county_fips = pd.read_sql('select * from census.CountyFips', conn)
-
-# Read Tract FIPS Table
-tract_fips = pd.read_sql('select * from census.TractFips', conn)
-
-# Read AQI table
-if 'AQI' in OPTIONS['datasets']:
-    aqi = pd.read_sql('select * from epa.Aqi', conn)
-
-# Read Radon table
-if 'Radon' in OPTIONS['datasets']:
-    radon = pd.read_sql('select * from epa.Radon', conn)
-
-# Read BRFSS tables
-if 'BRFSS' in OPTIONS['datasets']:
-    brfss_brst_crvcl_scrn = pd.read_sql('select * from brfss.BreastAndCervicalCancerScreening', conn)
-    brfss_cncr_insr = pd.read_sql('select * from brfss.CancerInsurance', conn)
-    brfss_crc_scrn = pd.read_sql('select * from brfss.ColorectalCancerScreening', conn)
-    brfss_hlth_care_acs = pd.read_sql('select * from brfss.HealthCareAccess', conn)
-    brfss_lng_scrn = pd.read_sql('select * from brfss.LungCancerScreening', conn)
-    brfss_mntl_hlth = pd.read_sql('select * from brfss.MentalHealth', conn)
-    brfss_scl_det = pd.read_sql('select * from brfss.SocialDeterminants', conn)
-    brfss_tbco = pd.read_sql('select * from brfss.Tobacco', conn)
-
-# Read FCC tables
-if 'FCC' in OPTIONS['datasets']:
-    broadbandCounty = pd.read_sql('select * from fcc.BroadbandCountyDec2023', conn)
-    broadbandTract = pd.read_sql('select * from fcc.BroadbandTractDec2023', conn)
-    mobileCounty = pd.read_sql('select * from fcc.MobileCountyDec2023', conn)
-    mobileTract = pd.read_sql('select * from fcc.MobileTractDec2023', conn)
-
-# Read HINTS tables
-if 'HINTS' in OPTIONS['datasets']:
-    hints_cncr_com = pd.read_sql('select * from hints.CancerCommunication', conn)
-    hints_cncr_percep = pd.read_sql('select * from hints.CancerPerceptions', conn)
-    hints_crvcl_cncr = pd.read_sql('select * from hints.CervicalCancer', conn)
-    hints_clin_trial = pd.read_sql('select * from hints.ClinicalTrials', conn)
-    hints_lng_cncr = pd.read_sql('select * from hints.LungCancer', conn)
-    hints_mntl_hlth = pd.read_sql('select * from hints.MentalHealth', conn)
-    hints_skn_prot = pd.read_sql('select * from hints.SkinProtection', conn)
-    hints_scl_det = pd.read_sql('select * from hints.SocialDeterminants', conn)
-    hints_tbco = pd.read_sql('select * from hints.Tobacco', conn)
-
-# Read Census tables
-if 'Census' in OPTIONS['datasets']:
-    census_geo_county = pd.read_sql('select * from census.GeographicCounty', conn)
-    census_geo_tract = pd.read_sql('select * from census.GeographicTract', conn)
-    census_sex_county = pd.read_sql('select * from census.SexCounty', conn)
-    census_sex_tract = pd.read_sql('select * from census.SexTract', conn)
-    
-
-if 'HPV' in OPTIONS['datasets']:
-    hpv = pd.read_sql('select * from vcaa.HPV2023 where [Survey Year] = \'2023\'')
-
-# Close the connection
-conn.close()
-print('pulled data from database')
-# %%
-
-# ----- State FIPS -----
-# This table is mostly for utility and won't be a part of the dataset directly
-
-# Only keep the columns we want
-state_fips = state_fips.drop('idStateFips', axis='columns')
-
-# Create version for just our five states
-aws_state_fips = state_fips[[x in AWS for x in state_fips['state']]]
-
-
-# ----- County FIPS -----
-# This table is mostly for utility and won't be a part of the dataset directly
-
-# Only keep the columns we want
-county_fips = county_fips.drop('idCountyFips', axis='columns')
-
-# Create version for just our five states
-aws_county_fips = county_fips[[x in AWS for x in county_fips['state']]]
-
-
-# ----- Tract FIPS -----
-# This table is mostly for utility and won't be a part of the dataset directly
-
-# Only keep the columns we want
-tract_fips = tract_fips.drop('idTractFips', axis='columns')
-
-# Create version for just our five states
-aws_tract_fips = tract_fips[[x in AWS for x in tract_fips['state']]]
-
-# %%
-
-# ----- AQI -------
-
-if 'AQI' in OPTIONS['datasets']:
-
-    # Filter aqi to area we serve
-    aqi = aqi[[x in AWS for x in aqi['state']]]
-
-    # Fill in NAs for missing counties
-    aqi = aqi.merge(aws_county_fips, how='outer', left_on='fips', right_on='fips')
-
-    # Only keep the columns we want
-    aqi = aqi.drop(['idAqi', 'state_x', 'county_x'], axis='columns')
-
-    # Create long data and rename columns
-    aqi_long = pd.melt(aqi, id_vars=['state_y', 'county_y', 'fips'], var_name='measure', value_name='value')
-    aqi_long.columns = ['State', 'County', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    aqi_long['cat'] = 'Environment'
-    aqi_long['RE'] = pd.NA
-    aqi_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    aqi_defs = json.load(open('setup/SHAPE/data/definitions/aqi.json'))
-    aqi_long['def'] = aqi_long['measure'].apply(lambda x: aqi_defs[x])
-
-    # Create format column
-    aqi_fmt = json.load(open('setup/SHAPE/data/formats/aqi.json'))
-    aqi_long['fmt'] = aqi_long['measure'].apply(lambda x: aqi_fmt[x])
-
-    # Create data source column
-    aqi_long['source'] = 'Environmental Protection Agency'
-
-    # Create label column
-    aqi_long['lbl'] = aqi_long['value'].apply(lambda x: str(x))
-
-    # Reorder columns
-    aqi_long = aqi_long[["cat","GEOID","County","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    aqi_long.to_csv('ShinyCIF/www/data/all_county.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = aqi_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-
-# %%
-
-# ----- Radon -------
-
-if 'Radon' in OPTIONS['datasets']:
-
-    # Filter radon to area we serve
-    radon = radon[[x in AWS for x in radon['state']]]
-
-    # Fill in NAs for missing counties
-    radon = radon.merge(aws_county_fips, how='outer', left_on='fips', right_on='fips')
-
-    # Only keep the columns we want
-    radon = radon[["state_y", "county_y", "fips", "indoorRadonPotential"]]
-
-    # Create long data and rename columns
-    radon_long = pd.melt(radon, id_vars=['state_y', 'county_y', 'fips'], var_name='measure', value_name='value')
-    radon_long.columns = ['State', 'County', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    radon_long['cat'] = 'Environment'
-    radon_long['RE'] = pd.NA
-    radon_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    radon_defs = json.load(open('setup/SHAPE/data/definitions/radon.json'))
-    radon_long['def'] = radon_long['measure'].apply(lambda x: radon_defs[x])
-
-    # Create format column
-    radon_fmt = json.load(open('setup/SHAPE/data/formats/radon.json'))
-    radon_long['fmt'] = radon_long['measure'].apply(lambda x: radon_fmt[x])
-
-    # Create data source column
-    radon_long['source'] = 'Environmental Protection Agency'
-
-    # Create label column
-    radon_long['lbl'] = radon_long['value'].apply(lambda x: str(x))
-
-    # Reorder columns
-    radon_long = radon_long[["cat","GEOID","County","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    radon_long.to_csv('ShinyCIF/www/data/all_county.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = radon_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-
-# %%
-
-# ----- BRFSS -----
-
-if 'BRFSS' in OPTIONS['datasets']:
-
-    # --- Breast and Cervical Cancer Screening table ---
-
-    # Filter to area we serve
-    brfss_brst_crvcl_scrn = brfss_brst_crvcl_scrn[[x in AWS for x in brfss_brst_crvcl_scrn['state']]]
-
-    # Add FIPS
-    brfss_brst_crvcl_scrn = brfss_brst_crvcl_scrn.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    brfss_brst_crvcl_scrn = brfss_brst_crvcl_scrn.drop(['idBreastAndCervicalCancerScreening', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    brfss_brst_crvcl_scrn_long = pd.melt(brfss_brst_crvcl_scrn, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    brfss_brst_crvcl_scrn_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    brfss_brst_crvcl_scrn_long['cat'] = 'Screening & Risk Factors'
-    brfss_brst_crvcl_scrn_long['RE'] = pd.NA
-    brfss_brst_crvcl_scrn_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    brfss_defs = json.load(open('setup/SHAPE/data/definitions/brfss.json'))
-    brfss_brst_crvcl_scrn_long['def'] = brfss_brst_crvcl_scrn_long['measure'].apply(lambda x: brfss_defs[x])
-
-    # Create format column
-    brfss_fmt = json.load(open('setup/SHAPE/data/formats/brfss.json'))
-    brfss_brst_crvcl_scrn_long['fmt'] = brfss_brst_crvcl_scrn_long['measure'].apply(lambda x: brfss_fmt[x])
-
-    # Create data source column
-    brfss_brst_crvcl_scrn_long['source'] = 'Behavioral Risk Factor Surveillance System'
-
-    # Create label column
-    brfss_brst_crvcl_scrn_long['lbl'] = brfss_brst_crvcl_scrn_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    brfss_brst_crvcl_scrn_long = brfss_brst_crvcl_scrn_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    brfss_brst_crvcl_scrn_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA")
-
-    # Add measures to measure dictionary
-    measures = brfss_brst_crvcl_scrn_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Cancer Insurance table ---
-
-    # Filter to area we serve
-    brfss_cncr_insr = brfss_cncr_insr[[x in AWS for x in brfss_cncr_insr['state']]]
-
-    # Add FIPS
-    brfss_cncr_insr = brfss_cncr_insr.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    brfss_cncr_insr = brfss_cncr_insr.drop(['idCancerInsurance', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    brfss_cncr_insr_long = pd.melt(brfss_cncr_insr, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    brfss_cncr_insr_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    brfss_cncr_insr_long['cat'] = 'Economics & Insurance'
-    brfss_cncr_insr_long['RE'] = pd.NA
-    brfss_cncr_insr_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    brfss_cncr_insr_long['def'] = brfss_cncr_insr_long['measure'].apply(lambda x: brfss_defs[x])
-
-    # Create format column
-    brfss_cncr_insr_long['fmt'] = brfss_cncr_insr_long['measure'].apply(lambda x: brfss_fmt[x])
-
-    # Create data source column
-    brfss_cncr_insr_long['source'] = 'Behavioral Risk Factor Surveillance System'
-
-    # Create label column
-    brfss_cncr_insr_long['lbl'] = brfss_cncr_insr_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    brfss_cncr_insr_long = brfss_cncr_insr_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    brfss_cncr_insr_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = brfss_cncr_insr_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Colorectal Cancer Screening table ---
-
-    # Filter to area we serve
-    brfss_crc_scrn = brfss_crc_scrn[[x in AWS for x in brfss_crc_scrn['state']]]
-
-    # Add FIPS
-    brfss_crc_scrn = brfss_crc_scrn.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    brfss_crc_scrn = brfss_crc_scrn.drop(['idColorectalCancerScreening', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    brfss_crc_scrn_long = pd.melt(brfss_crc_scrn, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    brfss_crc_scrn_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    brfss_crc_scrn_long['cat'] = 'Screening & Risk Factors'
-    brfss_crc_scrn_long['RE'] = pd.NA
-    brfss_crc_scrn_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    brfss_crc_scrn_long['def'] = brfss_crc_scrn_long['measure'].apply(lambda x: brfss_defs[x])
-
-    # Create format column
-    brfss_crc_scrn_long['fmt'] = brfss_crc_scrn_long['measure'].apply(lambda x: brfss_fmt[x])
-
-    # Create data source column
-    brfss_crc_scrn_long['source'] = 'Behavioral Risk Factor Surveillance System'
-
-    # Create label column
-    brfss_crc_scrn_long['lbl'] = brfss_crc_scrn_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    brfss_crc_scrn_long = brfss_crc_scrn_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    brfss_crc_scrn_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = brfss_crc_scrn_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Health Care Access table ---
-
-    # Filter to area we serve
-    brfss_hlth_care_acs = brfss_hlth_care_acs[[x in AWS for x in brfss_hlth_care_acs['state']]]
-
-    # Add FIPS
-    brfss_hlth_care_acs = brfss_hlth_care_acs.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    brfss_hlth_care_acs = brfss_hlth_care_acs.drop(['idHealthCareAccess', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    brfss_hlth_care_acs_long = pd.melt(brfss_hlth_care_acs, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    brfss_hlth_care_acs_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    brfss_hlth_care_acs_long['cat'] = 'Sociodemographics'
-    brfss_hlth_care_acs_long['RE'] = pd.NA
-    brfss_hlth_care_acs_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    brfss_hlth_care_acs_long['def'] = brfss_hlth_care_acs_long['measure'].apply(lambda x: brfss_defs[x])
-
-    # Create format column
-    brfss_hlth_care_acs_long['fmt'] = brfss_hlth_care_acs_long['measure'].apply(lambda x: brfss_fmt[x])
-
-    # Create data source column
-    brfss_hlth_care_acs_long['source'] = 'Behavioral Risk Factor Surveillance System'
-
-    # Create label column
-    brfss_hlth_care_acs_long['lbl'] = brfss_hlth_care_acs_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    brfss_hlth_care_acs_long = brfss_hlth_care_acs_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    brfss_hlth_care_acs_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = brfss_hlth_care_acs_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Lung Cancer Screening table ---
-
-    # Filter to area we serve
-    brfss_lng_scrn = brfss_lng_scrn[[x in AWS for x in brfss_lng_scrn['state']]]
-
-    # Add FIPS
-    brfss_lng_scrn = brfss_lng_scrn.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    brfss_lng_scrn = brfss_lng_scrn.drop(['idLungCancerScreening', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    brfss_lng_scrn_long = pd.melt(brfss_lng_scrn, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    brfss_lng_scrn_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    brfss_lng_scrn_long['cat'] = 'Screening & Risk Factors'
-    brfss_lng_scrn_long['RE'] = pd.NA
-    brfss_lng_scrn_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    brfss_lng_scrn_long['def'] = brfss_lng_scrn_long['measure'].apply(lambda x: brfss_defs[x])
-
-    # Create format column
-    brfss_lng_scrn_long['fmt'] = brfss_lng_scrn_long['measure'].apply(lambda x: brfss_fmt[x])
-
-    # Create data source column
-    brfss_lng_scrn_long['source'] = 'Behavioral Risk Factor Surveillance System'
-
-    # Create label column
-    brfss_lng_scrn_long['lbl'] = brfss_lng_scrn_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    brfss_lng_scrn_long = brfss_lng_scrn_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    brfss_lng_scrn_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = brfss_lng_scrn_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Mental Health table ---
-
-    # Filter to area we serve
-    brfss_mntl_hlth = brfss_mntl_hlth[[x in AWS for x in brfss_mntl_hlth['state']]]
-
-    # Add FIPS
-    brfss_mntl_hlth = brfss_mntl_hlth.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    brfss_mntl_hlth = brfss_mntl_hlth.drop(['idMentalHealth', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    brfss_mntl_hlth_long = pd.melt(brfss_mntl_hlth, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    brfss_mntl_hlth_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    brfss_mntl_hlth_long['cat'] = 'Other Health Factors'
-    brfss_mntl_hlth_long['RE'] = pd.NA
-    brfss_mntl_hlth_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    brfss_mntl_hlth_long['def'] = brfss_mntl_hlth_long['measure'].apply(lambda x: brfss_defs[x])
-
-    # Create format column
-    brfss_mntl_hlth_long['fmt'] = brfss_mntl_hlth_long['measure'].apply(lambda x: brfss_fmt[x])
-
-    # Create data source column
-    brfss_mntl_hlth_long['source'] = 'Behavioral Risk Factor Surveillance System'
-
-    # Create label column
-    brfss_mntl_hlth_long['lbl'] = brfss_mntl_hlth_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    brfss_mntl_hlth_long = brfss_mntl_hlth_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    brfss_mntl_hlth_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = brfss_mntl_hlth_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Social Determinants table ---
-
-    # Filter to area we serve
-    brfss_scl_det = brfss_scl_det[[x in AWS for x in brfss_scl_det['state']]]
-
-    # Add FIPS
-    brfss_scl_det = brfss_scl_det.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    brfss_scl_det = brfss_scl_det.drop(['idSocialDeterminants', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    brfss_scl_det_long = pd.melt(brfss_scl_det, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    brfss_scl_det_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    brfss_scl_det_long['cat'] = 'Sociodemographics'
-    brfss_scl_det_long['RE'] = pd.NA
-    brfss_scl_det_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    brfss_scl_det_long['def'] = brfss_scl_det_long['measure'].apply(lambda x: brfss_defs[x])
-
-    # Create format column
-    brfss_scl_det_long['fmt'] = brfss_scl_det_long['measure'].apply(lambda x: brfss_fmt[x])
-
-    # Create data source column
-    brfss_scl_det_long['source'] = 'Behavioral Risk Factor Surveillance System'
-
-    # Create label column
-    brfss_scl_det_long['lbl'] = brfss_scl_det_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    brfss_scl_det_long = brfss_scl_det_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    brfss_scl_det_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = brfss_scl_det_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Tobacco table ---
-
-    # Filter to area we serve
-    brfss_tbco = brfss_tbco[[x in AWS for x in brfss_tbco['state']]]
-
-    # Add FIPS
-    brfss_tbco = brfss_tbco.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    brfss_tbco = brfss_tbco.drop(['idTobacco', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    brfss_tbco_long = pd.melt(brfss_tbco, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    brfss_tbco_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    brfss_tbco_long['cat'] = 'Screening & Risk Factors'
-    brfss_tbco_long['RE'] = pd.NA
-    brfss_tbco_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    brfss_tbco_long['def'] = brfss_tbco_long['measure'].apply(lambda x: brfss_defs[x])
-
-    # Create format column
-    brfss_tbco_long['fmt'] = brfss_tbco_long['measure'].apply(lambda x: brfss_fmt[x])
-
-    # Create data source column
-    brfss_tbco_long['source'] = 'Behavioral Risk Factor Surveillance System'
-
-    # Create label column
-    brfss_tbco_long['lbl'] = brfss_tbco_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    brfss_tbco_long = brfss_tbco_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    brfss_tbco_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = brfss_tbco_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-# %%
-
-# ----- FCC -------
-
-if 'FCC' in OPTIONS['datasets']:
-
-    # --- Broadband County table ---
-
-    # Filter to area we serve
-    broadbandCounty = broadbandCounty[[x in AWS_FIPS for x in broadbandCounty['STATEID']]]
-
-    # Fill in NAs for missing counties
-    broadbandCounty = broadbandCounty.merge(aws_county_fips, how='outer', left_on='COUNTYID', right_on='fips')
-
-    # Get month and year
-    # Currently the tables only contain data for one month and year, so we are making that assumption here
-    # If that ever changes, we would need to change this code
-    month = broadbandCounty.at[0, 'MONTH']
-    year = broadbandCounty.at[0, 'YEAR']
-
-    # Only keep the columns we want
-    broadbandCounty = broadbandCounty.drop(['RecordID', 'STATEID', 'COUNTYID', 'TOT_POP', 'MONTH', 'YEAR'], axis='columns')
-
-    # Create long data and rename columns
-    broadbandCounty_long = pd.melt(broadbandCounty, id_vars=['state', 'county', 'fips'], var_name='measure', value_name='value')
-    broadbandCounty_long.columns = ['State', 'County', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    broadbandCounty_long['cat'] = 'Environment'
-    broadbandCounty_long['RE'] = pd.NA
-    broadbandCounty_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    fcc_defs = json.load(open('setup/SHAPE/data/definitions/fcc.json'))
-    broadbandCounty_long['def'] = broadbandCounty_long['measure'].apply(lambda x: fcc_defs[x])
-
-    # Create format column
-    fcc_fmt = json.load(open('setup/SHAPE/data/formats/fcc.json'))
-    broadbandCounty_long['fmt'] = broadbandCounty_long['measure'].apply(lambda x: fcc_fmt[x])
-
-    # Create data source column
-    broadbandCounty_long['source'] = f'FCC, {month} {year}'
-
-    # Create label column
-    broadbandCounty_long['lbl'] = broadbandCounty_long['value'].apply(lambda x: f'{x:.1f}')
-
-    # Reorder columns
-    broadbandCounty_long = broadbandCounty_long[["cat","GEOID","County","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    broadbandCounty_long.to_csv('ShinyCIF/www/data/all_county.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = broadbandCounty_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Broadband Tract table ---
-
-    # Filter to area we serve
-    broadbandTract = broadbandTract[[x in AWS_FIPS for x in broadbandTract['STATEID']]]
-
-    # Fill in NAs for missing tracts
-    broadbandTract = broadbandTract.merge(aws_tract_fips, how='outer', left_on='TRACTID', right_on='fips')
-
-    # Get month and year
-    # Currently the tables only contain data for one month and year, so we are making that assumption here
-    # If that ever changes, we would need to change this code
-    month = broadbandTract.at[0, 'MONTH']
-    year = broadbandTract.at[0, 'YEAR']
-
-    # Only keep the columns we want
-    broadbandTract = broadbandTract.drop(['RecordID', 'STATEID', 'TRACTID', 'TOT_POP', 'MONTH', 'YEAR'], axis='columns')
-
-    # Create long data and rename columns
-    broadbandTract_long = pd.melt(broadbandTract, id_vars=['state', 'county', 'tract', 'fips'], var_name='measure', value_name='value')
-    broadbandTract_long.columns = ['State', 'County', 'Tract', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    broadbandTract_long['cat'] = 'Environment'
-    broadbandTract_long['RE'] = pd.NA
-    broadbandTract_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    broadbandTract_long['def'] = broadbandTract_long['measure'].apply(lambda x: fcc_defs[x])
-
-    # Create format column
-    broadbandTract_long['fmt'] = broadbandTract_long['measure'].apply(lambda x: fcc_fmt[x])
-
-    # Create data source column
-    broadbandTract_long['source'] = f'FCC, {month} {year}'
-
-    # Create label column
-    broadbandTract_long['lbl'] = broadbandTract_long['value'].apply(lambda x: f'{x:.1f}')
-
-    # Reorder columns
-    broadbandTract_long = broadbandTract_long[["cat","GEOID","Tract","County","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    broadbandTract_long.to_csv('ShinyCIF/www/data/all_tract.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Measures are the same as county, so they are already in the measure dictionary
-
-    # %%
-
-    # --- Mobile County table ---
-
-    # Filter to area we serve
-    mobileCounty = mobileCounty[[x in AWS_FIPS for x in mobileCounty['STATEID']]]
-
-    # Fill in NAs for missing counties
-    mobileCounty = mobileCounty.merge(aws_county_fips, how='outer', left_on='COUNTYID', right_on='fips')
-
-    # Get month and year
-    # Currently the tables only contain data for one month and year, so we are making that assumption here
-    # If that ever changes, we would need to change this code
-    month = mobileCounty.at[0, 'MONTH']
-    year = mobileCounty.at[0, 'YEAR']
-
-    # Only keep the columns we want
-    mobileCounty = mobileCounty.drop(['RecordID', 'STATEID', 'COUNTYID', 'TOT_POP', 'MONTH', 'YEAR'], axis='columns')
-
-    # Create long data and rename columns
-    mobileCounty_long = pd.melt(mobileCounty, id_vars=['state', 'county', 'fips'], var_name='measure', value_name='value')
-    mobileCounty_long.columns = ['State', 'County', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    mobileCounty_long['cat'] = 'Environment'
-    mobileCounty_long['RE'] = pd.NA
-    mobileCounty_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    mobileCounty_long['def'] = mobileCounty_long['measure'].apply(lambda x: fcc_defs[x])
-
-    # Create format column
-    mobileCounty_long['fmt'] = mobileCounty_long['measure'].apply(lambda x: fcc_fmt[x])
-
-    # Create data source column
-    mobileCounty_long['source'] = f'FCC, {month} {year}'
-
-    # Create label column
-    mobileCounty_long['lbl'] = mobileCounty_long['value'].apply(lambda x: f'{x:.1f}')
-
-    # Reorder columns
-    mobileCounty_long = mobileCounty_long[["cat","GEOID","County","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    mobileCounty_long.to_csv('ShinyCIF/www/data/all_county.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = mobileCounty_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Mobile Tract table ---
-
-    # Filter to area we serve
-    mobileTract = mobileTract[[x in AWS_FIPS for x in mobileTract['STATEID']]]
-
-    # Fill in NAs for missing tracts
-    mobileTract = mobileTract.merge(aws_tract_fips, how='outer', left_on='TRACTID', right_on='fips')
-
-    # Get month and year
-    # Currently the tables only contain data for one month and year, so we are making that assumption here
-    # If that ever changes, we would need to change this code
-    month = mobileTract.at[0, 'MONTH']
-    year = mobileTract.at[0, 'YEAR']
-
-    # Only keep the columns we want
-    mobileTract = mobileTract.drop(['RecordID', 'STATEID', 'TRACTID', 'TOT_POP', 'MONTH', 'YEAR'], axis='columns')
-
-    # Create long data and rename columns
-    mobileTract_long = pd.melt(mobileTract, id_vars=['state', 'county', 'tract', 'fips'], var_name='measure', value_name='value')
-    mobileTract_long.columns = ['State', 'County', 'Tract', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    mobileTract_long['cat'] = 'Environment'
-    mobileTract_long['RE'] = pd.NA
-    mobileTract_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    mobileTract_long['def'] = mobileTract_long['measure'].apply(lambda x: fcc_defs[x])
-
-    # Create format column
-    mobileTract_long['fmt'] = mobileTract_long['measure'].apply(lambda x: fcc_fmt[x])
-
-    # Create data source column
-    mobileTract_long['source'] = f'FCC, {month} {year}'
-
-    # Create label column
-    mobileTract_long['lbl'] = mobileTract_long['value'].apply(lambda x: f'{x:.1f}')
-
-    # Reorder columns
-    mobileTract_long = mobileTract_long[["cat","GEOID","Tract","County","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    mobileTract_long.to_csv('ShinyCIF/www/data/all_tract.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Measures are the same as county, so they are already in the measure dictionary
-
-# %%
-
-# ----- HINTS -----
-
-if 'HINTS' in OPTIONS['datasets']:
-
-    # --- Cancer Communication table ---
-
-    # Filter to area we serve
-    hints_cncr_com = hints_cncr_com[[x in AWS for x in hints_cncr_com['state']]]
-
-    # Add FIPS
-    hints_cncr_com = hints_cncr_com.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    hints_cncr_com = hints_cncr_com.drop(['idCancerCommunication', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    hints_cncr_com_long = pd.melt(hints_cncr_com, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    hints_cncr_com_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    hints_cncr_com_long['cat'] = 'Cancer Communication & Perceptions'
-    hints_cncr_com_long['RE'] = pd.NA
-    hints_cncr_com_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    hints_defs = json.load(open('setup/SHAPE/data/definitions/hints.json'))
-    hints_cncr_com_long['def'] = hints_cncr_com_long['measure'].apply(lambda x: hints_defs[x])
-
-    # Create format column
-    hints_fmt = json.load(open('setup/SHAPE/data/formats/hints.json'))
-    hints_cncr_com_long['fmt'] = hints_cncr_com_long['measure'].apply(lambda x: hints_fmt[x])
-
-    # Create data source column
-    hints_cncr_com_long['source'] = 'Health Information National Trends Survey'
-
-    # Create label column
-    hints_cncr_com_long['lbl'] = hints_cncr_com_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    hints_cncr_com_long = hints_cncr_com_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    hints_cncr_com_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = hints_cncr_com_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Cancer Perceptions table ---
-
-    # Filter to area we serve
-    hints_cncr_percep = hints_cncr_percep[[x in AWS for x in hints_cncr_percep['state']]]
-
-    # Add FIPS
-    hints_cncr_percep = hints_cncr_percep.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    hints_cncr_percep = hints_cncr_percep.drop(['idCancerPerceptions', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    hints_cncr_percep_long = pd.melt(hints_cncr_percep, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    hints_cncr_percep_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    hints_cncr_percep_long['cat'] = 'Cancer Communication & Perceptions'
-    hints_cncr_percep_long['RE'] = pd.NA
-    hints_cncr_percep_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    hints_cncr_percep_long['def'] = hints_cncr_percep_long['measure'].apply(lambda x: hints_defs[x])
-
-    # Create format column
-    hints_cncr_percep_long['fmt'] = hints_cncr_percep_long['measure'].apply(lambda x: hints_fmt[x])
-
-    # Create data source column
-    hints_cncr_percep_long['source'] = 'Health Information National Trends Survey'
-
-    # Create label column
-    hints_cncr_percep_long['lbl'] = hints_cncr_percep_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    hints_cncr_percep_long = hints_cncr_percep_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    hints_cncr_percep_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = hints_cncr_percep_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Cervical Cancer table ---
-
-    # Filter to area we serve
-    hints_crvcl_cncr = hints_crvcl_cncr[[x in AWS for x in hints_crvcl_cncr['state']]]
-
-    # Add FIPS
-    hints_crvcl_cncr = hints_crvcl_cncr.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    hints_crvcl_cncr = hints_crvcl_cncr.drop(['idCervicalCancer', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    hints_crvcl_cncr_long = pd.melt(hints_crvcl_cncr, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    hints_crvcl_cncr_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    hints_crvcl_cncr_long['cat'] = 'Screening & Risk Factors'
-    hints_crvcl_cncr_long['RE'] = pd.NA
-    hints_crvcl_cncr_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    hints_crvcl_cncr_long['def'] = hints_crvcl_cncr_long['measure'].apply(lambda x: hints_defs[x])
-
-    # Create format column
-    hints_crvcl_cncr_long['fmt'] = hints_crvcl_cncr_long['measure'].apply(lambda x: hints_fmt[x])
-
-    # Create data source column
-    hints_crvcl_cncr_long['source'] = 'Health Information National Trends Survey'
-
-    # Create label column
-    hints_crvcl_cncr_long['lbl'] = hints_crvcl_cncr_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    hints_crvcl_cncr_long = hints_crvcl_cncr_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    hints_crvcl_cncr_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = hints_crvcl_cncr_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Clinical Trials table ---
-
-    # Filter to area we serve
-    hints_clin_trial = hints_clin_trial[[x in AWS for x in hints_clin_trial['state']]]
-
-    # Add FIPS
-    hints_clin_trial = hints_clin_trial.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    hints_clin_trial = hints_clin_trial.drop(['idClinicalTrials', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    hints_clin_trial_long = pd.melt(hints_clin_trial, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    hints_clin_trial_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    hints_clin_trial_long['cat'] = 'Clinical Trials'
-    hints_clin_trial_long['RE'] = pd.NA
-    hints_clin_trial_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    hints_clin_trial_long['def'] = hints_clin_trial_long['measure'].apply(lambda x: hints_defs[x])
-
-    # Create format column
-    hints_clin_trial_long['fmt'] = hints_clin_trial_long['measure'].apply(lambda x: hints_fmt[x])
-
-    # Create data source column
-    hints_clin_trial_long['source'] = 'Health Information National Trends Survey'
-
-    # Create label column
-    hints_clin_trial_long['lbl'] = hints_clin_trial_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    hints_clin_trial_long = hints_clin_trial_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    hints_clin_trial_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = hints_clin_trial_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Lung Cancer table ---
-
-    # Filter to area we serve
-    hints_lng_cncr = hints_lng_cncr[[x in AWS for x in hints_lng_cncr['state']]]
-
-    # Add FIPS
-    hints_lng_cncr = hints_lng_cncr.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    hints_lng_cncr = hints_lng_cncr.drop(['idLungCancer', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    hints_lng_cncr_long = pd.melt(hints_lng_cncr, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    hints_lng_cncr_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    hints_lng_cncr_long['cat'] = 'Screening & Risk Factors'
-    hints_lng_cncr_long['RE'] = pd.NA
-    hints_lng_cncr_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    hints_lng_cncr_long['def'] = hints_lng_cncr_long['measure'].apply(lambda x: hints_defs[x])
-
-    # Create format column
-    hints_lng_cncr_long['fmt'] = hints_lng_cncr_long['measure'].apply(lambda x: hints_fmt[x])
-
-    # Create data source column
-    hints_lng_cncr_long['source'] = 'Health Information National Trends Survey'
-
-    # Create label column
-    hints_lng_cncr_long['lbl'] = hints_lng_cncr_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    hints_lng_cncr_long = hints_lng_cncr_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    hints_lng_cncr_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = hints_lng_cncr_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Mental Health table ---
-
-    # Filter to area we serve
-    hints_mntl_hlth = hints_mntl_hlth[[x in AWS for x in hints_mntl_hlth['state']]]
-
-    # Add FIPS
-    hints_mntl_hlth = hints_mntl_hlth.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    hints_mntl_hlth = hints_mntl_hlth.drop(['idMentalHealth', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    hints_mntl_hlth_long = pd.melt(hints_mntl_hlth, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    hints_mntl_hlth_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    hints_mntl_hlth_long['cat'] = 'Other Health Factors'
-    hints_mntl_hlth_long['RE'] = pd.NA
-    hints_mntl_hlth_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    hints_mntl_hlth_long['def'] = hints_mntl_hlth_long['measure'].apply(lambda x: hints_defs[x])
-
-    # Create format column
-    hints_mntl_hlth_long['fmt'] = hints_mntl_hlth_long['measure'].apply(lambda x: hints_fmt[x])
-
-    # Create data source column
-    hints_mntl_hlth_long['source'] = 'Health Information National Trends Survey'
-
-    # Create label column
-    hints_mntl_hlth_long['lbl'] = hints_mntl_hlth_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    hints_mntl_hlth_long = hints_mntl_hlth_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    hints_mntl_hlth_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = hints_mntl_hlth_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Skin Protection table ---
-
-    # Filter to area we serve
-    hints_skn_prot = hints_skn_prot[[x in AWS for x in hints_skn_prot['state']]]
-
-    # Add FIPS
-    hints_skn_prot = hints_skn_prot.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    hints_skn_prot = hints_skn_prot.drop(['idSkinProtection', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    hints_skn_prot_long = pd.melt(hints_skn_prot, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    hints_skn_prot_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    hints_skn_prot_long['cat'] = 'Screening & Risk Factors'
-    hints_skn_prot_long['RE'] = pd.NA
-    hints_skn_prot_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    hints_skn_prot_long['def'] = hints_skn_prot_long['measure'].apply(lambda x: hints_defs[x])
-
-    # Create format column
-    hints_skn_prot_long['fmt'] = hints_skn_prot_long['measure'].apply(lambda x: hints_fmt[x])
-
-    # Create data source column
-    hints_skn_prot_long['source'] = 'Health Information National Trends Survey'
-
-    # Create label column
-    hints_skn_prot_long['lbl'] = hints_skn_prot_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    hints_skn_prot_long = hints_skn_prot_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    hints_skn_prot_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = hints_skn_prot_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Social Determinants table ---
-
-    # Filter to area we serve
-    hints_scl_det = hints_scl_det[[x in AWS for x in hints_scl_det['state']]]
-
-    # Add FIPS
-    hints_scl_det = hints_scl_det.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    hints_scl_det = hints_scl_det.drop(['idSocialDeterminants', 'stateAbbreviation'], axis='columns')
-
-    # Create long data and rename columns
-    hints_scl_det_long = pd.melt(hints_scl_det, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    hints_scl_det_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    hints_scl_det_long['cat'] = 'Sociodemographics'
-    hints_scl_det_long['RE'] = pd.NA
-    hints_scl_det_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    hints_scl_det_long['def'] = hints_scl_det_long['measure'].apply(lambda x: hints_defs[x])
-
-    # Create format column
-    hints_scl_det_long['fmt'] = hints_scl_det_long['measure'].apply(lambda x: hints_fmt[x])
-
-    # Create data source column
-    hints_scl_det_long['source'] = 'Health Information National Trends Survey'
-
-    # Create label column
-    hints_scl_det_long['lbl'] = hints_scl_det_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    hints_scl_det_long = hints_scl_det_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    hints_scl_det_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = hints_scl_det_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-    # %%
-
-    # --- Tobacco table ---
-
-    # Filter to area we serve
-    hints_tbco = hints_tbco[[x in AWS for x in hints_tbco['state']]]
-
-    # Add FIPS
-    hints_tbco = hints_tbco.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    hints_tbco = hints_tbco.drop(['idTobacco', 'stateAbbreviation', 'currentSmokers', 'formerSmokers', 'neverSmoked', 'everSmokedAtLeast100Cigarettes', 'haventEverSmokedAtLeast100Cigarettes', 'neverUsedECigs'], axis='columns')
-
-    # Create long data and rename columns
-    hints_tbco_long = pd.melt(hints_tbco, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    hints_tbco_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    hints_tbco_long['cat'] = 'Screening & Risk Factors'
-    hints_tbco_long['RE'] = pd.NA
-    hints_tbco_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    hints_tbco_long['def'] = hints_tbco_long['measure'].apply(lambda x: hints_defs[x])
-
-    # Create format column
-    hints_tbco_long['fmt'] = hints_tbco_long['measure'].apply(lambda x: hints_fmt[x])
-
-    # Create data source column
-    hints_tbco_long['source'] = 'Health Information National Trends Survey'
-
-    # Create label column
-    hints_tbco_long['lbl'] = hints_tbco_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
-
-    # Reorder columns
-    hints_tbco_long = hints_tbco_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
-
-    # Append to county column
-    hints_tbco_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
-
-    # Add measures to measure dictionary
-    measures = hints_tbco_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
-
-# %%
-
-# --- HPV ---
-
-if 'HPV' in OPTIONS['datasets']:
-
-    # Filter to area we serve
-    hpv = hpv[[x in AWS for x in hpv['Geography']]]
-
-    # Add FIPS
-    hpv = hpv.merge(aws_state_fips, how='outer', on='state')
-
-    # Only keep the columns we want
-    hpv = hpv.drop(['idTobacco', 'stateAbbreviation', 'currentSmokers', 'formerSmokers', 'neverSmoked', 'everSmokedAtLeast100Cigarettes', 'haventEverSmokedAtLeast100Cigarettes', 'neverUsedECigs'], axis='columns')
-
-    # Create long data and rename columns
-    hpv_long = pd.melt(hpv, id_vars=['state', 'fips'], var_name='measure', value_name='value')
-    hpv_long.columns = ['State', 'GEOID', 'measure', 'value']
-
-    # Create columns for category, race/ethnicity, and sex
-    hpv_long['cat'] = 'Screening & Risk Factors'
-    hpv_long['RE'] = pd.NA
-    hpv_long['Sex'] = pd.NA
-
-    # Create measure definitions column
-    hpv_long['def'] = hpv_long['measure'].apply(lambda x: hints_defs[x])
-
-    # Create format column
-    hpv_long['fmt'] = hpv_long['measure'].apply(lambda x: hints_fmt[x])
-
-    # Create data source column
-    hpv_long['source'] = 'Health Information National Trends Survey'
-
-    # Create label column
-    hpv_long['lbl'] = hpv_long['value'].apply(lambda x: f'{x * 100:.1f}%' if not pd.isna(x) else x)
 
-    # Reorder columns
-    hpv_long = hpv_long[["cat","GEOID","State","measure","value","RE","Sex","def","fmt","source","lbl"]]
+# Only pull tables at these geography levels (None for all of them)
+OPTIONS['levels'] = None
 
-    # Append to county column
-    hpv_long.to_csv('ShinyCIF/www/data/all_state.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep="NA", header=False, mode='a')
+# Worker processes transforming datasets side by side (1 runs everything in this process)
+OPTIONS['jobs'] = 1
 
-    # Add measures to measure dictionary
-    measures = hpv_long[['measure', 'def', 'fmt', 'source']].drop_duplicates()
-    # measures.to_csv('ShinyCIF/www/measure_dictionary_v5.csv', index=False, na_rep="NA", header=False, mode='a')
\ No newline at end of file
+# Max number of tables read from SHAPE at the same time, shared between the workers
+OPTIONS['max_concurrency'] = 4
+
+# Filter to the area we serve and drop unused columns in SQL instead of after the read
+OPTIONS['pushdown'] = True
+
+# How result sets are fetched: 'arrow' (Arrow-native driver, falls back to pandas if there
+# isn't one) or 'pandas' (pd.read_sql)
+OPTIONS['reader'] = 'arrow'
+
+# Give tables compact dtypes as they're read (float32, small ints, categoricals, Int64 FIPS),
+# see schema.py. The all_* files come out the same either way
+OPTIONS['compact_dtypes'] = True
+
+# How the all_* rows are turned into CSV text: 'fast' (fast_csv.py, column at a time) or
+# 'pandas' (DataFrame.to_csv). Both write the same bytes
+OPTIONS['csv_writer'] = 'fast'
+
+# Stream tract tables in chunks instead of loading them whole, keeping each chunk inside the memory budget
+OPTIONS['streaming'] = False
+OPTIONS['memory_budget_mb'] = 512
+
+# Also write normalized fact/measure/geography tables next to the all_* files
+OPTIONS['normalized'] = False
+
+# Also write the all_* files as a Parquet dataset partitioned by level and cat (see parquet_dataset.py)
+OPTIONS['parquet'] = True
+
+# Re-read the FIPS tables from SHAPE even if the snapshot in setup/SHAPE/data/geography is current
+OPTIONS['refresh_geography'] = False
+
+# Checkpoint each table's extract and transform output so a failed run picks up where it stopped
+OPTIONS['checkpoints'] = True
+
+# Skip tables whose fingerprint in SHAPE hasn't changed since they were last written
+OPTIONS['incremental'] = True
+
+# JSON file of catchment definitions to build in one pass instead of AWS (see catchments.py)
+OPTIONS['catchments'] = None
+
+# Pull every state instead of AWS, sharded by state across the jobs (see national.py)
+OPTIONS['national'] = False
+
+# Profile the run on top of the always-on run report: None, 'cprofile' or 'tracemalloc'
+OPTIONS['profile'] = None
+
+DATASETS = list(dict.fromkeys(spec['dataset'] for spec in TABLE_SPECS))
+
+
+def load_login():
+    # Make sure SQL login is configured
+    # Set "standin" to a directory of <schema>.db SQLite files to run against a local stand-in
+    # (python setup/SHAPE/standin.py DIR generates one)
+    try:
+        return json.load(open(LOGIN_PATH))
+    except:
+        raise Exception('Use sql_login_template.json to fill in the login information for sql server then change the name to sql_login.json')
+        # If you don't know the SQL server login, ask the RISR contact. Right now, it's Douglas Canada
+
+
+def select_specs(options):
+    # Specs for the selected datasets and levels, split into in-memory and streamed ones
+    specs = specs_for(options['datasets'])
+    if options['levels']:
+        specs = [spec for spec in specs if spec['level'] in options['levels']]
+    streamed = [spec for spec in specs if options['streaming'] and spec['level'] == 'tract']
+    return [spec for spec in specs if spec not in streamed], streamed
+
+
+def dry_run(options):
+    # Print what a run would read and write without touching the database
+    specs, streamed = select_specs(options)
+    print(f"datasets: {', '.join(options['datasets'])}  jobs: {options['jobs']}")
+    for spec in specs + streamed:
+        mode = 'streamed' if spec in streamed else 'in memory'
+        write = 'starts over' if spec.get('overwrite') else 'upserts into'
+        print(f"  {spec['table']:<42} {spec['level']:<7} {mode:<10} {write} {TARGETS[spec['level']]}")
+    if not specs and not streamed:
+        print('  nothing selected')
+
+
+def pull_dataset(login, specs, geo, aws_fips, options, max_concurrency, nodes=None):
+    # Read and transform a group of tables on their own connection pool
+    # Returns the long frames by spec name and the run report records for them
+    # With checkpoint nodes, tables pick up from their last checkpointed stage and
+    # each stage's output is checkpointed as soon as it's done
+    import checkpoint
+    from extract import create_engine, extract, report_timings
+    from pipeline import transform
+    from report import record_queries
+
+    run = {'stages': []}
+    longs = {}
+    frames = {}
+    for spec in specs:
+        node = nodes[spec['name']] if nodes else None
+        if node is None:
+            continue
+        long = checkpoint.load(spec['name'], 'transform', node['transform'])
+        if long is not None:
+            longs[spec['name']] = long
+            print(f"  {spec['name']}: resumed after transform")
+            continue
+        frame = checkpoint.load(spec['name'], 'extract', node['extract'])
+        if frame is not None:
+            frames[spec['name']] = frame
+            print(f"  {spec['name']}: resumed after extract")
+
+    reads = [spec for spec in specs if spec['name'] not in longs and spec['name'] not in frames]
+    if reads:
+        def save(spec, df):
+            checkpoint.save(spec['name'], 'extract', nodes[spec['name']]['extract'], df)
+
+        engine = create_engine(login, max_concurrency)
+        try:
+            read, timings = extract(engine, reads, AWS, aws_fips, max_concurrency, options['pushdown'],
+                                    on_read=save if nodes else None, reader=options['reader'],
+                                    compact=options['compact_dtypes'])
+        finally:
+            engine.dispose()
+        report_timings(timings)
+        record_queries(run, reads, timings)
+        frames.update(read)
+
+    for spec in specs:
+        if spec['name'] in longs:
+            continue
+        long = transform(frames.pop(spec['name']), spec, geo, AWS, aws_fips, run)
+        if nodes:
+            checkpoint.save(spec['name'], 'transform', nodes[spec['name']]['transform'], long)
+        longs[spec['name']] = long
+    return longs, run['stages']
+
+
+def run(options=OPTIONS):
+    # One pull with the given options
+    if options['catchments']:
+        import catchments
+        return catchments.run(options)
+    if options['national']:
+        import national
+        return national.run(options)
+
+    import checkpoint
+    import incremental
+    import memory
+    import report
+    from extract import create_engine
+    from geography import load_registry, catchment_index, catchment, catchment_fips
+    from pipeline import write
+    from writers import finish
+    from streaming import stream_table
+    from normalize import write_normalized
+    from parquet_dataset import PARQUET_DIR, write_parquet
+    from schema import compact_geography
+
+    print('pull shape')
+    pull = report.start_run(options)
+    login = load_login()
+
+    # Setup connection pool to SHAPE
+    engine = create_engine(login, options['max_concurrency'])
+
+    # ----- FIPS -----
+    # State, county and tract FIPS tables come from the snapshot unless SHAPE has changed
+    # Only keep our five states for the state, county and tract FIPS tables
+    registry = load_registry(engine, options['refresh_geography'])
+    index = catchment_index(registry, AWS)
+    geo = catchment(registry, index)
+    aws_fips = catchment_fips(registry, index)
+    if options['compact_dtypes']:
+        geo = compact_geography(geo)
+
+    # ----- Datasets -----
+    # Every table goes through the same path, see specs.py for what each one does
+    specs, streamed = select_specs(options)
+    if options['streaming']:
+        memory.start()
+
+    selected = specs + streamed
+    nodes = checkpoint.plan(selected, geo, AWS, aws_fips, options)
+    if options['incremental']:
+        sources = incremental.source_fingerprints(engine, selected, AWS, aws_fips)
+
+    # Tables whose write already finished in a run that failed later are skipped
+    if options['checkpoints']:
+        done = [spec for spec in selected if checkpoint.finished(spec['name'], nodes[spec['name']]['write'])]
+        if done:
+            print(f"resuming, {len(done)} tables already written: {', '.join(spec['name'] for spec in done)}")
+        specs = [spec for spec in specs if spec not in done]
+        streamed = [spec for spec in streamed if spec not in done]
+
+    # Tables that haven't changed in SHAPE (or here) since they were last written are skipped
+    if options['incremental']:
+        same = incremental.unchanged(specs + streamed, sources, nodes)
+        if same:
+            print(f"{len(same)} tables unchanged since the last pull: {', '.join(spec['name'] for spec in same)}")
+        specs = [spec for spec in specs if spec not in same]
+        streamed = [spec for spec in streamed if spec not in same]
+        selected = [spec for spec in selected if spec not in same]
+    checkpoints = nodes if options['checkpoints'] else None
+
+    groups = {}
+    for spec in specs:
+        groups.setdefault(spec['dataset'], []).append(spec)
+
+    jobs = min(options['jobs'], len(groups))
+    if jobs > 1:
+        # Split the connection budget between the workers so SHAPE never sees more than max_concurrency
+        per_job = max(1, options['max_concurrency'] // jobs)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(pull_dataset, login, group, geo, aws_fips, options, per_job, checkpoints) for group in groups.values()]
+            results = [future.result() for future in futures]
+    elif specs:
+        results = [pull_dataset(login, specs, geo, aws_fips, options, options['max_concurrency'], checkpoints)]
+    else:
+        results = []
+    print('pulled data from database')
+
+    # Write in spec order whatever order the workers finished in
+    longs = {}
+    for frames, stages in results:
+        longs.update(frames)
+        pull['stages'].extend(stages)
+    for spec in specs:
+        write(longs.pop(spec['name']), spec, pull, writer=options['csv_writer'])
+        if checkpoints:
+            checkpoint.mark_finished(spec['name'], nodes[spec['name']]['write'])
+
+    # ----- Streamed tables -----
+    # Tract tables in streaming mode are read, transformed and written one chunk at a time
+    for spec in streamed:
+        peaks = stream_table(engine, spec, geo, AWS, aws_fips, options['memory_budget_mb'], options['pushdown'], pull,
+                             options['compact_dtypes'], options['csv_writer'])
+        memory.report_peaks(spec['name'], peaks)
+        if checkpoints:
+            checkpoint.mark_finished(spec['name'], nodes[spec['name']]['write'])
+    if streamed:
+        print(f'peak memory {memory.peak_rss_mb():.0f} MB')
+
+    # Drop the rows this run replaced, now that every table is written
+    finish()
+
+    # Release the pooled connections
+    engine.dispose()
+
+    # ----- Normalized output -----
+    if options['normalized']:
+        print('writing normalized tables')
+        # Levels no run has written yet have nothing to normalize
+        for level in TARGETS:
+            if os.path.exists(TARGETS[level]):
+                write_normalized(level)
+
+    # ----- Parquet dataset -----
+    # Rewritten for the levels this run wrote to (and any the dataset doesn't have yet)
+    if options['parquet']:
+        levels = {spec['level'] for spec in selected}
+        levels.update(level for level in TARGETS if not os.path.exists(os.path.join(PARQUET_DIR, f'level={level}')))
+        levels = [level for level in TARGETS if level in levels and os.path.exists(TARGETS[level])]
+        if levels:
+            print('writing Parquet dataset')
+        for level in levels:
+            write_parquet(level)
+
+    # Everything is written, so the next run starts from SHAPE again
+    if checkpoints:
+        checkpoint.clear()
+    if options['incremental']:
+        incremental.record(selected, sources, nodes)
+
+    # ----- Run report -----
+    # Per table and per stage rows, time and memory, written next to the all_* files
+    return report.finish_run(pull)
+
+
+def parse_args(argv):
+    # Options for this run: OPTIONS with whatever the command line changes
+    parser = argparse.ArgumentParser(description='Pull SHAPE tables into the ShinyCIF all_* files')
+    parser.add_argument('--datasets', type=lambda text: text.split(','), default=OPTIONS['datasets'],
+                        help=f"comma separated datasets out of {','.join(DATASETS)} (default {','.join(OPTIONS['datasets'])})")
+    parser.add_argument('--level', dest='levels', action='append', choices=list(TARGETS),
+                        help='only pull tables at this level (can be repeated)')
+    parser.add_argument('--jobs', type=int, default=OPTIONS['jobs'], help='worker processes for datasets')
+    parser.add_argument('--max-concurrency', type=int, default=OPTIONS['max_concurrency'])
+    parser.add_argument('--no-pushdown', dest='pushdown', action='store_false', default=OPTIONS['pushdown'])
+    parser.add_argument('--reader', choices=['arrow', 'pandas'], default=OPTIONS['reader'])
+    parser.add_argument('--no-compact-dtypes', dest='compact_dtypes', action='store_false',
+                        default=OPTIONS['compact_dtypes'], help='keep the dtypes the reader gives')
+    parser.add_argument('--csv-writer', choices=['fast', 'pandas'], default=OPTIONS['csv_writer'])
+    parser.add_argument('--streaming', action='store_true', default=OPTIONS['streaming'])
+    parser.add_argument('--memory-budget-mb', type=int, default=OPTIONS['memory_budget_mb'])
+    parser.add_argument('--normalized', action='store_true', default=OPTIONS['normalized'])
+    parser.add_argument('--no-parquet', dest='parquet', action='store_false', default=OPTIONS['parquet'])
+    parser.add_argument('--refresh-geography', action='store_true', default=OPTIONS['refresh_geography'])
+    parser.add_argument('--no-checkpoints', dest='checkpoints', action='store_false', default=OPTIONS['checkpoints'])
+    parser.add_argument('--full', dest='incremental', action='store_false', default=OPTIONS['incremental'],
+                        help='read and write every selected table even if it hasn\'t changed')
+    parser.add_argument('--catchments', default=OPTIONS['catchments'],
+                        help='JSON file of catchments to pull in one pass (see catchments.py)')
+    parser.add_argument('--national', action='store_true', default=OPTIONS['national'],
+                        help='pull every state, one partition per state (see national.py)')
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], default=OPTIONS['profile'])
+    parser.add_argument('--dry-run', action='store_true', help='show what would be pulled and written, then stop')
+    args = parser.parse_args(argv)
+
+    unknown = [dataset for dataset in args.datasets if dataset not in DATASETS]
+    if unknown:
+        parser.error(f"unknown datasets {unknown}, expected some of {DATASETS}")
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    options = dict(OPTIONS, **{key: value for key, value in vars(args).items() if key != 'dry_run'})
+    options['levels'] = args.levels or OPTIONS['levels']
+    return options, args.dry_run
+
+
+def main(argv=None):
+    options, dry = parse_args(sys.argv[1:] if argv is None else argv)
+    if dry:
+        dry_run(options)
+    else:
+        run(options)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Reader backends for the SHAPE pull
+#
+#   pandas  pd.read_sql over the SQLAlchemy connection: the driver hands back row
+#           tuples of Python objects and pandas rebuilds columns from them
+#   arrow   the query goes to an Arrow-native driver (arrow-odbc for SQL Server, ADBC
+#           for the SQLite stand-in), which fills typed columns batch by batch with no
+#           per-row Python objects, and the frame is built from the Arrow table
+#
+# The arrow backend needs pyarrow plus the driver for the database. When either is
+# missing (arrow-odbc also needs unixODBC installed) the read falls back to pandas,
+# once per process with a message.
+#
+# Readers check their own connection out of the engine's pool, or open the Arrow
+# driver's, so a read never holds more than one connection and the pull stays within
+# max_concurrency of them (see extract.py).
+
+import pandas as pd
+
+# Rows per Arrow record batch
+BATCH_ROWS = 65536
+
+# Odbc driver the SQL Server engine is set up with in extract.create_engine
+ODBC_DRIVER = 'ODBC Driver 18 for SQL Server'
+
+_FALLBACK = {}
+
+
+class ArrowUnavailable(Exception):
+    # No Arrow driver for this kind of database, so reads go through pandas
+    pass
+
+
+def read_pandas(engine, query):
+    with engine.connect() as conn:
+        return pd.read_sql(query, conn)
+
+
+def compile_query(engine, query):
+    # SQL text for the query with its parameters inlined, for drivers outside SQLAlchemy
+    if isinstance(query, str):
+        return query
+    return str(query.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+
+
+def odbc_value(value):
+    # Braced connection string value, so ; = and } in a password can't end it early
+    return '{' + str(value).replace('}', '}}') + '}'
+
+
+def odbc_connection_string(url):
+    return (f"Driver={odbc_value(url.query.get('driver', ODBC_DRIVER))};Server={odbc_value(url.host)};"
+            f"Database={odbc_value(url.database)};UID={odbc_value(url.username)};PWD={odbc_value(url.password)};"
+            f"TrustServerCertificate=yes")
+
+
+def fetch_arrow(engine, sql):
+    # Arrow table for a query, from the driver that fits the engine
+    import pyarrow as pa
+
+    if engine.dialect.name == 'mssql':
+        from arrow_odbc import read_arrow_batches_from_odbc
+        reader = read_arrow_batches_from_odbc(query=sql, connection_string=odbc_connection_string(engine.url),
+                                              batch_size=BATCH_ROWS)
+        return pa.Table.from_batches(list(reader), schema=reader.schema)
+
+    if engine.dialect.name == 'sqlite' and hasattr(engine, 'standin_schemas'):
+        import adbc_driver_sqlite.dbapi
+        with adbc_driver_sqlite.dbapi.connect() as conn:
+            with conn.cursor() as cursor:
+                # Same schema files the stand-in engine attaches
+                for schema, path in engine.standin_schemas.items():
+                    cursor.execute(f"attach database '{path}' as {schema}")
+                cursor.execute(sql)
+                return cursor.fetch_arrow_table()
+
+    raise ArrowUnavailable(f'no Arrow driver for {engine.dialect.name}')
+
+
+def read_arrow(engine, query):
+    # Read through the Arrow driver, falling back to pandas if there isn't one here
+    reason = _FALLBACK.get(engine.dialect.name)
+    if reason is None:
+        try:
+            table = fetch_arrow(engine, compile_query(engine, query))
+        except (ImportError, OSError, ArrowUnavailable) as error:
+            reason = _FALLBACK[engine.dialect.name] = f'{type(error).__name__}: {error}'
+            print(f'  arrow reader not available ({reason}), reading with pandas')
+        else:
+            return table.to_pandas()
+    return read_pandas(engine, query)
+
+
+READERS = {'pandas': read_pandas, 'arrow': read_arrow}
@@ -0,0 +1,156 @@
+# Run report for the SHAPE pull
+#
+# Every table's trip through the pull is split into stages (query, filter, merge,
+# melt, enrich, write) and each stage records its rows in and out, wall time and
+# memory delta (change in the process's resident memory, or in traced memory when
+# tracemalloc is running). The records are summed per table, dataset and stage and
+# written as JSON next to the all_* files, so it's easy to see which SHAPE table eats
+# the rebuild window. Query stages also carry the table's size as read and after the
+# ingest schema (schema.py) compacted it, when it did.
+#
+# Recording is a couple of clock and /proc reads per stage, so it's always on. For a
+# deeper look, OPTIONS['profile'] in pull_shape_db.py turns on cProfile (stats saved
+# next to the report) or tracemalloc (traced peaks per stage).
+
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from specs import TARGETS
+from memory import current_rss_mb, peak_rss_mb
+
+REPORT_DIR = os.path.dirname(TARGETS['state'])
+REPORT_PATH = os.path.join(REPORT_DIR, 'shape_run_report.json')
+PROFILE_NAME = 'shape_run_profile.prof'
+
+STAGES = ['query', 'filter', 'merge', 'melt', 'enrich', 'write']
+
+
+def start_run(options):
+    # Empty report for one run, with the profiler running if the options ask for it
+    run = {'started': datetime.now().isoformat(timespec='seconds'), 'options': dict(options), 'stages': [],
+           'profile': options.get('profile'), 'profiler': None, 'clock': time.perf_counter()}
+    if run['profile'] == 'cprofile':
+        run['profiler'] = cProfile.Profile()
+        run['profiler'].enable()
+    elif run['profile'] == 'tracemalloc' and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return run
+
+
+def memory_mb():
+    # Traced memory when tracemalloc is running, resident memory otherwise
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0] / 2**20
+    return current_rss_mb()
+
+
+@contextmanager
+def stage(run, spec, name, rows_in=None):
+    # Time one stage for one table. The block sets record['rows_out'] once it knows it
+    record = {'table': spec['name'], 'dataset': spec.get('dataset'), 'stage': name,
+              'rows_in': rows_in, 'rows_out': None}
+    if run is None:
+        yield record
+        return
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    before = memory_mb()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        record['memory_delta_mb'] = memory_mb() - before
+        if tracing:
+            record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+        run['stages'].append(record)
+
+
+def record_queries(run, specs, timings):
+    # Add the per-table read timings from extract() as query stages
+    # Reads run concurrently, so there's no per-table memory delta for them
+    for spec in specs:
+        timing = timings[spec['name']]
+        record = {'table': spec['name'], 'dataset': spec.get('dataset'), 'stage': 'query',
+                  'rows_in': None, 'rows_out': timing['rows'], 'seconds': timing['seconds'], 'memory_delta_mb': None}
+        if 'mb' in timing:
+            record.update(read_mb=timing['read_mb'], compacted_mb=timing['mb'], saved_mb=timing['read_mb'] - timing['mb'])
+        run['stages'].append(record)
+
+
+def summarize(records, by):
+    # Total seconds and number of stage records per dataset or per stage
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record[by], {'seconds': 0.0, 'stages': 0})
+        total['seconds'] += record['seconds']
+        total['stages'] += 1
+    return totals
+
+
+def tables(records):
+    # Per table: dataset and each stage's summed rows, time and memory (streamed tables repeat stages per chunk)
+    result = {}
+    for record in records:
+        table = result.setdefault(record['table'], {'dataset': record['dataset'], 'seconds': 0.0, 'stages': {}})
+        table['seconds'] += record['seconds']
+        step = table['stages'].setdefault(record['stage'], {'calls': 0, 'rows_in': None, 'rows_out': None,
+                                                            'seconds': 0.0, 'memory_delta_mb': None})
+        step['calls'] += 1
+        step['seconds'] += record['seconds']
+        for key in ('rows_in', 'rows_out', 'memory_delta_mb', 'read_mb', 'compacted_mb', 'saved_mb'):
+            if record.get(key) is not None:
+                step[key] = (step.get(key) or 0) + record[key]
+        if 'traced_peak_mb' in record:
+            step['traced_peak_mb'] = max(step.get('traced_peak_mb', 0), record['traced_peak_mb'])
+    return result
+
+
+def finish_run(run, path=REPORT_PATH, quiet=False):
+    # Stop profiling, write the JSON report and print the slowest tables (just the first line with quiet)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    profiler = run.pop('profiler')
+    profile_path = os.path.join(os.path.dirname(path), PROFILE_NAME)
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+    records = run.pop('stages')
+    report = {
+        'started': run['started'],
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'seconds': time.perf_counter() - run.pop('clock'),
+        'peak_rss_mb': peak_rss_mb(),
+        'options': run['options'],
+        'profile': run['profile'],
+        'datasets': summarize(records, 'dataset'),
+        'stages': {name: total for name, total in sorted(summarize(records, 'stage').items(),
+                                                          key=lambda item: STAGES.index(item[0]))},
+        'tables': tables(records),
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"run report written to {path} ({report['seconds']:.1f}s, peak {report['peak_rss_mb']:.0f} MB)")
+    if quiet:
+        return report
+    slowest = sorted(report['tables'].items(), key=lambda item: -item[1]['seconds'])[:5]
+    for name, table in slowest:
+        stages = ', '.join(f"{stage} {step['seconds']:.2f}s" for stage, step in table['stages'].items())
+        print(f"  {name}: {table['seconds']:.2f}s ({stages})")
+    compacted = [table['stages']['query'] for table in report['tables'].values()
+                 if 'saved_mb' in table['stages'].get('query', {})]
+    if compacted:
+        read_mb = sum(step['read_mb'] for step in compacted)
+        saved_mb = sum(step['saved_mb'] for step in compacted)
+        print(f'ingest schema saved {saved_mb:.1f} of {read_mb:.1f} MB read over {len(compacted)} tables')
+    if profiler is not None:
+        print(f'cProfile stats written to {profile_path}, top functions by cumulative time:')
+        pstats.Stats(profile_path).sort_stats('cumulative').print_stats(15)
+    return report
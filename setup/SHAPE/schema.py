@@ -0,0 +1,81 @@
+# Ingest schema for the SHAPE pull
+#
+# Tables come back from SHAPE with default dtypes: float64 for FCC speeds and shares,
+# int64 for counts and vintages, object for state/county names and FIPS codes, and
+# every stage after the read (checkpoint, filter, merge, melt) copies them. compact()
+# gives each column of a freshly read table the smallest dtype that holds it exactly:
+#   - floats become float32 when every value survives the round trip
+#   - ints are downcast to the smallest int type that holds their range
+#   - text FIPS keys of county and tract tables become Int64 (geoid() pads them back)
+#   - other text columns with repeated values (state, county, STATEID) become categoricals
+# The geography columns the merge attaches are made categoricals too, so the long frames
+# repeat small codes instead of one string pointer per row for State, County and measure.
+#
+# Labels and the all_* files are worked out from 64-bit values, so widen() puts the
+# measure columns back to float64/int64/object right before the melt and the output is
+# the same byte for byte.
+
+import numpy as np
+import pandas as pd
+
+from geography import geoid, join_column
+
+# Text columns become categoricals when they have at most this many distinct values per row
+CATEGORY_SHARE = 0.5
+
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def compact_column(values):
+    # Smallest dtype that holds a column's values exactly (the column itself if there isn't one)
+    if values.isna().all():
+        # All NULL columns stay as the driver gave them, streaming casts those per chunk
+        return values
+    if pd.api.types.is_float_dtype(values) and values.dtype != np.float32:
+        narrow = values.astype(np.float32)
+        same = np.array_equal(narrow.to_numpy(np.float64), values.to_numpy(np.float64), equal_nan=True)
+        return narrow if same else values
+    if pd.api.types.is_integer_dtype(values) and not pd.api.types.is_extension_array_dtype(values):
+        return pd.to_numeric(values, downcast='integer')
+    if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+        if values.nunique() <= CATEGORY_SHARE * len(values):
+            return values.astype('category')
+    return values
+
+
+def compact(df, spec):
+    # The table with compact dtypes, FIPS keys as Int64 where the level joins on fips
+    columns = {}
+    for name in df.columns:
+        values = df[name]
+        if name == spec['key'] and join_column(spec['level']) == 'fips' and not pd.api.types.is_numeric_dtype(values):
+            columns[name] = geoid(values, spec['level'], as_int=True)
+        else:
+            columns[name] = compact_column(values)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def compact_geography(geo):
+    # Catchment tables with their geography columns as categoricals (the join column stays as is,
+    # complete() fills it in from the keys)
+    compacted = {}
+    for level, table in geo.items():
+        join = join_column(level)
+        compacted[level] = table.astype({name: 'category' for name in table.columns if name != join})
+    return compacted
+
+
+def widen(df, columns):
+    # The columns back at the dtypes pandas reads by default, so values format the way they always have
+    dtypes = {}
+    for name in columns:
+        dtype = df[name].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtypes[name] = dtype.categories.dtype
+        elif pd.api.types.is_float_dtype(dtype) and dtype != np.float64:
+            dtypes[name] = np.float64
+        elif pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_extension_array_dtype(dtype) and dtype != np.int64:
+            dtypes[name] = np.int64
+    return df.astype(dtypes) if dtypes else df
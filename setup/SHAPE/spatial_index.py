@@ -0,0 +1,350 @@
+# Spatial index over the points the apps map (huntsman_locations, huntsman_facilities_and_providers)
+#
+# The apps load www/locations/<ca>_locations_<date>.csv and keep the rows with dist <= 25,
+# dist being the miles from each location to the catchment area that
+# cif_geocode_facilities_v5.R works out with sf::st_distance. This module recomputes that
+# column, and answers radius and k nearest queries for thousands of points at once:
+#
+#   index = build_index(frame['latitude'], frame['longitude'])
+#   within(index, lat, lon, 25)      (query, row, miles) arrays of every pair within 25 miles
+#   nearest(index, lat, lon, k=3)    (n, k) arrays of rows and miles, nearest first
+#
+# The index is a grid of CELL_DEGREES cells over lat/lon. Points are sorted by cell id
+# (row * columns + column), so all the occupied cells a query box covers in one grid row
+# are one contiguous slice of the sorted points. A query costs one binary search per grid
+# row it spans plus the exact haversine distances of the points in those slices, and a
+# batch of queries is done with array operations over all their slices together, no
+# per query loops. k nearest queries search a radius that grows for the queries that
+# haven't found k points yet, so the result is exact.
+#
+# Distances are great circle miles on s2's sphere, the one sf::st_distance uses for
+# lon/lat data. catchment_distance() is st_distance to the union of county_sf: 0 inside
+# the catchment, otherwise the distance to the nearest boundary edge, with edges as great
+# circle arcs like s2 has them. The inside test is shapely's (planar in lon/lat), which
+# only differs from s2's for points right on a long east-west edge.
+#
+# Needs pyogrio and shapely for the catchment boundary, numpy and pandas for the rest.
+#
+# Run it from the repo root to recompute the dist column of a locations file:
+#   python setup/SHAPE/spatial_index.py [--locations CSV] [--catchment SHP] [--write]
+
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+LOCATIONS = 'ShinyCIF/www/locations/huntsman_locations_*.csv'
+CATCHMENT = 'ShinyCIF/www/shapefiles/county_sf.shp'
+
+# s2's mean earth radius (6371.01 km) in miles
+EARTH_RADIUS_MILES = 6371.01 / 1.609344
+
+# Grid cell size of the index
+CELL_DEGREES = 0.25
+
+# Query/point pairs whose distances are worked out at a time
+CANDIDATES = 2**21
+
+# The apps map locations up to this many miles outside the catchment
+RADIUS_MILES = 25
+
+# Longest edge of the catchment boundary after it's split up for its vertex index
+BOUNDARY_SPACING_MILES = 2
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    # Great circle miles between points in degrees, broadcasting like any numpy operation
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(values, dtype='float64')) for values in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def unit_vectors(lat, lon):
+    # Points in degrees as (n, 3) unit vectors
+    lat, lon = np.radians(np.asarray(lat, dtype='float64')), np.radians(np.asarray(lon, dtype='float64'))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def to_degrees(vectors):
+    # (n, 3) vectors back to latitude and longitude in degrees
+    lat = np.degrees(np.arcsin(np.clip(vectors[:, 2] / np.linalg.norm(vectors, axis=1), -1, 1)))
+    return lat, np.degrees(np.arctan2(vectors[:, 1], vectors[:, 0]))
+
+
+# ----- Grid index -----
+
+def build_index(lat, lon, cell=CELL_DEGREES):
+    # Index of the points with coordinates; results refer to points by their position in lat/lon
+    lat, lon = np.asarray(lat, dtype='float64'), np.asarray(lon, dtype='float64')
+    rows = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+    columns = int(np.ceil(360 / cell))
+    keys = grid_rows(lat[rows], cell) * columns + grid_columns(lon[rows], cell, columns)
+    order = np.argsort(keys, kind='stable')
+    return {'cell': cell, 'columns': columns, 'keys': keys[order], 'rows': rows[order],
+            'lat': lat[rows[order]], 'lon': lon[rows[order]]}
+
+
+def grid_rows(lat, cell):
+    return np.clip(np.floor((lat + 90) / cell), 0, np.ceil(180 / cell) - 1).astype('int64')
+
+
+def grid_columns(lon, cell, columns):
+    return np.floor(((lon + 180) % 360) / cell).astype('int64') % columns
+
+
+def slices(index, lat, lon, miles):
+    # (query, start, stop) slices of the sorted points covering each query's box of radius miles
+    cell, columns = index['cell'], index['columns']
+    angle = np.asarray(miles, dtype='float64') / EARTH_RADIUS_MILES
+    reach = np.degrees(angle)
+    # Widest longitude a spherical cap reaches at its latitude, all of them if it holds a pole
+    polar = (np.abs(lat) + reach >= 90) | (angle >= np.pi / 2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        wide = np.degrees(np.arcsin(np.clip(np.sin(angle) / np.cos(np.radians(lat)), -1, 1)))
+    wide = np.where(polar, 180, wide)
+    first, last = grid_rows(lat - reach, cell), grid_rows(lat + reach, cell)
+
+    # One (query, grid row) per grid row each box spans
+    counts = last - first + 1
+    query = np.repeat(np.arange(len(lat)), counts)
+    grid_row = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + first[query]
+
+    # Column range of each row's cells; boxes across the antimeridian are two ranges
+    everything = wide[query] >= 180
+    low = np.where(everything, 0, grid_columns(lon[query] - wide[query], cell, columns))
+    high = np.where(everything, columns - 1, grid_columns(lon[query] + wide[query], cell, columns))
+    wraps = low > high
+    query = np.concatenate([query, query[wraps]])
+    grid_row = np.concatenate([grid_row, grid_row[wraps]])
+    low, high = np.concatenate([low, np.zeros(wraps.sum(), dtype='int64')]), \
+        np.concatenate([np.where(wraps, columns - 1, high), high[wraps]])
+
+    start = np.searchsorted(index['keys'], grid_row * columns + low, side='left')
+    stop = np.searchsorted(index['keys'], grid_row * columns + high, side='right')
+    keep = stop > start
+    return query[keep], start[keep], stop[keep]
+
+
+def candidates(query, start, stop):
+    # (query, sorted point) pairs of every point in the slices
+    lengths = stop - start
+    points = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - start, lengths)
+    return np.repeat(query, lengths), points
+
+
+def within(index, lat, lon, miles):
+    # Every (query, row, miles) with the row's point within miles of the query point,
+    # by query then distance. miles can be one radius or one per query
+    lat, lon = np.asarray(lat, dtype='float64'), np.asarray(lon, dtype='float64')
+    miles = np.broadcast_to(np.asarray(miles, dtype='float64'), lat.shape)
+    located = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+    lat, lon, miles = lat[located], lon[located], miles[located]
+    query, start, stop = slices(index, lat, lon, miles)
+
+    # Distances for about CANDIDATES pairs at a time, so memory doesn't grow with the batch
+    batch = np.cumsum(stop - start) // CANDIDATES
+    bounds = np.concatenate([[0], np.flatnonzero(np.diff(batch)) + 1, [len(batch)]])
+    found = []
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        pair_query, points = candidates(query[first:last], start[first:last], stop[first:last])
+        distance = haversine(lat[pair_query], lon[pair_query], index['lat'][points], index['lon'][points])
+        keep = distance <= miles[pair_query]
+        found.append((pair_query[keep], points[keep], distance[keep]))
+    pair_query, points, distance = (np.concatenate(parts) for parts in zip(*found))
+    order = np.lexsort((distance, pair_query))
+    return located[pair_query[order]], index['rows'][points[order]], distance[order]
+
+
+def nearest(index, lat, lon, k=1):
+    # (rows, miles) of the k nearest points to each query point, nearest first, padded
+    # with row -1 and inf miles when there are fewer than k points (or no query coordinates)
+    lat, lon = np.asarray(lat, dtype='float64'), np.asarray(lon, dtype='float64')
+    rows = np.full((len(lat), k), -1, dtype='int64')
+    miles = np.full((len(lat), k), np.inf)
+    wanted = min(k, len(index['rows']))
+    pending = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+    # Start each query at the radius that would hold k points at the density of its own
+    # cell, and double it for the queries still short of k points
+    cell_miles = index['cell'] * np.pi / 180 * EARTH_RADIUS_MILES
+    key = grid_rows(lat[pending], index['cell']) * index['columns'] + \
+        grid_columns(lon[pending], index['cell'], index['columns'])
+    density = np.searchsorted(index['keys'], key, side='right') - np.searchsorted(index['keys'], key, side='left')
+    radius = cell_miles * np.sqrt(wanted / np.maximum(density, 1))
+    while len(pending) and wanted:
+        last = radius >= np.pi * EARTH_RADIUS_MILES
+        query, found, distance = within(index, lat[pending], lon[pending], radius)
+        counts = np.bincount(query, minlength=len(pending))
+        done = (counts >= wanted) | last
+        # Within a query the pairs are nearest first, so a pair's rank is its offset in the query's run
+        rank = np.arange(len(query)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keep = done[query] & (rank < k)
+        rows[pending[query[keep]], rank[keep]] = found[keep]
+        miles[pending[query[keep]], rank[keep]] = distance[keep]
+        pending, radius = pending[~done], radius[~done] * 2
+    return rows, miles
+
+
+# ----- Catchment distance -----
+
+def read_catchment(path=CATCHMENT, spacing=BOUNDARY_SPACING_MILES):
+    # The union of a shapefile's outlines, plus its boundary as great circle edges no
+    # longer than spacing miles, indexed by vertex
+    import pyogrio
+    import shapely
+
+    meta, table = pyogrio.read_arrow(path)
+    shapes = shapely.from_wkb(table.column(meta['geometry_name'] or 'wkb_geometry').to_numpy(zero_copy_only=False))
+    area = shapely.union_all(shapes)
+    rings = shapely.get_rings(shapely.get_parts(area))
+
+    lat, lon, ring = [], [], []
+    for number, outline in enumerate(rings):
+        points = densify(shapely.get_coordinates(outline), spacing)
+        lat.append(points[0])
+        lon.append(points[1])
+        ring.append(np.full(len(points[0]), number))
+    lat, lon, ring = np.concatenate(lat), np.concatenate(lon), np.concatenate(ring)
+    # Vertex i starts an edge to i + 1 unless it closes its ring
+    starts = np.append(ring[1:] == ring[:-1], False)
+    edges = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])[starts[:-1]]
+    return {'area': area, 'lat': lat, 'lon': lon, 'starts': starts, 'vectors': unit_vectors(lat, lon),
+            'longest': float(edges.max()), 'index': build_index(lat, lon)}
+
+
+def densify(coordinates, spacing):
+    # (lat, lon) of a ring's vertices with points added along each great circle edge so
+    # none is longer than spacing miles
+    lon, lat = coordinates[:, 0], coordinates[:, 1]
+    vectors = unit_vectors(lat, lon)
+    angle = np.arccos(np.clip(np.einsum('ij,ij->i', vectors[:-1], vectors[1:]), -1, 1))
+    pieces = np.maximum(np.ceil(angle * EARTH_RADIUS_MILES / spacing), 1).astype('int64')
+    edge = np.repeat(np.arange(len(angle)), pieces)
+    t = (np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)) / pieces[edge]
+    # Spherical interpolation along each edge (straight interpolation where it's too short to matter)
+    sin = np.sin(angle[edge])
+    small = sin < 1e-12
+    a = np.where(small, 1 - t, np.sin((1 - t) * angle[edge]) / np.where(small, 1, sin))
+    b = np.where(small, t, np.sin(t * angle[edge]) / np.where(small, 1, sin))
+    points = a[:, None] * vectors[:-1][edge] + b[:, None] * vectors[1:][edge]
+    new_lat, new_lon = to_degrees(points)
+    # Keep the original vertices exact, and close the ring
+    start = t == 0
+    new_lat[start], new_lon[start] = lat[:-1][edge[start]], lon[:-1][edge[start]]
+    return np.append(new_lat, lat[-1]), np.append(new_lon, lon[-1])
+
+
+def edge_distance(point, first, second):
+    # Great circle miles from points to the arcs first -> second, all (n, 3) unit vectors
+    normal = np.cross(first, second)
+    length = np.linalg.norm(normal, axis=1, keepdims=True)
+    normal = normal / np.where(length > 0, length, 1)
+    # The point's foot on the arc's great circle is between the ends if it's on the inner side of both
+    between = (np.einsum('ij,ij->i', np.cross(first, point), normal) >= 0) & \
+        (np.einsum('ij,ij->i', np.cross(point, second), normal) >= 0) & (length[:, 0] > 0)
+    across = np.arcsin(np.clip(np.abs(np.einsum('ij,ij->i', point, normal)), 0, 1))
+    ends = np.minimum(np.arccos(np.clip(np.einsum('ij,ij->i', point, first), -1, 1)),
+                      np.arccos(np.clip(np.einsum('ij,ij->i', point, second), -1, 1)))
+    return np.where(between, np.minimum(across, ends), ends) * EARTH_RADIUS_MILES
+
+
+def catchment_distance(catchment, lat, lon):
+    # Miles from each point to the catchment area, 0 inside it and NaN without coordinates
+    import shapely
+
+    lat, lon = np.asarray(lat, dtype='float64'), np.asarray(lon, dtype='float64')
+    miles = np.full(len(lat), np.nan)
+    located = np.isfinite(lat) & np.isfinite(lon)
+    inside = np.zeros(len(lat), dtype=bool)
+    inside[located] = shapely.contains_xy(catchment['area'], lon[located], lat[located])
+    miles[inside] = 0
+    outside = np.flatnonzero(located & ~inside)
+
+    # An edge closer than the nearest vertex has a vertex within half an edge more than that
+    _, closest = nearest(catchment['index'], lat[outside], lon[outside])
+    query, vertex, _ = within(catchment['index'], lat[outside], lon[outside],
+                              closest[:, 0] + catchment['longest'] / 2 + 1e-9)
+    starts = catchment['starts']
+    # Each vertex found is the start of the edge after it and the end of the edge before it
+    edge = np.concatenate([vertex[starts[vertex]], vertex[vertex > 0][starts[vertex[vertex > 0] - 1]] - 1])
+    owner = np.concatenate([query[starts[vertex]], query[vertex > 0][starts[vertex[vertex > 0] - 1]]])
+    vectors = catchment['vectors']
+    points = unit_vectors(lat[outside], lon[outside])
+    distance = edge_distance(points[owner], vectors[edge], vectors[edge + 1])
+    best = np.full(len(outside), np.inf)
+    np.minimum.at(best, owner, distance)
+    miles[outside] = best
+    return miles
+
+
+# ----- Locations files -----
+
+def latest_locations(pattern=LOCATIONS):
+    # The newest <ca>_locations_<mm-dd-yyyy>.csv matching pattern
+    paths = glob.glob(pattern)
+    if not paths:
+        raise Exception(f'No locations files match {pattern}')
+    dated = {path: pd.to_datetime(os.path.basename(path)[-14:-4], format='%m-%d-%Y') for path in paths}
+    return max(paths, key=dated.get)
+
+
+def read_locations(path):
+    # A locations (or facilities and providers) file with latitude and longitude as numbers
+    return pd.read_csv(path, dtype=str, keep_default_na=False, na_values=['NA']).astype(
+        {'latitude': 'float64', 'longitude': 'float64'})
+
+
+def format_r(value):
+    # A number the way R's write.csv writes it: up to 15 significant digits
+    return 'NA' if value != value else '%.15g' % value
+
+
+def write_locations(frame, path):
+    # frame in write.csv's layout: text quoted, numbers and NA bare. Columns that are all
+    # numbers (or all NA) are numeric, the way read.csv typed them
+    numeric = {column for column in frame.columns
+               if pd.to_numeric(frame[column], errors='coerce').notna().sum() == frame[column].notna().sum()}
+
+    def cell(column, value):
+        if column in numeric:
+            return format_r(float(value))
+        if value != value:
+            return 'NA'
+        return '"' + value.replace('"', '""') + '"'
+
+    lines = [','.join(f'"{column}"' for column in frame.columns)]
+    columns = list(frame.columns)
+    for row in frame.itertuples(index=False):
+        lines.append(','.join(cell(column, value) for column, value in zip(columns, row)))
+    with open(path + '.partial', 'w', newline='') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(path + '.partial', path)
+
+
+def update_distances(path, catchment, write=False):
+    # Recompute a locations file's dist column, print what changed, and rewrite the file if asked
+    frame = read_locations(path)
+    miles = catchment_distance(catchment, frame['latitude'], frame['longitude'])
+    old = pd.to_numeric(frame.get('dist', pd.Series(np.nan, index=frame.index)), errors='coerce').to_numpy()
+    # s2 snaps the union's vertices, so its distances differ from these by a foot or so
+    changed = ~np.isclose(old, miles, rtol=1e-6, atol=1e-3, equal_nan=True)
+    print(f"{os.path.basename(path)}: {len(frame)} locations, {(miles == 0).sum()} in the catchment, "
+          f"{(miles > RADIUS_MILES).sum()} more than {RADIUS_MILES} miles out, {changed.sum()} dist values differ")
+    for i in np.flatnonzero(changed)[:10]:
+        print(f"  {frame['Type'].iloc[i]}, {frame['Name'].iloc[i]}: {old[i]:g} -> {miles[i]:g}")
+    if write:
+        # Values that agree are kept as they are, so rewriting an up to date file changes nothing
+        frame['dist'] = np.where(changed, miles, old)
+        write_locations(frame, path)
+        print(f'wrote {path}')
+    return miles
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recompute the miles from each location to the catchment area')
+    parser.add_argument('--locations', help=f'locations CSV (default the newest {LOCATIONS})')
+    parser.add_argument('--catchment', default=CATCHMENT, help='shapefile whose union is the catchment area')
+    parser.add_argument('--write', action='store_true', help='rewrite the dist column of the file')
+    args = parser.parse_args()
+    update_distances(args.locations or latest_locations(), read_catchment(args.catchment), args.write)
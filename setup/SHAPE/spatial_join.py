@@ -0,0 +1,120 @@
+# Point in polygon tract and county assignment for facilities and locations
+#
+# huntsman_facilities_and_providers and the locations files the apps map only carry a
+# FIPS (county GEOID) for some rows, and working one out in R means testing each point
+# against the outlines one object at a time. This assigns the GEOIDs of whole arrays of
+# points in one call:
+#
+#   layer = read_layer('tract')                 tract_sf outlines in an STRtree, prepared
+#   assign(layer, lat, lon)                     GEOID of the outline each point falls in
+#   assign_levels([county, tract], lat, lon)    frame with a GEOID column per level
+#
+# The STRtree over the outlines' bounding boxes gives every (point, outline) pair whose
+# boxes overlap, in one query for all the points. Those candidates are then tested with
+# one vectorized shapely.intersects call against the prepared outlines, so the only loop
+# is inside GEOS. Points on the line between two outlines (or in both, if outlines
+# overlap) go to the one with the lowest GEOID; points outside every outline get none.
+#
+# backfill() fills the FIPS column of a facilities or locations file from the county of
+# each row's coordinates, keeps the FIPS values that are there and reports the ones that
+# don't match their coordinates.
+#
+# Needs pyogrio and shapely (see bundle.py for reading the shapefiles).
+#
+# Run it from the repo root after the shapefile setup:
+#   python setup/SHAPE/spatial_join.py [CSV ...] [--www ShinyCIF/www] [--write]
+
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from bundle import GEOMETRY, LEVEL_SHAPES, SHAPEFILE_DIR, read_shapes
+from geography import geoid
+from spatial_index import latest_locations, read_locations, write_locations
+
+FACILITIES = 'huntsman_catchment_data/huntsman_facilities_and_providers_*.csv'
+
+# Every app's copy of the locations files
+APP_LOCATIONS = 'ShinyCIF*/www/locations/huntsman_locations_*.csv'
+
+FIPS_LEVEL = 'county'
+
+
+def read_layer(level, www='ShinyCIF/www'):
+    # A level's outlines from the apps' shapefile, prepared and in an STRtree, with their GEOIDs
+    import shapely
+
+    name, key = LEVEL_SHAPES[level]
+    table, _ = read_shapes(os.path.join(www, SHAPEFILE_DIR, f'{name}.shp'))
+    shapes = shapely.from_wkb(table.column(GEOMETRY).to_numpy(zero_copy_only=False))
+    # Prepared outlines make the predicates index their edges once instead of per test
+    shapely.prepare(shapes)
+    geoids = geoid(table.column(key).to_pandas(), level).to_numpy(dtype=object)
+    return {'level': level, 'shapes': shapes, 'geoids': geoids, 'rank': np.unique(geoids.astype(str), return_inverse=True)[1],
+            'tree': shapely.STRtree(shapes)}
+
+
+def assign(layer, lat, lon):
+    # GEOID of the outline each point is in (NaN if none or no coordinates), as an object array
+    import shapely
+
+    lat, lon = np.asarray(lat, dtype='float64'), np.asarray(lon, dtype='float64')
+    located = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+    points = shapely.points(lon[located], lat[located])
+    point, shape = layer['tree'].query(points)
+    hit = shapely.intersects(layer['shapes'][shape], points[point])
+    point, shape = point[hit], shape[hit]
+    # First outline of each point by GEOID
+    order = np.lexsort((layer['rank'][shape], point))
+    point, shape = point[order], shape[order]
+    first = np.diff(point, prepend=-1) != 0
+    geoids = np.full(len(lat), np.nan, dtype=object)
+    geoids[located[point[first]]] = layer['geoids'][shape[first]]
+    return geoids
+
+
+def assign_levels(layers, lat, lon):
+    # Frame of the GEOID at every layer's level for each point
+    return pd.DataFrame({layer['level']: assign(layer, lat, lon) for layer in layers})
+
+
+def backfill(path, layer, write=False):
+    # Fill a file's missing FIPS from its rows' coordinates, print what was found and rewrite it if asked
+    frame = read_locations(path)
+    county = assign(layer, frame['latitude'], frame['longitude'])
+    fips = geoid(frame['FIPS'], FIPS_LEVEL) if 'FIPS' in frame.columns else pd.Series(np.nan, index=frame.index)
+    missing = fips.isna().to_numpy()
+    found = pd.notna(county)
+    # Rows whose FIPS isn't the county their coordinates are in; the FIPS is left as it is
+    conflict = ~missing & found & (fips.to_numpy() != county)
+    print(f"{path}: {len(frame)} rows, {(~missing).sum()} with FIPS, {(missing & found).sum()} filled from coordinates, "
+          f"{(missing & ~found).sum()} left without (no coordinates or outside {layer['level']} outlines), "
+          f"{conflict.sum()} FIPS not where their coordinates are")
+    for i in np.flatnonzero(conflict)[:10]:
+        print(f"  {frame['Type'].iloc[i]}, {frame['Name'].iloc[i]}: FIPS {fips.iloc[i]}, coordinates in {county[i]}")
+    if write and (missing & found).any():
+        frame['FIPS'] = fips.where(~missing, pd.Series(county, index=frame.index))
+        write_locations(frame, path)
+        print(f'wrote {path}')
+    return frame
+
+
+def default_paths():
+    # The newest facilities file and the newest locations file of every app
+    paths = [latest_locations(FACILITIES)] if glob.glob(FACILITIES) else []
+    folders = sorted({os.path.dirname(path) for path in glob.glob(APP_LOCATIONS)})
+    return paths + [latest_locations(os.path.join(folder, 'huntsman_locations_*.csv')) for folder in folders]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill FIPS of facilities and locations from their coordinates')
+    parser.add_argument('paths', nargs='*', help='facilities or locations CSVs (default the newest of each)')
+    parser.add_argument('--www', default='ShinyCIF/www', help='app www folder with the shapefiles')
+    parser.add_argument('--write', action='store_true', help='rewrite the files with the FIPS filled in')
+    args = parser.parse_args()
+    layer = read_layer(FIPS_LEVEL, args.www)
+    for path in args.paths or default_paths():
+        backfill(path, layer, args.write)
@@ -0,0 +1,191 @@
+# Table specs for the SHAPE pull
+#
+# Every SHAPE table that ends up in all_state.csv, all_county.csv or all_tract.csv
+# is described by one entry here. The engine in pipeline.py reads these entries and
+# runs the same filter -> merge -> melt -> enrich -> write path for all of them,
+# so adding a table means adding an entry, not another copy of the pandas block.
+#
+# Keys:
+#   name         short name used for logging and as the key for the pulled frame
+#   dataset      dataset group the table belongs to (what OPTIONS['datasets'] selects)
+#   table        SHAPE table to read
+#   where        optional extra SQL condition for the read
+#   columns      optional list of the only columns to read (FIPS tables)
+#   level        geography level: 'state', 'county' or 'tract'
+#   filter_col   column used to restrict the table to the area we serve
+#   filter_on    'name' if filter_col holds state names, 'fips' if it holds state FIPS
+#   key          column joined to the geography table (state name for state tables, fips otherwise)
+#   drop         columns removed before melting (ids, raw geography columns, etc.)
+#   measures     optional list of the only measure columns to keep
+#   lookup       name of the definitions/formats json files in setup/SHAPE/data
+#   cat          category written to the cat column
+#   source       data source string, may use {month} and {year} for FCC style vintages
+#   label        label format code from formats.py ('pct', 'dec', 'int', 'str', ...), or 'fmt'
+#                to format each row by its own fmt code
+#   dictionary   append the table's measures to the measure dictionary
+#   overwrite    write the target file from scratch (with header) instead of appending
+
+# Geography columns kept from the FIPS tables for each level
+GEO_COLUMNS = {
+    'state': ['state', 'fips'],
+    'county': ['state', 'county', 'fips'],
+    'tract': ['state', 'county', 'tract', 'fips'],
+}
+
+# Output column order for each level
+OUTPUT_COLUMNS = {
+    'state': ["cat", "GEOID", "State", "measure", "value", "RE", "Sex", "def", "fmt", "source", "lbl"],
+    'county': ["cat", "GEOID", "County", "State", "measure", "value", "RE", "Sex", "def", "fmt", "source", "lbl"],
+    'tract': ["cat", "GEOID", "Tract", "County", "State", "measure", "value", "RE", "Sex", "def", "fmt", "source", "lbl"],
+}
+
+# Output file for each level
+TARGETS = {
+    'state': 'ShinyCIF/www/data/all_state.csv',
+    'county': 'ShinyCIF/www/data/all_county.csv',
+    'tract': 'ShinyCIF/www/data/all_tract.csv',
+}
+
+MEASURE_DICTIONARY = 'ShinyCIF/www/measure_dictionary_v5.csv'
+
+# FIPS lookup tables every run reads, restricted to the geography columns we use
+FIPS_SPECS = [
+    {'name': 'state_fips', 'table': 'census.StateFips', 'level': 'state', 'filter_col': 'state', 'filter_on': 'name', 'columns': GEO_COLUMNS['state']},
+    {'name': 'county_fips', 'table': 'census.CountyFips', 'level': 'county', 'filter_col': 'state', 'filter_on': 'name', 'columns': GEO_COLUMNS['county']},
+    {'name': 'tract_fips', 'table': 'census.TractFips', 'level': 'tract', 'filter_col': 'state', 'filter_on': 'name', 'columns': GEO_COLUMNS['tract']},
+]
+
+BRFSS_SOURCE = 'Behavioral Risk Factor Surveillance System'
+HINTS_SOURCE = 'Health Information National Trends Survey'
+# HPV2023 has its own source so its rows don't replace the HINTS ones with the same measures
+HPV_SOURCE = 'HPV Survey 2023'
+FCC_DROP = ['RecordID', 'STATEID', 'TOT_POP', 'MONTH', 'YEAR']
+
+
+def _state_table(dataset, name, table, cat, source, extra_drop=(), overwrite=False):
+    # BRFSS and HINTS tables all share the same state level shape
+    return {
+        'name': name,
+        'dataset': dataset,
+        'table': table,
+        'level': 'state',
+        'filter_col': 'state',
+        'filter_on': 'name',
+        'key': 'state',
+        'drop': ['id' + table.split('.')[1], 'stateAbbreviation'] + list(extra_drop),
+        'lookup': dataset.lower(),
+        'cat': cat,
+        'source': source,
+        'label': 'pct',
+        'overwrite': overwrite,
+    }
+
+
+def _fcc_table(name, table, level):
+    id_col = 'COUNTYID' if level == 'county' else 'TRACTID'
+    return {
+        'name': name,
+        'dataset': 'FCC',
+        'table': table,
+        'level': level,
+        'filter_col': 'STATEID',
+        'filter_on': 'fips',
+        'key': id_col,
+        'drop': FCC_DROP,
+        'lookup': 'fcc',
+        'cat': 'Environment',
+        'source': 'FCC, {month} {year}',
+        'label': 'dec',
+    }
+
+
+TABLE_SPECS = [
+
+    # ----- AQI -----
+    {
+        'name': 'aqi',
+        'dataset': 'AQI',
+        'table': 'epa.Aqi',
+        'level': 'county',
+        'filter_col': 'state',
+        'filter_on': 'name',
+        'key': 'fips',
+        'drop': ['idAqi', 'state', 'county'],
+        'lookup': 'aqi',
+        'cat': 'Environment',
+        'source': 'Environmental Protection Agency',
+        'label': 'str',
+    },
+
+    # ----- Radon -----
+    {
+        'name': 'radon',
+        'dataset': 'Radon',
+        'table': 'epa.Radon',
+        'level': 'county',
+        'filter_col': 'state',
+        'filter_on': 'name',
+        'key': 'fips',
+        'drop': ['state', 'county'],
+        'measures': ['indoorRadonPotential'],
+        'lookup': 'radon',
+        'cat': 'Environment',
+        'source': 'Environmental Protection Agency',
+        'label': 'str',
+        'dictionary': True,
+    },
+
+    # ----- BRFSS -----
+    # The first BRFSS table starts all_state.csv, everything after it appends
+    _state_table('BRFSS', 'brfss_brst_crvcl_scrn', 'brfss.BreastAndCervicalCancerScreening', 'Screening & Risk Factors', BRFSS_SOURCE, overwrite=True),
+    _state_table('BRFSS', 'brfss_cncr_insr', 'brfss.CancerInsurance', 'Economics & Insurance', BRFSS_SOURCE),
+    _state_table('BRFSS', 'brfss_crc_scrn', 'brfss.ColorectalCancerScreening', 'Screening & Risk Factors', BRFSS_SOURCE),
+    _state_table('BRFSS', 'brfss_hlth_care_acs', 'brfss.HealthCareAccess', 'Sociodemographics', BRFSS_SOURCE),
+    _state_table('BRFSS', 'brfss_lng_scrn', 'brfss.LungCancerScreening', 'Screening & Risk Factors', BRFSS_SOURCE),
+    _state_table('BRFSS', 'brfss_mntl_hlth', 'brfss.MentalHealth', 'Other Health Factors', BRFSS_SOURCE),
+    _state_table('BRFSS', 'brfss_scl_det', 'brfss.SocialDeterminants', 'Sociodemographics', BRFSS_SOURCE),
+    _state_table('BRFSS', 'brfss_tbco', 'brfss.Tobacco', 'Screening & Risk Factors', BRFSS_SOURCE),
+
+    # ----- FCC -----
+    # Tract measures are the same as county, so only the county tables matter for the dictionary
+    _fcc_table('broadbandCounty', 'fcc.BroadbandCountyDec2023', 'county'),
+    _fcc_table('broadbandTract', 'fcc.BroadbandTractDec2023', 'tract'),
+    _fcc_table('mobileCounty', 'fcc.MobileCountyDec2023', 'county'),
+    _fcc_table('mobileTract', 'fcc.MobileTractDec2023', 'tract'),
+
+    # ----- HINTS -----
+    _state_table('HINTS', 'hints_cncr_com', 'hints.CancerCommunication', 'Cancer Communication & Perceptions', HINTS_SOURCE),
+    _state_table('HINTS', 'hints_cncr_percep', 'hints.CancerPerceptions', 'Cancer Communication & Perceptions', HINTS_SOURCE),
+    _state_table('HINTS', 'hints_crvcl_cncr', 'hints.CervicalCancer', 'Screening & Risk Factors', HINTS_SOURCE),
+    _state_table('HINTS', 'hints_clin_trial', 'hints.ClinicalTrials', 'Clinical Trials', HINTS_SOURCE),
+    _state_table('HINTS', 'hints_lng_cncr', 'hints.LungCancer', 'Screening & Risk Factors', HINTS_SOURCE),
+    _state_table('HINTS', 'hints_mntl_hlth', 'hints.MentalHealth', 'Other Health Factors', HINTS_SOURCE),
+    _state_table('HINTS', 'hints_skn_prot', 'hints.SkinProtection', 'Screening & Risk Factors', HINTS_SOURCE),
+    _state_table('HINTS', 'hints_scl_det', 'hints.SocialDeterminants', 'Sociodemographics', HINTS_SOURCE),
+    _state_table('HINTS', 'hints_tbco', 'hints.Tobacco', 'Screening & Risk Factors', HINTS_SOURCE,
+                 extra_drop=['currentSmokers', 'formerSmokers', 'neverSmoked', 'everSmokedAtLeast100Cigarettes', 'haventEverSmokedAtLeast100Cigarettes', 'neverUsedECigs']),
+
+    # ----- HPV -----
+    # Still a work in progress: the HPV2023 columns haven't been mapped yet, so this
+    # uses the HINTS lookups like the original block did
+    {
+        'name': 'hpv',
+        'dataset': 'HPV',
+        'table': 'vcaa.HPV2023',
+        'where': "[Survey Year] = '2023'",
+        'level': 'state',
+        'filter_col': 'Geography',
+        'filter_on': 'name',
+        'key': 'Geography',
+        'drop': ['Survey Year'],
+        'lookup': 'hints',
+        'cat': 'Screening & Risk Factors',
+        'source': HPV_SOURCE,
+        'label': 'pct',
+    },
+]
+
+
+def specs_for(datasets):
+    # Specs for the selected datasets, in pull order
+    return [spec for spec in TABLE_SPECS if spec['dataset'] in datasets]
@@ -0,0 +1,206 @@
+# Local stand-in for the SHAPE database
+#
+# Writes one SQLite file per SHAPE schema (census.db, epa.db, brfss.db, fcc.db, hints.db,
+# vcaa.db) with every table the pull reads, filled with made-up but realistically shaped
+# data: national FIPS tables, tables that don't cover every geography, NULL measures,
+# STATEID stored as an int on some FCC tables and a string on others, and so on.
+# Point "standin" in sql_login.json at the directory and the pull runs against it
+# (see extract.standin_engine).
+#
+# Measure columns come from the definitions in setup/SHAPE/data. The BRFSS/HINTS/HPV
+# column layout per table is in setup/SHAPE/data/standin_layout.json.
+#
+#   python setup/SHAPE/standin.py DIR [--states 51] [--counties 62] [--tracts 27] [--seed 0]
+#
+# The defaults give a national sized stand-in (51 states, ~3,200 counties, ~85,000 tracts).
+
+import argparse
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from specs import TABLE_SPECS
+
+DATA_DIR = 'setup/SHAPE/data'
+LAYOUT = os.path.join(DATA_DIR, 'standin_layout.json')
+
+# Name, abbreviation and FIPS of every state plus DC, area we serve first so smaller
+# stand-ins still cover it
+STATES = [
+    ('Utah', 'UT', '49'), ('Idaho', 'ID', '16'), ('Wyoming', 'WY', '56'), ('Montana', 'MT', '30'), ('Nevada', 'NV', '32'),
+    ('Alabama', 'AL', '01'), ('Alaska', 'AK', '02'), ('Arizona', 'AZ', '04'), ('Arkansas', 'AR', '05'),
+    ('California', 'CA', '06'), ('Colorado', 'CO', '08'), ('Connecticut', 'CT', '09'), ('Delaware', 'DE', '10'),
+    ('District of Columbia', 'DC', '11'), ('Florida', 'FL', '12'), ('Georgia', 'GA', '13'), ('Hawaii', 'HI', '15'),
+    ('Illinois', 'IL', '17'), ('Indiana', 'IN', '18'), ('Iowa', 'IA', '19'), ('Kansas', 'KS', '20'),
+    ('Kentucky', 'KY', '21'), ('Louisiana', 'LA', '22'), ('Maine', 'ME', '23'), ('Maryland', 'MD', '24'),
+    ('Massachusetts', 'MA', '25'), ('Michigan', 'MI', '26'), ('Minnesota', 'MN', '27'), ('Mississippi', 'MS', '28'),
+    ('Missouri', 'MO', '29'), ('Nebraska', 'NE', '31'), ('New Hampshire', 'NH', '33'), ('New Jersey', 'NJ', '34'),
+    ('New Mexico', 'NM', '35'), ('New York', 'NY', '36'), ('North Carolina', 'NC', '37'), ('North Dakota', 'ND', '38'),
+    ('Ohio', 'OH', '39'), ('Oklahoma', 'OK', '40'), ('Oregon', 'OR', '41'), ('Pennsylvania', 'PA', '42'),
+    ('Rhode Island', 'RI', '44'), ('South Carolina', 'SC', '45'), ('South Dakota', 'SD', '46'), ('Tennessee', 'TN', '47'),
+    ('Texas', 'TX', '48'), ('Vermont', 'VT', '50'), ('Virginia', 'VA', '51'), ('Washington', 'WA', '53'),
+    ('West Virginia', 'WV', '54'), ('Wisconsin', 'WI', '55'),
+]
+
+# Share of rows each kind of table has, and of measure values left NULL
+COVERAGE = {'aqi': 0.33, 'radon': 0.95, 'state': 0.96, 'fcc': 0.99}
+NULL_SHARE = 0.1
+
+FCC_MONTH, FCC_YEAR = 'December', 2023
+
+
+def measures(name):
+    return list(json.load(open(os.path.join(DATA_DIR, 'definitions', f'{name}.json'))))
+
+
+def fips_tables(states, counties, tracts):
+    # National StateFips, CountyFips and TractFips tables
+    state = pd.DataFrame(states, columns=['state', 'stateAbbreviation', 'fips'])
+    state = state.drop(columns='stateAbbreviation')
+
+    county_rows = [(name, f'{name} County {c}', fips + f'{c:03d}')
+                   for name, _, fips in states for c in range(1, 2 * counties, 2)]
+    county = pd.DataFrame(county_rows, columns=['state', 'county', 'fips'])
+
+    tract = county.loc[county.index.repeat(tracts)].reset_index(drop=True)
+    number = np.tile(np.arange(tracts) * 100 + 100, len(county))
+    tract.insert(2, 'tract', [f'Census Tract {n / 100:g}' for n in number])
+    tract['fips'] = tract['fips'] + pd.Series(number).map('{:06d}'.format)
+
+    tables = {}
+    for table, frame in (('census.StateFips', state), ('census.CountyFips', county), ('census.TractFips', tract)):
+        frame.insert(0, 'id' + table.split('.')[1], range(1, len(frame) + 1))
+        tables[table] = frame
+    return tables
+
+
+def sample(rng, frame, share):
+    # Random subset of the rows (in their original order), like a table missing some geographies
+    return frame[rng.random(len(frame)) < share].reset_index(drop=True)
+
+
+def fill(rng, frame, columns, low=0.0, high=1.0, integer=False):
+    # Add random measure columns with some values left NULL
+    for column in columns:
+        if integer:
+            values = rng.integers(low, high, len(frame)).astype(float)
+        else:
+            values = rng.uniform(low, high, len(frame))
+        values[rng.random(len(frame)) < NULL_SHARE] = np.nan
+        frame[column] = values
+    return frame
+
+
+def epa_tables(rng, county):
+    aqi = sample(rng, county[['state', 'county', 'fips']], COVERAGE['aqi'])
+    aqi.insert(0, 'idAqi', range(1, len(aqi) + 1))
+    fmts = json.load(open(os.path.join(DATA_DIR, 'formats', 'aqi.json')))
+    for column in measures('aqi'):
+        if fmts[column] == 'int':
+            fill(rng, aqi, [column], 0, 366, integer=True)
+        else:
+            fill(rng, aqi, [column])
+
+    radon = sample(rng, county[['state', 'county', 'fips']], COVERAGE['radon'])
+    radon.insert(0, 'idRadon', range(1, len(radon) + 1))
+    radon['indoorRadonPotential'] = rng.choice(['Low', 'Moderate', 'High'], len(radon))
+    return {'epa.Aqi': aqi, 'epa.Radon': radon}
+
+
+def state_tables(rng, states, layout):
+    # BRFSS and HINTS tables, one row per state the survey covered
+    tables = {}
+    frame = pd.DataFrame(states, columns=['state', 'stateAbbreviation', 'fips']).drop(columns='fips')
+    for spec in TABLE_SPECS:
+        if spec['dataset'] not in ('BRFSS', 'HINTS'):
+            continue
+        name = spec['table'].split('.')[1]
+        table = sample(rng, frame, COVERAGE['state'])
+        table.insert(0, 'id' + name, range(1, len(table) + 1))
+        tables[spec['table']] = fill(rng, table, layout[spec['table']])
+    return tables
+
+
+def fcc_tables(rng, county, tract):
+    # Broadband and mobile speeds, the same measures at county and tract level
+    speeds = measures('fcc')
+    mobile = [column for column in speeds if column.endswith(('MINDOWN', 'MINUP'))]
+    broadband = [column for column in speeds if column not in mobile]
+
+    tables = {}
+    for spec in TABLE_SPECS:
+        if spec['dataset'] != 'FCC':
+            continue
+        geo = county if spec['level'] == 'county' else tract
+        table = sample(rng, geo[['fips']], COVERAGE['fcc']).rename(columns={'fips': spec['key']})
+        is_mobile = 'Mobile' in spec['table']
+        # Mobile tables store STATEID as an int, broadband ones as a string
+        state_id = table[spec['key']].str[:2]
+        table.insert(0, 'STATEID', state_id.astype(int) if is_mobile else state_id)
+        table.insert(0, 'RecordID', range(1, len(table) + 1))
+        table['TOT_POP'] = rng.integers(0, 10_000, len(table))
+        table['MONTH'] = FCC_MONTH
+        table['YEAR'] = FCC_YEAR
+        tables[spec['table']] = fill(rng, table, mobile if is_mobile else broadband, 0, 1000)
+    return tables
+
+
+def vcaa_tables(rng, states, layout):
+    # HPV vaccination survey, two survey years per state
+    frame = pd.DataFrame({'Geography': [name for name, _, _ in states]})
+    years = []
+    for year in ('2022', '2023'):
+        table = frame.copy()
+        table['Survey Year'] = year
+        years.append(fill(rng, table, layout['vcaa.HPV2023']))
+    return {'vcaa.HPV2023': pd.concat(years, ignore_index=True)}
+
+
+def generate(states=len(STATES), counties=62, tracts=27, seed=0):
+    # Every stand-in table keyed by its SHAPE name (schema.Table)
+    rng = np.random.default_rng(seed)
+    layout = json.load(open(LAYOUT))
+    chosen = STATES[:states]
+
+    tables = fips_tables(chosen, counties, tracts)
+    county, tract = tables['census.CountyFips'], tables['census.TractFips']
+    tables.update(epa_tables(rng, county))
+    tables.update(state_tables(rng, chosen, layout))
+    tables.update(fcc_tables(rng, county, tract))
+    tables.update(vcaa_tables(rng, chosen, layout))
+    return tables
+
+
+def write_standin(directory, tables):
+    # One SQLite file per schema, replacing whatever stand-in was there
+    os.makedirs(directory, exist_ok=True)
+    by_schema = {}
+    for name, frame in tables.items():
+        schema, table = name.split('.')
+        by_schema.setdefault(schema, {})[table] = frame
+    for schema, schema_tables in by_schema.items():
+        path = os.path.join(directory, f'{schema}.db')
+        if os.path.exists(path):
+            os.remove(path)
+        with sqlite3.connect(path) as conn:
+            for table, frame in schema_tables.items():
+                frame.to_sql(table, conn, index=False)
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a local SQLite stand-in for the SHAPE database')
+    parser.add_argument('directory')
+    parser.add_argument('--states', type=int, default=len(STATES), help='number of states, area we serve first (max 51)')
+    parser.add_argument('--counties', type=int, default=62, help='counties per state')
+    parser.add_argument('--tracts', type=int, default=27, help='tracts per county')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tables = generate(args.states, args.counties, args.tracts, args.seed)
+    write_standin(args.directory, tables)
+    for name, frame in tables.items():
+        print(f'  {name}: {len(frame)} rows, {len(frame.columns)} columns')
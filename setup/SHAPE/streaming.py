@@ -0,0 +1,77 @@
+# Streaming mode for the SHAPE pull
+#
+# Tract tables are read in chunks and each chunk goes through filter -> merge -> melt
+# -> enrich -> write on its own, so only one chunk's long rows are ever in memory.
+# Chunks only get the geography columns for their own tracts, and the tracts no chunk
+# had are written at the end as NAs, which gives the same rows as the filled in
+# geography the in-memory path uses (the rows just come out chunk by chunk instead of
+# measure by measure).
+
+import pandas as pd
+
+from specs import GEO_COLUMNS
+from extract import chunk_rows, read_chunks
+from geography import join_keys
+from pipeline import filter_area, source_string, drop_columns, attach_geography, melt_enrich, write
+from memory import track
+from report import stage
+
+
+def stream_table(engine, spec, geo, aws, aws_fips, memory_budget_mb, pushdown=True, run=None, compact=False,
+                 writer='fast'):
+    # Stream one table into its output file, returning the per-stage memory peaks
+    # Stages are timed per chunk into the run report when there is one
+    level = spec['level']
+    geo_cols = GEO_COLUMNS[level]
+    rows = chunk_rows(engine, spec, memory_budget_mb)
+    chunks = read_chunks(engine, spec, aws, aws_fips, rows, pushdown, compact)
+
+    peaks = {}
+    source = None
+    measures = None
+    seen = []
+    first = True
+    while True:
+        with track(peaks, 'read'), stage(run, spec, 'query') as record:
+            chunk = next(chunks, None)
+            record['rows_out'] = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            break
+
+        with track(peaks, 'transform'):
+            with stage(run, spec, 'filter', len(chunk)) as record:
+                chunk = filter_area(chunk, spec, aws, aws_fips)
+                record['rows_out'] = len(chunk)
+            if chunk.empty:
+                continue
+            if source is None:
+                source = source_string(chunk, spec)
+
+            # A chunk where a measure is all NULL comes back as object, cast it like a full read would
+            empty = [c for c in chunk.columns if chunk[c].isna().all()]
+            chunk = chunk.astype({c: 'float64' for c in empty})
+
+            chunk = drop_columns(chunk, spec)
+            seen.append(join_keys(chunk[spec['key']], level))
+            with stage(run, spec, 'merge', len(chunk)) as record:
+                chunk = attach_geography(chunk, spec, geo, fill=False)
+                record['rows_out'] = len(chunk)
+            measures = [c for c in chunk.columns if c not in geo_cols]
+            long = melt_enrich(chunk, spec, source, run)
+
+        with track(peaks, 'write'):
+            write(long, spec if first else dict(spec, overwrite=False, dictionary=False), run, writer=writer)
+        first = False
+
+    # Fill in NAs for the geographies no chunk had
+    if measures is not None:
+        with track(peaks, 'transform'):
+            keys = pd.concat(seen) if seen else pd.Series([], dtype=object)
+            missing = geo[level][~geo[level].index.isin(keys)]
+            missing = missing.reset_index(drop=True).reindex(columns=geo_cols + measures)
+            long = melt_enrich(missing, spec, source, run)
+        with track(peaks, 'write'):
+            write(long, dict(spec, overwrite=False, dictionary=False), run, writer=writer)
+
+    return peaks
+
@@ -0,0 +1,67 @@
+# Fixtures for the SHAPE pull tests
+#
+# The pull reads and writes paths relative to the repo root (ShinyCIF/www/data,
+# setup/SHAPE/data, ...), so each test runs in a scratch copy of that layout, the same
+# one benchmarks/bench_pipeline.py uses, with the login pointing at a small SQLite
+# stand-in (standin.py) instead of SHAPE.
+#
+#   python -m pytest setup/SHAPE/tests
+
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+SHAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(SHAPE_DIR))
+sys.path.insert(0, SHAPE_DIR)
+
+from specs import TARGETS, MEASURE_DICTIONARY
+
+
+@pytest.fixture(scope='session')
+def standin(tmp_path_factory):
+    # A stand-in SHAPE with the five area we serve states and a few counties and tracts each
+    from standin import generate, write_standin
+
+    directory = tmp_path_factory.mktemp('standin')
+    # The stand-in's table layouts are read from setup/SHAPE/data, relative to the repo root
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(REPO_DIR)
+        write_standin(str(directory), generate(states=5, counties=4, tracts=3))
+    return str(directory)
+
+
+@pytest.fixture
+def engine(standin):
+    # Engine for the stand-in, for tests that read it directly
+    from extract import create_engine
+
+    engine = create_engine({'standin': standin}, 1)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch, standin):
+    # Scratch repo root with the pull's lookups, an empty data folder and the repo's measure dictionary
+    shutil.copytree(os.path.join(SHAPE_DIR, 'data'), tmp_path / 'setup/SHAPE/data',
+                    ignore=shutil.ignore_patterns('geography', 'checkpoints', 'fingerprints.json', 'sql_login.json'))
+    with open(tmp_path / 'setup/SHAPE/data/sql_login.json', 'w') as f:
+        json.dump({'standin': standin}, f)
+    os.makedirs(tmp_path / os.path.dirname(TARGETS['state']))
+    shutil.copy(os.path.join(REPO_DIR, MEASURE_DICTIONARY), tmp_path / MEASURE_DICTIONARY)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def pull(tree):
+    # Run the pull in the scratch tree with OPTIONS plus the given changes
+    from pull_shape_db import OPTIONS, run
+
+    def pull(**changes):
+        return run(dict(OPTIONS, **changes))
+    return pull
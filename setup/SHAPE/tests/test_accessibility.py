@@ -0,0 +1,53 @@
+# two_step() and scores() against 2SFCA worked out over the full tract x facility matrix
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from accessibility import MODELS, PER_RESIDENTS, scores, two_step
+
+
+def brute_force(minutes, population, bands):
+    # minutes: tracts x facilities (inf where a pair has no drive time)
+    weight = np.zeros_like(minutes)
+    for limit, value in reversed(bands):
+        weight[minutes <= limit] = value
+    demand = population @ weight
+    ratio = np.divide(1.0, demand, out=np.zeros_like(demand), where=demand > 0)
+    return weight @ ratio
+
+
+def pairs_matrix(rng, tracts, facilities, share):
+    minutes = rng.gamma(2.0, 20.0, size=(tracts, facilities))
+    minutes[rng.random(minutes.shape) > share] = np.inf
+    return minutes
+
+
+@pytest.mark.parametrize('model', list(MODELS))
+def test_two_step_matches_brute_force(model):
+    rng = np.random.default_rng(0)
+    minutes = pairs_matrix(rng, 60, 15, 0.4)
+    population = rng.integers(0, 8000, 60).astype('float64')
+    # A pair exactly on each band's limit counts in that band
+    minutes[0, :len(MODELS[model])] = [limit for limit, _ in MODELS[model]]
+    tracts, facilities = np.nonzero(np.isfinite(minutes))
+    got = two_step(tracts, facilities, minutes[tracts, facilities], population, MODELS[model], 60, 15)
+    np.testing.assert_allclose(got, brute_force(minutes, population, MODELS[model]), rtol=1e-12, atol=0)
+
+
+def test_scores_matches_brute_force():
+    rng = np.random.default_rng(1)
+    geoids = [f'{49000000000 + i:011d}' for i in range(40)]
+    population = pd.DataFrame({'value': rng.integers(0, 8000, 40).astype('float64')},
+                              index=pd.Index(geoids, name='GEOID'))
+    frames, matrices = [], {}
+    for fac_type in ('Mammography', 'Lung Cancer Screening'):
+        minutes = pairs_matrix(rng, 40, 10, 0.3)
+        matrices[fac_type] = minutes
+        tract, facility = np.nonzero(np.isfinite(minutes))
+        frames.append(pd.DataFrame({'GEOID': np.array(geoids)[tract], 'FacID': [f'{fac_type}{j}' for j in facility],
+                                    'FacType': fac_type, 'minutes': minutes[tract, facility]}))
+    wide = scores(pd.concat(frames, ignore_index=True), population)
+    for (fac_type, model), values in wide.items():
+        expected = brute_force(matrices[fac_type], population['value'].to_numpy(), MODELS[model]) * PER_RESIDENTS
+        np.testing.assert_allclose(values.reindex(geoids).to_numpy(), expected, rtol=1e-12)
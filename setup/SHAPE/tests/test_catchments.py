@@ -0,0 +1,20 @@
+# Multi-catchment pulls
+
+import json
+import os
+
+from specs import TARGETS
+
+
+def test_catchments_in_process_with_one_job(tree, monkeypatch):
+    import catchments
+    from pull_shape_db import OPTIONS
+
+    with open('catchments.json', 'w') as f:
+        json.dump({'north': {'states': ['Idaho', 'Montana']}, 'south': {'states': ['Utah', 'Nevada']}}, f)
+    # --jobs 1 writes every catchment here instead of starting worker processes
+    monkeypatch.setattr(catchments, 'ProcessPoolExecutor', None)
+    reports = catchments.run(dict(OPTIONS, catchments='catchments.json', datasets=['AQI'], jobs=1))
+    assert set(reports) == {'north', 'south'}
+    for name in reports:
+        assert os.path.exists(os.path.join(catchments.CATCHMENTS_DIR, name, TARGETS['county']))
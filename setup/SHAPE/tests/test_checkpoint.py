@@ -0,0 +1,47 @@
+# A pull that fails part way and is rerun writes the same files as one that never failed
+
+import os
+import shutil
+
+import pytest
+
+import pipeline
+import writers
+from specs import TARGETS, MEASURE_DICTIONARY
+
+DATASETS = ['AQI', 'Radon', 'FCC']
+OUTPUTS = list(TARGETS.values()) + [MEASURE_DICTIONARY]
+
+
+def outputs():
+    return {output: open(output, 'rb').read() for output in OUTPUTS if os.path.exists(output)}
+
+
+def test_resume_matches_cold_run(pull, tree, monkeypatch, capsys):
+    shutil.copy(MEASURE_DICTIONARY, 'dictionary.csv')
+    pull(datasets=DATASETS, incremental=False)
+    cold = outputs()
+    for output in TARGETS.values():
+        if os.path.exists(output):
+            os.remove(output)
+    shutil.copy('dictionary.csv', MEASURE_DICTIONARY)
+
+    # The connection drops while the third table is written
+    write = pipeline.write
+
+    def failing(long, spec, *args, **kwargs):
+        if spec['name'] == 'broadbandCounty':
+            raise ConnectionError('dropped')
+        return write(long, spec, *args, **kwargs)
+    monkeypatch.setattr(pipeline, 'write', failing)
+    with pytest.raises(ConnectionError):
+        pull(datasets=DATASETS, incremental=False)
+    # The process that failed is gone, and so is what the writers had indexed
+    monkeypatch.setattr(pipeline, 'write', write)
+    writers._INDEX.clear()
+    writers._WRITTEN.clear()
+
+    capsys.readouterr()
+    pull(datasets=DATASETS, incremental=False)
+    assert 'resuming, 2 tables already written' in capsys.readouterr().out
+    assert outputs() == cold
@@ -0,0 +1,76 @@
+# format_double()/format_doubles() against what readr's write_csv writes, and the merge
+# against the facility_load_comprehensive.csv facility_load.R wrote
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from drive_times import FACILITY_LOAD_DIR
+from facility_load import COMPREHENSIVE, build, format_double, format_doubles, grisu3, grisu3_array
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+READR = [
+    # Shortest round trip (rows of facility_load_comprehensive.csv)
+    (4.15304881915, '4.15304881915'),
+    (0.474829516298, '0.474829516298'),
+    (0.0733660675721, '0.0733660675721'),
+    # grisu3 gives up and readr falls back to %.17g (also rows of the file)
+    (3.65297929549, '3.6529792954899998'),
+    (25.1805078751, '25.180507875100002'),
+    (166.890006305, '166.89000630500001'),
+    # Exponent form
+    (100000.0, '1e5'),
+    (-2500000.0, '-25e5'),
+    (1e16, '1e16'),
+    (1e-05, '1e-5'),
+    (1.5e-07, '1.5e-7'),
+    # Zeros, large integers and the values that aren't numbers
+    (0.0, '0'),
+    (-0.0, '-0'),
+    (188.0, '188'),
+    (1200.0, '1200'),
+    (123456789.0, '123456789'),
+    (9007199254740992.0, '9007199254740992'),
+    (1.2345678901234567e+20, '12345678901234567e4'),
+    (np.nan, 'NA'),
+    (np.inf, 'Inf'),
+    (-np.inf, '-Inf'),
+]
+
+
+@pytest.mark.parametrize('value, written', READR)
+def test_format_double_matches_readr(value, written):
+    assert format_double(value) == written
+
+
+def test_format_doubles_matches_readr():
+    values = pd.Series([value for value, _ in READR])
+    assert format_doubles(values).tolist() == [written for _, written in READR]
+
+
+def test_grisu3_array_matches_grisu3():
+    rng = np.random.default_rng(0)
+    # Short decimals like the drive times, random bit patterns and the subnormal and power of two edges
+    scale = 10.0 ** rng.integers(1, 13, 20000)
+    values = np.concatenate([np.round(rng.random(20000) * 100 * scale) / scale,
+                             rng.integers(1, 0x7ff0000000000000, 20000, dtype='uint64').view('float64'),
+                             [5e-324, 2.2250738585072014e-308, 0.5, 1.0, 2.0 ** 60, 1.7976931348623157e308]])
+    values = values[values > 0]
+    assert grisu3_array(values).tolist() == [grisu3(value) for value in values.tolist()]
+
+
+def test_format_doubles_matches_format_double():
+    rng = np.random.default_rng(1)
+    values = pd.Series(np.concatenate([rng.integers(1, 10 ** 6, 2000) * 10.0 ** rng.integers(-8, 20, 2000),
+                                       -rng.gamma(2.0, 20.0, 2000), [0.0, -0.0, np.nan]]))
+    assert format_doubles(values).tolist() == [format_double(value) for value in values]
+
+
+def test_merge_matches_facility_load_r(tmp_path):
+    target = str(tmp_path / 'facility_load_comprehensive.csv')
+    build(target, os.path.join(REPO_DIR, FACILITY_LOAD_DIR), jobs=1)
+    with open(target, 'rb') as merged, open(os.path.join(REPO_DIR, COMPREHENSIVE), 'rb') as written:
+        assert merged.read() == written.read()
@@ -0,0 +1,73 @@
+# fast_csv.render gives the same text as DataFrame.to_csv (QUOTE_NONNUMERIC, na_rep NA)
+#
+# edge_cases() is also what benchmarks/bench_csv_writer.py diffs before timing.
+
+import csv
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import fast_csv
+
+CSV_OPTIONS = {'quoting': csv.QUOTE_NONNUMERIC, 'na_rep': 'NA'}
+
+
+def edge_cases():
+    # Frame with every kind of value the all_* files (and a few they don't) hold
+    values = [0.0, -0.0, 1.1, 1e16, 1e-05, 5e-324, np.inf, -np.inf, np.nan, 123456789.125]
+    n = len(values)
+    return pd.DataFrame({
+        'GEOID': ['49001', '49003', None, '016', 'NA', '', '49005', '49007', '49009', '49011'],
+        'measure': pd.Categorical(['a', 'b "quoted"', 'c,d', 'a', None, 'e\tf', 'a', 'b "quoted"', 'g', 'h']),
+        'value': values,
+        'mixed': [1.5, 'Zone 1', np.nan, 2, None, 'Zone "2"', -0.0, True, 3e20, 'x'],
+        'count': np.arange(n, dtype='int64') - 3,
+        'small': np.arange(n, dtype='int8'),
+        'flag': np.arange(n) % 2 == 0,
+        'nullable': pd.array([1, None, 3, 4, None, 6, 7, 8, 9, 10], dtype='Int64'),
+        'RE': [np.nan] * n,
+        'Sex': pd.Series([None] * n, dtype=object),
+        'text': pd.Series(['x'] * (n - 1) + [None], dtype='str'),
+        'numbers': pd.Categorical([1.5, 2.5, None, 1.5, 2.5, 1.5, 1.5, 2.5, 1.5, 1.5]),
+        'float32': np.linspace(0, 1, n, dtype='float32'),
+    })
+
+
+def rendered(frame, keys):
+    header, lines, _ = fast_csv.render(frame, keys, **CSV_OPTIONS)
+    return header + ''.join(lines)
+
+
+# Each column on its own next to GEOID, so one that goes through to_csv doesn't send the rest there too
+@pytest.mark.parametrize('name', list(edge_cases().columns[1:]))
+def test_edge_case_column_matches_to_csv(name):
+    frame = edge_cases()[['GEOID', name]]
+    keys = list(frame.columns)
+    assert rendered(frame, keys) == frame.to_csv(index=False, **CSV_OPTIONS)
+    # The key text writers.py indexes by is what a CSV reader gets back
+    literal = fast_csv.render(frame, keys, **CSV_OPTIONS)[2]
+    assert literal.astype(str).equals(fast_csv.pandas_render(frame, keys, **CSV_OPTIONS)[2].astype(str))
+
+
+def test_all_edge_cases_match_to_csv():
+    frame = edge_cases()
+    assert rendered(frame, ['GEOID', 'measure']) == frame.to_csv(index=False, **CSV_OPTIONS)
+
+
+def test_pull_writes_the_same_files_with_either_writer(pull, tree):
+    from specs import TARGETS, MEASURE_DICTIONARY
+
+    outputs = list(TARGETS.values()) + [MEASURE_DICTIONARY]
+    shutil.copy(MEASURE_DICTIONARY, 'dictionary.csv')
+    written = {}
+    for writer in ('pandas', 'fast'):
+        for output in TARGETS.values():
+            if os.path.exists(output):
+                os.remove(output)
+        shutil.copy('dictionary.csv', MEASURE_DICTIONARY)
+        pull(datasets=['AQI', 'Radon', 'BRFSS', 'FCC'], csv_writer=writer, incremental=False)
+        written[writer] = {output: open(output, 'rb').read() for output in outputs}
+    assert written['fast'] == written['pandas']
@@ -0,0 +1,12 @@
+# Label formatting
+
+import pandas as pd
+
+from formats import format_by_code
+
+
+def test_labels_match_the_per_row_styles():
+    values = pd.Series([0.1234, 1234.0, 56, None], dtype=object)
+    codes = pd.Series(['pct', 'int', 'int', 'int'])
+    assert format_by_code(values, codes).tolist()[:3] == ['12.3%', '1234.0', '56']
+    assert pd.isna(format_by_code(values, codes).iloc[3])
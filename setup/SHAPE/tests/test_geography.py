@@ -0,0 +1,31 @@
+# complete() gives the rows the per table outer merge with the FIPS tables used to
+
+import pandas as pd
+import pytest
+
+from geography import catchment, catchment_index, complete, join_column, join_keys, load_registry
+from pull_shape_db import AWS
+from specs import GEO_COLUMNS, TABLE_SPECS
+
+SPECS = ['aqi', 'broadbandTract', 'brfss_tbco']
+
+
+@pytest.mark.parametrize('name', SPECS)
+def test_complete_matches_outer_merge(engine, tmp_path, name):
+    spec = next(spec for spec in TABLE_SPECS if spec['name'] == name)
+    level = spec['level']
+    registry = load_registry(engine, directory=str(tmp_path))
+    geo = catchment(registry, catchment_index(registry, AWS))[level]
+
+    df = pd.read_sql(f"select * from {spec['table']}", engine)
+    keys = join_keys(df[spec['key']], level)
+    # Rows for the area we serve, less a few so there are geographies to fill in
+    df = df[keys.isin(geo.index).to_numpy()].iloc[3:].reset_index(drop=True)
+    data = df.drop(columns=[column for column in df.columns if column in GEO_COLUMNS[level] + [spec['key']]])
+
+    old = data.assign(key=join_keys(df[spec['key']], level).to_numpy()) \
+        .merge(geo.reset_index(drop=True), how='outer', left_on='key', right_on=join_column(level)) \
+        .drop(columns='key')
+    new = complete(data, df[spec['key']], geo, level)
+    assert len(new) == len(geo)
+    pd.testing.assert_frame_equal(new[old.columns], old, check_dtype=False)
@@ -0,0 +1,48 @@
+# Incremental pulls: a table is skipped only while its output file still holds what it wrote
+
+import json
+
+import pandas as pd
+
+from incremental import FINGERPRINTS
+from specs import TARGETS
+
+
+def measures(level):
+    return set(pd.read_csv(TARGETS[level])['measure'])
+
+
+def test_unchanged_tables_skipped(pull, capsys):
+    pull(datasets=['AQI'])
+    capsys.readouterr()
+    pull(datasets=['AQI'])
+    assert 'unchanged since the last pull' in capsys.readouterr().out
+
+
+def test_target_rewritten_externally_is_repulled(pull, capsys):
+    pull(datasets=['AQI'])
+    before = measures('county')
+    # The R build rewrites all_county.csv; here it comes back with just the header
+    with open(TARGETS['county']) as f:
+        header = f.readline()
+    with open(TARGETS['county'], 'w') as f:
+        f.write(header)
+    capsys.readouterr()
+    pull(datasets=['AQI'])
+    assert 'unchanged since the last pull' not in capsys.readouterr().out
+    assert measures('county') == before
+
+
+def test_tables_wiped_by_an_overwrite_are_repulled(pull):
+    pull(datasets=['BRFSS', 'HINTS'])
+    before = measures('state')
+    # BRFSS changed in SHAPE, so its table that starts all_state.csv over runs without HINTS
+    with open(FINGERPRINTS) as f:
+        saved = json.load(f)
+    del saved['tables']['brfss_brst_crvcl_scrn']
+    with open(FINGERPRINTS, 'w') as f:
+        json.dump(saved, f)
+    pull(datasets=['BRFSS'])
+    assert measures('state') < before
+    pull(datasets=['BRFSS', 'HINTS'])
+    assert measures('state') == before
@@ -0,0 +1,26 @@
+# A national pull writes the same partitions in this process (--jobs 1) as on worker processes
+
+import json
+import os
+
+from national import NATIONAL_DIR
+
+
+def partitions():
+    with open(os.path.join(NATIONAL_DIR, 'manifest.json')) as f:
+        manifest = json.load(f)
+    written = {}
+    for folder, _, names in os.walk(NATIONAL_DIR):
+        for name in names:
+            if name.endswith('.csv'):
+                with open(os.path.join(folder, name), 'rb') as f:
+                    written[os.path.join(folder, name)] = f.read()
+    return {fips: (shard['state'], shard['rows']) for fips, shard in manifest.items()}, written
+
+
+def test_in_process_matches_workers(pull, tree):
+    pull(datasets=['AQI', 'FCC'], national=True, jobs=2)
+    on_workers = partitions()
+    pull(datasets=['AQI', 'FCC'], national=True, jobs=1)
+    assert partitions() == on_workers
+    assert len(on_workers[0]) == 5 and on_workers[1]
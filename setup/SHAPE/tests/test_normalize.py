@@ -0,0 +1,14 @@
+# Normalized output next to the all_* files
+
+import os
+
+from normalize import NORMALIZED_DIR
+from specs import TARGETS
+
+
+def test_normalized_with_missing_levels(pull):
+    # BRFSS only writes all_state.csv, so the county and tract files don't exist yet
+    pull(datasets=['BRFSS'], normalized=True)
+    assert not os.path.exists(TARGETS['county'])
+    written = os.listdir(NORMALIZED_DIR)
+    assert written and all(name.startswith('state_') for name in written)
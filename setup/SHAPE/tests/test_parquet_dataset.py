@@ -0,0 +1,52 @@
+# The Parquet dataset's hive partitions read back to the rows of the all_* files
+
+import os
+
+import pandas as pd
+import pytest
+
+from parquet_dataset import COLUMNS, PARQUET_DIR
+from specs import TARGETS
+
+ds = pytest.importorskip('pyarrow.dataset')
+
+
+def csv_rows(level):
+    rows = pd.read_csv(TARGETS[level], dtype=str, float_precision='round_trip')
+    value = pd.to_numeric(rows['value'], errors='coerce')
+    rows['value_text'] = rows['value'].where(value.isna() & rows['value'].notna())
+    rows['value'] = value
+    return rows.reindex(columns=COLUMNS)
+
+
+def parquet_rows(level):
+    table = ds.dataset(PARQUET_DIR, format='parquet', partitioning='hive').to_table(filter=ds.field('level') == level)
+    rows = table.to_pandas()
+    rows['cat'] = rows['cat'].astype(str)
+    return rows.reindex(columns=COLUMNS)
+
+
+def sort(rows):
+    return rows.sort_values(['cat', 'measure', 'GEOID', 'RE', 'Sex', 'source'], ignore_index=True) \
+        .astype({column: object for column in COLUMNS if column != 'value'}) \
+        .where(lambda frame: frame.notna(), None)
+
+
+def test_partitions_read_back_to_csv_rows(pull):
+    # Radon has text values, FCC fills county and tract, BRFSS the state file
+    pull(datasets=['Radon', 'BRFSS', 'FCC'], parquet=True)
+    for level in TARGETS:
+        assert os.path.isdir(os.path.join(PARQUET_DIR, f'level={level}'))
+        pd.testing.assert_frame_equal(sort(parquet_rows(level)), sort(csv_rows(level)))
+
+
+def test_rewrite_after_a_crash_between_the_renames(pull):
+    from parquet_dataset import write_parquet
+
+    pull(datasets=['FCC'], parquet=True)
+    target = os.path.join(PARQUET_DIR, 'level=county')
+    # A run that stopped with the old level renamed aside and the new one not in yet
+    os.replace(target, os.path.join(PARQUET_DIR, '.level=county.old'))
+    write_parquet('county')
+    assert sorted(os.listdir(PARQUET_DIR)) == ['level=county', 'level=tract']
+    pd.testing.assert_frame_equal(sort(parquet_rows('county')), sort(csv_rows('county')))
@@ -0,0 +1,16 @@
+# Whole pulls against the stand-in, one per dataset, so a spec that doesn't fit its
+# table or lookups fails here
+
+import pandas as pd
+import pytest
+
+from pull_shape_db import DATASETS
+from specs import TARGETS, specs_for
+
+
+@pytest.mark.parametrize('dataset', DATASETS)
+def test_pull_dataset(pull, dataset):
+    pull(datasets=[dataset])
+    for level in {spec['level'] for spec in specs_for([dataset])}:
+        written = pd.read_csv(TARGETS[level], dtype={'GEOID': str})
+        assert len(written) and written['measure'].notna().all()
@@ -0,0 +1,20 @@
+# Reader backends: the ODBC connection string and the fallback to pandas
+
+import pytest
+import sqlalchemy as sa
+
+import readers
+from readers import ArrowUnavailable, fetch_arrow, odbc_connection_string, read_arrow
+
+
+def test_password_braced_in_connection_string():
+    url = sa.engine.URL.create('mssql+pyodbc', username='shape', password='a;b}c=d', host='db', database='SHAPE')
+    assert ';PWD={a;b}}c=d};' in odbc_connection_string(url)
+
+
+def test_arrow_falls_back_to_pandas(monkeypatch):
+    monkeypatch.setattr(readers, '_FALLBACK', {})
+    engine = sa.create_engine('sqlite://')
+    with pytest.raises(ArrowUnavailable):
+        fetch_arrow(engine, 'select 1 as x')
+    assert read_arrow(engine, sa.text('select 1 as x'))['x'].tolist() == [1]
@@ -0,0 +1,42 @@
+# compact() then widen() gives back the values read, and the files come out the same
+
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from geography import geoid, join_column
+from schema import compact, widen
+from specs import TABLE_SPECS, TARGETS, MEASURE_DICTIONARY
+
+
+@pytest.mark.parametrize('spec', TABLE_SPECS, ids=[spec['name'] for spec in TABLE_SPECS])
+def test_compact_then_widen_is_lossless(engine, spec):
+    df = pd.read_sql(f"select * from {spec['table']}", engine)
+    compacted = compact(df, spec)
+    columns = [column for column in df.columns if column != spec['key']]
+    widened = widen(compacted, columns)
+    for column in columns:
+        # Numbers come back at their 64 bit dtypes, text from categoricals to the same strings
+        if pd.api.types.is_numeric_dtype(df[column]):
+            assert widened[column].dtype == df[column].dtype
+        pd.testing.assert_series_equal(widened[column].astype(df[column].dtype), df[column])
+    if join_column(spec['level']) == 'fips':
+        # FIPS keys are held as Int64 and padded back
+        assert geoid(compacted[spec['key']], spec['level']).equals(geoid(df[spec['key']], spec['level']))
+
+
+def test_compact_dtypes_write_the_same_files(pull, tree):
+    outputs = list(TARGETS.values()) + [MEASURE_DICTIONARY]
+    shutil.copy(MEASURE_DICTIONARY, 'dictionary.csv')
+    written = {}
+    for compact_dtypes in (False, True):
+        for output in TARGETS.values():
+            if os.path.exists(output):
+                os.remove(output)
+        shutil.copy('dictionary.csv', MEASURE_DICTIONARY)
+        pull(datasets=['AQI', 'Radon', 'BRFSS', 'FCC', 'HINTS', 'HPV'], compact_dtypes=compact_dtypes,
+             incremental=False)
+        written[compact_dtypes] = {output: open(output, 'rb').read() for output in outputs}
+    assert written[True] == written[False]
@@ -0,0 +1,42 @@
+# within() and nearest() on the grid index against every query x point haversine distance
+
+import numpy as np
+import pytest
+
+from spatial_index import build_index, haversine, nearest, within
+
+
+@pytest.fixture
+def points():
+    # Clustered points over the catchment (several at one spot, like providers at one address)
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(35, 49, 3000), rng.uniform(-120, -104, 3000)
+    lat[:20], lon[:20] = 40.76, -111.89
+    return lat, lon
+
+
+@pytest.fixture
+def queries():
+    # Queries inside and well outside the points' box
+    rng = np.random.default_rng(1)
+    return rng.uniform(30, 52, 400), rng.uniform(-125, -98, 400)
+
+
+@pytest.mark.parametrize('radius', [5, 25, 150])
+def test_within_matches_brute_force(points, queries, radius):
+    (point_lat, point_lon), (lat, lon) = points, queries
+    query, row, miles = within(build_index(point_lat, point_lon), lat, lon, radius)
+    distance = haversine(lat[:, None], lon[:, None], point_lat[None], point_lon[None])
+    expected = set(zip(*np.nonzero(distance <= radius)))
+    assert set(zip(query.tolist(), row.tolist())) == {(int(q), int(p)) for q, p in expected}
+    np.testing.assert_array_equal(miles, distance[query, row])
+
+
+@pytest.mark.parametrize('k', [1, 5, 30])
+def test_nearest_matches_brute_force(points, queries, k):
+    (point_lat, point_lon), (lat, lon) = points, queries
+    rows, miles = nearest(build_index(point_lat, point_lon), lat, lon, k)
+    distance = haversine(lat[:, None], lon[:, None], point_lat[None], point_lon[None])
+    # Rows can tie on distance, so the answer is checked by its distances
+    np.testing.assert_array_equal(miles, np.sort(distance, axis=1)[:, :k])
+    np.testing.assert_array_equal(np.take_along_axis(distance, rows, axis=1), miles)
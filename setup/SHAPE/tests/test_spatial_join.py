@@ -0,0 +1,38 @@
+# assign() against testing every point against every outline of the apps' shapefiles
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spatial_join import assign, read_layer
+
+shapely = pytest.importorskip('shapely')
+pytest.importorskip('pyogrio')
+
+WWW = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+                   'ShinyCIF/www')
+
+
+def brute_force(layer, lat, lon):
+    # GEOID of the first outline by GEOID that holds (or touches) each point
+    geoids = np.full(len(lat), np.nan, dtype=object)
+    for shape in np.argsort(layer['rank'], kind='stable'):
+        outline = shapely.from_wkb(shapely.to_wkb(layer['shapes'][shape]))
+        inside = pd.isna(geoids) & shapely.intersects_xy(outline, lon, lat)
+        geoids[inside] = layer['geoids'][shape]
+    return geoids
+
+
+@pytest.mark.parametrize('level', ['county', 'tract'])
+def test_assign_matches_brute_force(level):
+    layer = read_layer(level, WWW)
+    rng = np.random.default_rng(0)
+    low_lon, low_lat, high_lon, high_lat = shapely.total_bounds(layer['shapes'])
+    lat, lon = rng.uniform(low_lat - 1, high_lat + 1, 3000), rng.uniform(low_lon - 1, high_lon + 1, 3000)
+    # Outline vertices sit on the edges shared by neighbouring outlines
+    vertices = shapely.get_coordinates(layer['shapes'])
+    vertices = vertices[rng.choice(len(vertices), 300, replace=False)]
+    lat, lon = np.concatenate([lat, vertices[:, 1], [np.nan]]), np.concatenate([lon, vertices[:, 0], [-111.9]])
+    assert pd.Series(assign(layer, lat, lon)).equals(pd.Series(brute_force(layer, lat, lon)))
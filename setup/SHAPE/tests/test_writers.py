@@ -0,0 +1,71 @@
+# upsert() and finish(): reruns leave the files as they were, replaced rows are dropped
+# once at the end of the run, and two tables can't write the same key in one run
+
+import pandas as pd
+import pytest
+
+from writers import LONG_KEYS, finish, upsert
+
+
+def rows(value, measures=('a', 'b')):
+    return pd.DataFrame({'GEOID': '49', 'measure': list(measures), 'RE': 'All', 'Sex': 'All', 'value': value})
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_upsert_twice_is_byte_identical(tmp_path):
+    path = str(tmp_path / 'all_state.csv')
+    upsert(rows(1), path, LONG_KEYS, owner='first')
+    finish()
+    once = read(path)
+    upsert(rows(1), path, LONG_KEYS, owner='first')
+    finish()
+    assert read(path) == once
+
+
+def test_changed_rows_replaced_at_finish(tmp_path):
+    path = str(tmp_path / 'all_state.csv')
+    upsert(rows(1), path, LONG_KEYS, owner='first')
+    finish()
+    # A streamed table writes its chunks one upsert at a time
+    upsert(rows(2, ['a']), path, LONG_KEYS, owner='first')
+    upsert(rows(2, ['c']), path, LONG_KEYS, owner='first')
+    finish()
+    written = pd.read_csv(path)
+    assert list(written['measure']) == ['b', 'a', 'c']
+    assert list(written['value']) == [1, 2, 2]
+
+
+def test_cross_table_key_clash_raises(tmp_path):
+    path = str(tmp_path / 'all_state.csv')
+    upsert(rows(1), path, LONG_KEYS, owner='BRFSS')
+    with pytest.raises(Exception, match='BRFSS'):
+        upsert(rows(2, ['b']), path, LONG_KEYS, owner='HINTS')
+    finish()
+    # The next run may replace them
+    upsert(rows(2, ['b']), path, LONG_KEYS, owner='HINTS')
+    finish()
+    assert list(pd.read_csv(path)['value']) == [1, 2]
+
+
+def test_pull_twice_is_byte_identical(pull, tree):
+    from specs import TARGETS
+
+    pull(datasets=['AQI'], incremental=False)
+    once = read(TARGETS['county'])
+    pull(datasets=['AQI'], incremental=False)
+    assert read(TARGETS['county']) == once
+
+
+def test_brfss_and_hints_pulled_together(pull, tree):
+    from specs import BRFSS_SOURCE, HINTS_SOURCE, TARGETS
+
+    pull(datasets=['BRFSS', 'HINTS'])
+    written = pd.read_csv(TARGETS['state'], dtype={'GEOID': str})
+    # Both surveys' rows of the measures they share are kept, told apart by source
+    shared = written[written['measure'].isin(['smokeEveryDay', 'smokeSomeDays', 'hadMammogramInTheLastTwoYears'])]
+    assert set(shared['source']) == {BRFSS_SOURCE, HINTS_SOURCE}
+    assert not written.duplicated(['GEOID', 'measure', 'RE', 'Sex', 'source']).any()
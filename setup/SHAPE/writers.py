@@ -0,0 +1,176 @@
+# Idempotent writers for the SHAPE pull
+#
+# The all_* files and the measure dictionary used to be appended to blindly, so every
+# rerun added the same rows again. upsert() keeps a hash index of the rows in each file
+# and only writes what's new:
+#   - rows whose key isn't in the file yet are appended
+#   - rows identical to the one already there are skipped
+#   - rows whose key exists with different content are appended too, and the old row
+#     is marked stale
+# The index is built once per file per run, streaming the file's key columns and lines,
+# so a write costs hashing its own rows plus an append, however big the file is and
+# however many chunks a streamed table writes. Stale rows (and duplicates left by older
+# runs) are dropped by finish() at the end of the run, in one pass that writes the kept
+# rows to a staging file next to the old one and swaps it in with os.replace, so readers
+# never see a half written file. Until then the last row of a key is the one that counts,
+# which is also how the next run reads a file a failed run left behind.
+#
+# all_state.csv is keyed on the source too (STATE_KEYS): BRFSS and HINTS both have
+# smokeEveryDay, neverSmoked, hadMammogramInTheLastTwoYears, ... for the same states, and
+# the apps show both. Beyond that, two tables writing the same key with different rows in
+# one run is an error, since which of them wins shouldn't depend on the order the tables
+# are written in.
+#
+# The rows are rendered by fast_csv.py (writer='fast') or DataFrame.to_csv
+# (writer='pandas'); both give the same text.
+
+import os
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+import fast_csv
+
+# Key columns for the long all_* files and the measure dictionary
+LONG_KEYS = ['GEOID', 'measure', 'RE', 'Sex']
+STATE_KEYS = LONG_KEYS + ['source']
+DICTIONARY_KEYS = ['measure']
+
+# Rows read at a time while indexing an existing file
+INDEX_CHUNK_ROWS = 200000
+
+# path -> {'keys', 'lines', 'stale'}: key and line hashes of every data row in file
+# order, and which rows newer ones have replaced
+_INDEX = {}
+
+# path -> (key hashes, owners) written during this run
+_WRITTEN = {}
+
+
+def hash_key_frame(literal):
+    # Hash the key columns' literal text, whatever dtype the text came in
+    return pd.util.hash_pandas_object(literal.astype(str), index=False).to_numpy()
+
+
+def hash_lines(lines):
+    # Hash rows by their text, ignoring line endings
+    stripped = pd.Series([line.rstrip('\r\n') for line in lines], dtype=object)
+    return pd.util.hash_pandas_object(stripped, index=False).to_numpy()
+
+
+def load_index(path, keys):
+    # Key and line hashes for every data row of an existing file, read a chunk at a time
+    # Keys are read as literal text so 'NA', '16' and '016' stay distinct
+    if path not in _INDEX:
+        key_hashes = [hash_key_frame(chunk[keys]) for chunk in
+                      pd.read_csv(path, usecols=keys, dtype=str, keep_default_na=False, chunksize=INDEX_CHUNK_ROWS)]
+        line_hashes = []
+        with open(path, newline='') as f:
+            next(f, None)
+            while True:
+                lines = list(islice(f, INDEX_CHUNK_ROWS))
+                if not lines:
+                    break
+                line_hashes.append(hash_lines(lines))
+        key_hashes = np.concatenate(key_hashes or [np.array([], dtype='uint64')])
+        line_hashes = np.concatenate(line_hashes or [np.array([], dtype='uint64')])
+        if len(key_hashes) != len(line_hashes):
+            raise Exception(f'{path} has rows spanning multiple lines, so it cannot be indexed by line')
+        # Only the last copy of a key left by older runs counts
+        _INDEX[path] = {'keys': key_hashes, 'lines': line_hashes,
+                        'stale': pd.Index(key_hashes).duplicated(keep='last')}
+    return _INDEX[path]
+
+
+def upsert(frame, path, keys, fresh=False, writer='fast', owner=None, **csv_options):
+    # Write rows into path keyed on keys, replacing rows that have the same key
+    # With fresh the file is started over (with header) from just these rows
+    # owner names the table writing, to catch two tables writing the same key in one run
+    if writer == 'fast':
+        header, lines, literal = fast_csv.render(frame, keys, **csv_options)
+    else:
+        header, lines, literal = fast_csv.pandas_render(frame, keys, **csv_options)
+    key_hashes = hash_key_frame(literal)
+    line_hashes = hash_lines(lines)
+
+    # Within one write the last row for a key wins
+    last = ~pd.Index(key_hashes).duplicated(keep='last')
+    key_hashes, line_hashes = key_hashes[last], line_hashes[last]
+    lines = np.array(lines, dtype=object)[last]
+
+    if fresh or not os.path.exists(path):
+        rewrite(path, header, lines)
+        _INDEX[path] = {'keys': key_hashes, 'lines': line_hashes, 'stale': np.zeros(len(key_hashes), dtype=bool)}
+        _WRITTEN[path] = (key_hashes, np.full(len(key_hashes), owner, dtype=object))
+        return
+
+    index = load_index(path, keys)
+    live = np.flatnonzero(~index['stale'])
+
+    # Where each new key sits among the live rows, -1 if it is new
+    position = pd.Index(index['keys'][live]).get_indexer(key_hashes)
+    known = position >= 0
+    unchanged = np.zeros(len(key_hashes), dtype=bool)
+    unchanged[known] = index['lines'][live[position[known]]] == line_hashes[known]
+    changed = known & ~unchanged
+    written = ~unchanged
+
+    # Rows replacing what another table wrote earlier in this run
+    earlier_keys, owners = _WRITTEN.get(path, (np.array([], dtype='uint64'), np.array([], dtype=object)))
+    if changed.any() and len(earlier_keys):
+        at = pd.Index(earlier_keys).get_indexer(key_hashes[changed])
+        previous = owners[at[at >= 0]]
+        clashes = previous != owner
+        if clashes.any():
+            others = sorted({str(name) for name in previous[clashes]})
+            clashes = clashes.sum()
+            raise Exception(f'{owner} would replace {clashes} rows {", ".join(others)} wrote to {path} in this run '
+                            f'(same {"/".join(keys)}); rename the measures or pull the tables separately')
+    ours = np.isin(earlier_keys, key_hashes[written])
+    _WRITTEN[path] = (np.concatenate([earlier_keys[~ours], key_hashes[written]]),
+                      np.concatenate([owners[~ours], np.full(written.sum(), owner, dtype=object)]))
+
+    append(path, lines[written])
+    index['stale'][live[position[changed]]] = True
+    _INDEX[path] = {'keys': np.concatenate([index['keys'], key_hashes[written]]),
+                    'lines': np.concatenate([index['lines'], line_hashes[written]]),
+                    'stale': np.concatenate([index['stale'], np.zeros(written.sum(), dtype=bool)])}
+
+
+def finish(paths=None):
+    # End of a run: drop the stale rows of every file written to (or of paths) and forget the indexes
+    for path in list(_INDEX if paths is None else paths):
+        index = _INDEX.pop(path, None)
+        _WRITTEN.pop(path, None)
+        if index is not None and index['stale'].any() and os.path.exists(path):
+            rewrite(path, None, [], ~index['stale'])
+
+
+def append(path, lines):
+    # Add rows to the end of an existing file in a single write
+    if not len(lines):
+        return
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+        ends_cleanly = f.read(1) in (b'', b'\n')
+    with open(path, 'a', newline='') as f:
+        f.write(('' if ends_cleanly else '\n') + ''.join(lines))
+
+
+def rewrite(path, header, lines, keep=None):
+    # Write the header (or the current file's kept rows) plus the new rows to a staging file and swap it in
+    staging = path + '.staging'
+    with open(staging, 'w', newline='') as out:
+        if header is not None:
+            out.write(header)
+        else:
+            with open(path, newline='') as f:
+                out.write(next(f))
+                for line, kept in zip(f, keep):
+                    if kept:
+                        out.write(line if line.endswith('\n') else line + '\n')
+        out.write(''.join(lines))
+    os.replace(staging, path)